@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+"""
+Run the aggregator with many publishing nodes as local processes.
+
+Transmissions are generated on a set of channels and each is heard by a random
+few of the nodes, with their own start and duration jitter. Every node is a
+process with a Publisher and its own spool, the aggregator is a subprocess
+(python3 -m scanmon.aggregator). The aggregator is killed part way through and
+started again, so the nodes spool, reconnect and send unacknowledged
+receptions again. At the end the unified database must hold every hearing
+once and every transmission once with exactly the nodes that heard it.
+
+Usage: python3 benchaggregator.py [--nodes N] [--transmissions N] [--seconds S]
+"""
+
+import argparse
+import logging
+import multiprocessing
+import os
+import random
+import signal
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from scanmon.publish import Publisher, encode_record
+
+SPACING = timedelta(seconds=10)     # Between transmissions on a channel, well beyond the join window
+
+def transmissions(count, channels, nodes, rand):
+    """Each node's records, and the nodes that heard each transmission
+    """
+
+    heard = {node: [] for node in range(nodes)}
+    truth = []
+    start = datetime(2026, 3, 1, 8)
+    frequencies = [150000000 + 12500 * i for i in range(channels)]
+    last = {}
+    for _ in range(count):
+        start += timedelta(milliseconds=rand.randint(100, 2000))
+        hertz = rand.choice(frequencies)
+        while start - last.get(hertz, datetime.min) < SPACING:
+            hertz = rand.choice(frequencies)
+        last[hertz] = start
+        duration = rand.randint(500, 30000)
+        listeners = rand.sample(range(nodes), min(nodes, rand.choice((1, 1, 2, 3, 4))))
+        truth.append((hertz, frozenset('node{:02d}'.format(node) for node in listeners)))
+        for node in listeners:
+            when = start + timedelta(milliseconds=rand.randint(-1000, 1000))
+            params = {'starttime': when, 'start_utc_ms': int(when.timestamp() * 1000),
+                      'duration_ms': max(duration + rand.randint(-800, 800), 0),
+                      'system': 'County', 'group': 'Fire', 'channel': 'Ch {}'.format(hertz),
+                      'frequency_tgid': '{:.4f}'.format(hertz / 1e6), 'frequency_hz': hertz}
+            params['duration'] = params['duration_ms'] // 1000
+            heard[node].append(encode_record(params))
+    for records in heard.values():
+        records.sort(key=lambda record: record['start_utc_ms'])
+    return (heard, truth)
+
+def publish(name, address, spoolpath, records, seconds):
+    """A node: put its records over *seconds*, wait for all to be acknowledged
+    """
+
+    logging.basicConfig(level=logging.ERROR)
+    Publisher.RETRY = (0.2, 2.0)
+    publisher = Publisher(name, address, spoolpath)
+    publisher.start()
+    began = time.monotonic()
+    for (count, record) in enumerate(records):
+        delay = began + seconds * count / len(records) - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        publisher.put(record)
+    while publisher.is_alive() and publisher.backlog:
+        time.sleep(0.05)
+    publisher.stop()
+    publisher.join()
+
+def start_aggregator(port, database, window):
+    """The aggregator subprocess, once it accepts connections
+    """
+
+    process = subprocess.Popen([sys.executable, '-m', 'scanmon.aggregator', '--config', os.devnull,
+                                '--listen', '127.0.0.1:{}'.format(port), '--db', database,
+                                '--window', str(window)],
+                               stderr=subprocess.DEVNULL)
+    while True:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return process
+        except OSError:
+            time.sleep(0.05)
+
+def verify(database, heard, truth):
+    """The differences between the unified database and the generated receptions
+    """
+
+    dbconn = sqlite3.connect(database)
+    wrong = []
+    for (node, records) in heard.items():
+        name = 'node{:02d}'.format(node)
+        (count, distinct) = dbconn.execute('SELECT COUNT(*), COUNT(DISTINCT "Seq") FROM "Hearing" WHERE "Node" = ?',
+                                           (name,)).fetchone()
+        if count != len(records) or distinct != count:
+            wrong.append('{}: {} hearings, {} distinct, {} sent'.format(name, count, distinct, len(records)))
+    stored = sorted((hertz, frozenset(nodes.split(','))) for (hertz, nodes) in dbconn.execute(
+        'SELECT r."FrequencyHz", GROUP_CONCAT(h."Node") FROM "Reception" r '
+        'JOIN "Hearing" h ON h."ReceptionId" = r.rowid GROUP BY r.rowid'))
+    expected = sorted(truth, key=lambda item: (item[0], sorted(item[1])))
+    stored.sort(key=lambda item: (item[0], sorted(item[1])))
+    if stored != expected:
+        wrong.append('{} transmissions stored, {} expected, {} differ'.format(
+            len(stored), len(expected), len(set(stored) ^ set(expected))))
+    return wrong
+
+def main():
+    """Parse the arguments and run.
+    """
+
+    parser = argparse.ArgumentParser(description="Aggregator benchmark with local node processes")
+    parser.add_argument("--nodes", type=int, default=24, help="Publishing nodes, default 24")
+    parser.add_argument("--transmissions", type=int, default=20000, help="Transmissions, default 20000")
+    parser.add_argument("--channels", type=int, default=400, help="Channels, default 400")
+    parser.add_argument("--seconds", type=float, default=10.0, help="Seconds the nodes publish over, default 10")
+    parser.add_argument("--outage", type=float, default=2.0, help="Seconds the aggregator is down, default 2")
+    parser.add_argument("--port", type=int, default=25170, help="Local port, default 25170")
+    args = parser.parse_args()
+
+    rand = random.Random(50)
+    (heard, truth) = transmissions(args.transmissions, args.channels, args.nodes, rand)
+    hearings = sum(len(records) for records in heard.values())
+    with tempfile.TemporaryDirectory() as tmp:
+        database = os.path.join(tmp, 'aggregate.db')
+        aggregator = start_aggregator(args.port, database, 3.0)
+        began = time.perf_counter()
+        nodes = [multiprocessing.Process(target=publish, args=(
+            'node{:02d}'.format(node), ('127.0.0.1', args.port), os.path.join(tmp, 'spool{}.db'.format(node)),
+            records, args.seconds)) for (node, records) in heard.items()]
+        for process in nodes:
+            process.start()
+
+        time.sleep(args.seconds / 3)
+        aggregator.kill()
+        aggregator.wait()
+        print("Aggregator killed at {:.1f} s".format(time.perf_counter() - began))
+        time.sleep(args.outage)
+        aggregator = start_aggregator(args.port, database, 3.0)
+        print("Aggregator restarted at {:.1f} s".format(time.perf_counter() - began))
+
+        for process in nodes:
+            process.join()
+        elapsed = time.perf_counter() - began
+        aggregator.send_signal(signal.SIGTERM)
+        aggregator.wait()
+
+        print("{} nodes, {} hearings of {} transmissions delivered in {:.1f} s".format(
+            args.nodes, hearings, len(truth), elapsed))
+        start = time.perf_counter()
+        wrong = verify(database, heard, truth)
+        print("Verified in {:.1f} s: {}".format(time.perf_counter() - start,
+                                                 'ok' if not wrong else '; '.join(wrong[:5])))
+
+        # Throughput: replay every node's spool at once into a fresh aggregator
+        database = os.path.join(tmp, 'burst.db')
+        aggregator = start_aggregator(args.port, database, 3.0)
+        nodes = [multiprocessing.Process(target=publish, args=(
+            'node{:02d}'.format(node), ('127.0.0.1', args.port), os.path.join(tmp, 'burst{}.db'.format(node)),
+            records, 0)) for (node, records) in heard.items()]
+        start = time.perf_counter()
+        for process in nodes:
+            process.start()
+        for process in nodes:
+            process.join()
+        elapsed = time.perf_counter() - start
+        aggregator.send_signal(signal.SIGTERM)
+        aggregator.wait()
+        burst = verify(database, heard, truth)
+        print("Burst: {} hearings from {} nodes in {:.1f} s, {:.0f} receptions/s: {}".format(
+            hearings, args.nodes, elapsed, hearings / elapsed, 'ok' if not burst else '; '.join(burst[:5])))
+        wrong += burst
+    return 0 if not wrong else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
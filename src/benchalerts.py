@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark the compiled alert rules against checking every rule.
+
+Thousands of random rules (literal and glob names, frequency ranges, times of
+day, first seen) are compiled and matched to random Receptions. Every match is
+compared with a plain loop over the rules using fnmatch.
+
+Usage: python3 benchalerts.py [--rules N] [--receptions N]
+"""
+
+import argparse
+import configparser
+import fnmatch
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from scanmon.alerts import AlertRules
+
+WORDS = ('Fire', 'EMS', 'Police', 'PW', 'Dispatch', 'Tac', 'Ops', 'Fireground', 'Mutual', 'Aid')
+
+def name(rand):
+    """A random channel-like name
+    """
+
+    return ' '.join(rand.sample(WORDS, 2)) + ' {}'.format(rand.randrange(10))
+
+def make_config(rules, rand):
+    """A configuration with *rules* random [alert NAME] sections
+    """
+
+    config = configparser.ConfigParser()
+    for count in range(rules):
+        section = {}
+        for field in ('system', 'group', 'channel'):
+            kind = rand.random()
+            if kind < 0.3:
+                section[field] = name(rand)
+            elif kind < 0.6:
+                section[field] = '*{}*'.format(rand.choice(WORDS).lower()[:rand.randint(2, 5)])
+            elif kind < 0.7:
+                section[field] = '{}?*'.format(rand.choice(WORDS))
+        if rand.random() < 0.5:
+            low = rand.uniform(140, 170)
+            section['frequency'] = '{:.4f}-{:.4f}'.format(low, low + rand.choice((0.01, 0.5, 5)))
+        if rand.random() < 0.2:
+            section['time'] = '{:02d}:00-{:02d}:30'.format(rand.randrange(24), rand.randrange(24))
+        if rand.random() < 0.2:
+            section['firstseen'] = str(rand.randint(1, 30))
+        section['minduration'] = str(rand.choice((0, 0, 5)))
+        config['alert rule{}'.format(count)] = section
+    return config
+
+def naive(rules, reception):
+    """The matching rules by checking each one
+    """
+
+    found = []
+    start = reception.starttime
+    minute = start.hour * 60 + start.minute
+    for rule in rules:
+        if not all(not rule.globs[field] or any(fnmatch.fnmatchcase(getattr(reception, field).lower(), pattern)
+                                                for pattern in rule.globs[field])
+                   for field in ('system', 'group', 'channel')):
+            continue
+        if rule.frequencies and (reception.frequency_hz is None or not any(
+                low <= reception.frequency_hz < end for (low, end) in rule.frequencies)):
+            continue
+        if rule.times and not any(start_t <= minute < end_t if start_t < end_t else
+                                  (minute >= start_t or minute < end_t)
+                                  for (start_t, end_t) in rule.times):
+            continue
+        if rule.firstseen is not None and reception.lastseen is not None \
+                and start - reception.lastseen < rule.firstseen:
+            continue
+        found.append(rule)
+    found.sort(key=lambda rule: (rule.minduration_ms, rule.index))
+    return found
+
+def main():
+    """Parse the arguments and run.
+    """
+
+    parser = argparse.ArgumentParser(description="Alert rule benchmark")
+    parser.add_argument("--rules", type=int, default=5000, help="Rules, default 5000")
+    parser.add_argument("--receptions", type=int, default=20000, help="Receptions, default 20000")
+    parser.add_argument("--channels", type=int, default=300, help="Distinct channels, default 300")
+    args = parser.parse_args()
+
+    rand = random.Random(47)
+    config = make_config(args.rules, rand)
+    start = time.perf_counter()
+    rules = AlertRules.from_config(config)
+    compiled = time.perf_counter() - start
+
+    channels = [(name(rand), name(rand), name(rand), rand.randrange(140000000, 170000000, 12500))
+                for _ in range(args.channels)]
+    now = datetime(2026, 1, 1)
+    receptions = []
+    for _ in range(args.receptions):
+        (system, group, channel, hertz) = rand.choice(channels)
+        receptions.append(SimpleNamespace(
+            system=system, group=group, channel=channel,
+            frequency_hz=hertz if rand.random() < 0.8 else None,
+            starttime=now + timedelta(minutes=rand.randrange(1440 * 7)),
+            lastseen=None if rand.random() < 0.1 else now - timedelta(days=rand.uniform(0, 40))))
+
+    start = time.perf_counter()
+    matched = sum(len(rules.match(reception)) for reception in receptions)
+    elapsed = time.perf_counter() - start
+
+    check = receptions[:max(args.receptions // 20, 1)]
+    start = time.perf_counter()
+    wrong = sum(1 for reception in check if rules.match(reception) != naive(rules.rules, reception))
+    naive_rate = len(check) / (time.perf_counter() - start)
+
+    print("{} rules compiled in {:.3f} s".format(len(rules), compiled))
+    print("{} receptions in {:.3f} s, {:.0f}/s compiled, {:.0f}/s checking every rule, {} matches".format(
+        len(receptions), elapsed, len(receptions) / elapsed, naive_rate, matched))
+    print("{} of {} checked receptions differ".format(wrong, len(check)))
+    return 0 if wrong == 0 else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
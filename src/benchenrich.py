@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark the frequency and talkgroup reference.
+
+A reference CSV of exact frequencies, overlapping ranges and talkgroups is
+generated, then compiled, loaded from its compiled index and looked up. A sample
+of the lookups is checked against a linear scan for the narrowest match.
+
+Usage: python3 benchenrich.py [--rows N] [--lookups N]
+"""
+
+import argparse
+import csv
+import os
+import random
+import sys
+import tempfile
+import time
+
+from scanmon.enrich import ReferenceIndex, text_id
+
+SERVICES = ('Law Dispatch', 'Fire Dispatch', 'EMS', 'Public Works', 'Business', 'Aircraft')
+TAGS = ('police', 'fire', 'ems', 'tac', 'dispatch', 'interop', 'county', 'state')
+
+def generate(path, rows, rand):
+    """Write a reference CSV, returns its rows as (low, high, tgid, system, agency, service, tags)
+    """
+
+    reference = []
+    for row in range(rows):
+        service = rand.choice(SERVICES)
+        tags = ';'.join(sorted(rand.sample(TAGS, rand.randint(0, 3))))
+        agency = 'Agency {}'.format(row % (rows // 4 + 1))
+        kind = rand.random()
+        if kind < 0.6:
+            hertz = rand.randrange(25000000, 1300000000, 2500)
+            reference.append((hertz, hertz, None, '', agency, service, tags))
+        elif kind < 0.7:
+            low = rand.randrange(25000000, 1300000000, 2500)
+            high = low + rand.choice((12500, 1000000, 5000000, 20000000))
+            reference.append((low, high, None, '', agency, service, tags))
+        else:
+            system = 'Trunk {}'.format(rand.randrange(20)) if rand.random() < 0.8 else ''
+            reference.append((None, None, rand.randrange(1, 65536), system, agency, service, tags))
+
+    with open(path, 'w', newline='') as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(('frequency', 'high', 'tgid', 'system', 'agency', 'service', 'tags'))
+        for (low, high, tgid, system, agency, service, tags) in reference:
+            mhz = '{:.4f}'.format(low / 1e6) if low is not None else ''
+            top = '{:.4f}'.format(high / 1e6) if high is not None and high != low else ''
+            writer.writerow((mhz, top, tgid if tgid is not None else '', system, agency, service, tags))
+    return reference
+
+def linear(reference, system, hertz, tgid):
+    """The agency id by scanning every row, narrowest range and then the last row winning
+    """
+
+    best = None
+    for (row, (low, high, rtgid, rsystem, agency, _, _)) in enumerate(reference):
+        if hertz is not None and low is not None and low <= hertz <= high:
+            key = (high - low, -row)
+        elif tgid is not None and rtgid == tgid and rsystem in (system.lower(), ''):
+            key = (0 if rsystem else 1, -row)
+        else:
+            continue
+        if best is None or key < best[0]:
+            best = (key, agency)
+    return text_id(best[1]) if best else 0
+
+def main():
+    """Parse the arguments and run.
+    """
+
+    parser = argparse.ArgumentParser(description="Reference lookup benchmark")
+    parser.add_argument("--rows", type=int, default=200000, help="Reference rows, default 200000")
+    parser.add_argument("--lookups", type=int, default=200000, help="Lookups timed, default 200000")
+    parser.add_argument("--check", type=int, default=300, help="Lookups checked by a linear scan")
+    args = parser.parse_args()
+
+    rand = random.Random(46)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'reference.csv')
+        reference = generate(path, args.rows, rand)
+        reference = [(low, high, tgid, system.lower(), agency, service, tags)
+                     for (low, high, tgid, system, agency, service, tags) in reference]
+
+        start = time.perf_counter()
+        index = ReferenceIndex.load(path)
+        compiled = time.perf_counter() - start
+        start = time.perf_counter()
+        index = ReferenceIndex.load(path)
+        cached = time.perf_counter() - start
+        size = os.path.getsize(path + '.idx')
+
+    queries = []
+    for _ in range(args.lookups):
+        if rand.random() < 0.7:
+            queries.append(('', rand.randrange(25000000, 1300000000, 2500), None))
+        else:
+            queries.append(('Trunk {}'.format(rand.randrange(22)), None, rand.randrange(1, 65536)))
+    for (low, _, tgid, system, _, _, _) in rand.sample(reference, min(len(reference), args.lookups // 2)):
+        queries[rand.randrange(len(queries))] = (system, low, tgid)
+
+    start = time.perf_counter()
+    found = sum(1 for (system, hertz, tgid) in queries if index.lookup(system, hertz, tgid)[0])
+    elapsed = time.perf_counter() - start
+
+    wrong = sum(1 for (system, hertz, tgid) in queries[:args.check]
+                if index.lookup(system, hertz, tgid)[0] != linear(reference, system, hertz, tgid))
+
+    print("{} rows, {} segments, {} talkgroups".format(index.entries, len(index.seg_start), len(index.tg_key)))
+    print("compile {:.2f} s, compiled index load {:.3f} s ({} KiB)".format(compiled, cached, size // 1024))
+    print("{} lookups in {:.3f} s, {:.0f}/s, {} found".format(
+        len(queries), elapsed, len(queries) / elapsed, found))
+    print("{} of {} checked lookups differ from a linear scan".format(wrong, min(args.check, len(queries))))
+    return 0 if wrong == 0 else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark the programming download against the emulated scanner memory.
+
+A ScannerMemory is answered by the pty emulator with a turnaround delay on each
+read, like the USB serial link. The memory is downloaded with one command in flight
+and with the full window, then some groups are changed (a channel added, a group
+renamed) and some channels edited in place, and an incremental sync and a full sync
+are run. The cache is checked against the memory after each.
+
+Usage: python3 benchprog.py [--systems N] [--groups N] [--channels N] [--latency S]
+"""
+
+import argparse
+import logging
+import os
+import random
+import sys
+import tempfile
+
+from scanemu import ScannerEmulator, ScannerMemory
+from scanmon.progcache import Downloader, ProgramCache, WINDOW
+from scanmon.scanner import Scanner
+
+def download(device, cache, full, window):
+    """One sync, returns the Downloader
+    """
+
+    scanner = Scanner(device, batch=True)
+    downloader = Downloader(scanner, cache, full=full, window=window)
+    try:
+        downloader.run()
+    finally:
+        scanner.close()
+    return downloader
+
+def check(cache, memory):
+    """Compare the cache with the memory, returns the differences
+    """
+
+    cached = {row['Idx']: row['Name'] for row in cache.dbconn.execute('SELECT "Idx", "Name" FROM "Channel"')}
+    wanted = {index: memory.records[index][1]['name']
+              for cmd in ('CIN', 'TIN') for index in memory.indexes(cmd)}
+    return sum(1 for index in set(cached) | set(wanted) if cached.get(index) != wanted.get(index))
+
+def main():
+    """Parse the arguments and run.
+    """
+
+    parser = argparse.ArgumentParser(description="Programming download benchmark")
+    parser.add_argument("--systems", type=int, default=10, help="Systems, default 10")
+    parser.add_argument("--groups", type=int, default=10, help="Groups per system, default 10")
+    parser.add_argument("--channels", type=int, default=25, help="Channels per group, default 25")
+    parser.add_argument("--latency", type=float, default=0.004,
+                        help="Emulated link turnaround in seconds, default 0.004")
+    parser.add_argument("--window", type=int, default=WINDOW, help="Commands in flight")
+    parser.add_argument("--edits", type=int, default=5,
+                        help="Groups changed and channels edited before the incremental sync")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+    memory = ScannerMemory(args.systems, args.groups, args.channels)
+    emulator = ScannerEmulator(responses=memory.responses(), latency=args.latency)
+    emulator.start()
+    rand = random.Random(5)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        results = []
+        for (name, window, full) in (('window 1', 1, True), ('window {}'.format(args.window), args.window, True)):
+            cache = ProgramCache(os.path.join(tmp, name.replace(' ', '') + '.db'))
+            results.append((name, download(emulator.device, cache, full, window), check(cache, memory)))
+
+        groups = memory.indexes('GIN')
+        for group in rand.sample(groups, args.edits):
+            memory.add_channel(group, 'Added {}'.format(group))
+        for group in rand.sample(groups, args.edits):
+            memory.rename(group, 'Renamed {}'.format(group))
+        for chan in rand.sample(memory.indexes('CIN') + memory.indexes('TIN'), args.edits):
+            memory.rename(chan, 'Edited {}'.format(chan))
+
+        results.append(('incremental', download(emulator.device, cache, False, args.window),
+                        check(cache, memory)))
+        results.append(('full', download(emulator.device, cache, True, args.window), check(cache, memory)))
+        cache.close()
+
+    emulator.stop()
+    for (name, downloader, differences) in results:
+        print("{:12s} {}; {} differ from the memory".format(name, downloader.report(), differences))
+    return 0 if results[-1][2] == 0 else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark scanmon.report over a generated Reception table.
+
+Years of detail rows are written to a temporary database (the Reception table as
+GLGMonitor creates it) with a daily and weekly rhythm, conversations that hop
+between channels, and the report is built from it. A small chunk size run over
+the first rows is checked against a plain Python computation of the same
+results, and the peak memory of the full run is shown.
+
+Usage: python3 benchreport.py [--rows N] [--channels N] [--chunk N]
+"""
+
+import argparse
+import math
+import os
+import random
+import resource
+import sqlite3
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from scanmon import report as scanreport
+
+def generate(path, rows, channels, rand):
+    """Write *rows* Receptions, returns the number written
+    """
+
+    dbconn = sqlite3.connect(path, detect_types=sqlite3.PARSE_DECLTYPES)
+    dbconn.execute("""CREATE TABLE "Reception"
+        ("Starttime" timestamp, "Duration" integer, "System" text, "Group" text, "Channel" text,
+         "Frequency_TGID" text, "DurationMs" integer)""")
+    names = [('System {}'.format(i % 7), 'Group {}'.format(i % 23), 'Channel {}'.format(i))
+             for i in range(channels)]
+    weights = [1.0 / (i + 1) for i in range(channels)]
+    now = datetime(2023, 1, 2)
+    batch = []
+    chan = 0
+    for _ in range(rows):
+        hour = now.hour + now.minute / 60.0
+        busy = 0.3 + math.sin(math.pi * max(min((hour - 6) / 16, 1), 0)) * (0.6 if now.weekday() < 5 else 0.3)
+        now += timedelta(seconds=rand.expovariate(busy / 90.0))
+        if rand.random() > 0.4:
+            chan = rand.choices(range(channels), weights)[0]
+        duration = int(rand.lognormvariate(8.5, 0.8))
+        batch.append((now, duration // 1000) + names[chan] + ('', duration))
+        now += timedelta(milliseconds=duration)
+        if len(batch) >= 100000:
+            dbconn.executemany('INSERT INTO "Reception" VALUES (?, ?, ?, ?, ?, ?, ?)', batch)
+            batch = []
+    dbconn.executemany('INSERT INTO "Reception" VALUES (?, ?, ?, ?, ?, ?, ?)', batch)
+    dbconn.commit()
+    dbconn.close()
+
+def plain(path, limit, gap_ms):
+    """The per channel counts, airtime, heatmap, inter-arrival medians and
+    transitions of the first *limit* rows, row by row
+    """
+
+    dbconn = sqlite3.connect(path, detect_types=sqlite3.PARSE_DECLTYPES)
+    receptions = Counter()
+    airtime = Counter()
+    slots = Counter()
+    last = {}
+    intervals = {}
+    transitions = Counter()
+    previous = None
+    for (start, duration, system, group, channel) in dbconn.execute(
+            'SELECT "Starttime", "DurationMs", "System", "Group", "Channel" FROM "Reception" '
+            'ORDER BY "Starttime" LIMIT ?', (limit,)):
+        key = (system, group, channel)
+        start_ms = round((start - datetime(1970, 1, 1)).total_seconds() * 1000)
+        receptions[key] += 1
+        airtime[key] += duration
+        slots[(start.weekday(), start.hour)] += 1
+        if key in last:
+            intervals.setdefault(key, []).append(start_ms - last[key])
+        last[key] = start_ms
+        if previous is not None and start_ms - previous[1] <= gap_ms:
+            transitions[(previous[0], key)] += 1
+        previous = (key, start_ms + duration)
+    dbconn.close()
+    return (receptions, airtime, slots, intervals, transitions)
+
+def check(path, limit, chunk, gap):
+    """Differences between the report (built in small chunks) and the plain computation
+    """
+
+    dbconn = sqlite3.connect(path)
+    dbconn.execute('CREATE TEMP VIEW "Limited" AS SELECT * FROM main."Reception" ORDER BY "Starttime" LIMIT {}'
+                   .format(limit))
+    dbconn.execute('CREATE TEMP TABLE "Reception" AS SELECT * FROM "Limited"')     # Shadows main
+    report = scanreport.build(dbconn, gap=gap, chunk=chunk)
+    (receptions, airtime, slots, intervals, transitions) = plain(path, limit, int(gap * 1000))
+
+    wrong = []
+    for (chan, key) in enumerate(report.channels):
+        if report.receptions[chan] != receptions[key] or report.airtime[chan] != airtime[key]:
+            wrong.append(('channel', key))
+        ia = np.bincount(report._bins(np.array(intervals.get(key, []), dtype=np.int64)),
+                         minlength=scanreport.IA_BINS)
+        if not np.array_equal(ia, report.ia_channel[chan]):
+            wrong.append(('interarrival', key))
+        for (target_chan, target) in enumerate(report.channels):
+            if report.transitions[chan, target_chan] != transitions[(key, target)]:
+                wrong.append(('transition', key, target))
+    heat = report.slot_receptions.reshape(7, 24)
+    wrong.extend(('slot', slot) for slot in slots if heat[slot] != slots[slot])
+    return (report.rows, wrong)
+
+def main():
+    """Parse the arguments and run.
+    """
+
+    parser = argparse.ArgumentParser(description="Reception report benchmark")
+    parser.add_argument("--rows", type=int, default=2000000, help="Receptions, default 2000000")
+    parser.add_argument("--channels", type=int, default=150, help="Channels, default 150")
+    parser.add_argument("--chunk", type=int, default=scanreport.CHUNK, help="Rows per chunk")
+    parser.add_argument("--check", type=int, default=20000, help="Rows checked row by row")
+    args = parser.parse_args()
+
+    rand = random.Random(49)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'report.db')
+        start = time.perf_counter()
+        generate(path, args.rows, args.channels, rand)
+        print("{} rows generated in {:.1f} s, {} MiB".format(
+            args.rows, time.perf_counter() - start, os.path.getsize(path) >> 20))
+
+        (checked, wrong) = check(path, args.check, 1000, scanreport.GAP)
+        print("{} rows checked in chunks of 1000: {} differences {}".format(checked, len(wrong), wrong[:5]))
+
+        before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        start = time.perf_counter()
+        report = scanreport.build(sqlite3.connect(path), chunk=args.chunk)
+        elapsed = time.perf_counter() - start
+        after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        print("{} rows in {:.1f} s, {:.0f} rows/s, peak RSS {} MiB (+{} MiB)".format(
+            report.rows, elapsed, report.rows / elapsed, after >> 10, (after - before) >> 10))
+        print()
+        print('\n'.join(report.lines(8)))
+    return 0 if not wrong else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""
+Compare run length encoding of a realistic capture by direction and by command.
+
+A raw capture of the monitor's poll is written from the traffic model: each poll
+sends GLG and reads the response, and every *sts-every* polls sends STS and reads
+that too, with a few ms of serial timing jitter. The capture is compressed with
+runs kept per direction and command, and again with the runs per direction only
+as they were at first. Both run files must expand back to the capture exactly
+with ``--jitter 0``.
+
+Usage: python3 benchrle.py [--hours H] [--sts-every N] [--jitter NS]
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+from scanmon.scanner import rle
+from scanmon.scanner.capture import RX, TX, CaptureWriter, read_capture, segments
+from trafficgen import TrafficModel
+
+def write_capture(prefix, hours, sts_every, seed):
+    """Write *hours* of polling to a raw capture, return the record count
+    """
+
+    model = TrafficModel(seed=seed)
+    rand = random.Random(seed)
+    writer = CaptureWriter(prefix)
+    start = model.now
+    anchor = time.monotonic_ns()
+    records = 0
+    polls = 0
+    while model.now < start + hours * 3600:
+        line = model.glg()
+        mono_ns = anchor + int((model.now - start) * 1e9) + rand.randint(0, 3000000)
+        writer.write(TX, b'GLG', mono_ns)
+        records += 1
+        if line is not None:
+            writer.write(RX, line.encode(), mono_ns + rand.randint(4000000, 8000000))
+            records += 1
+        polls += 1
+        if sts_every and polls % sts_every == 0:
+            writer.write(TX, b'STS', mono_ns + 10000000)
+            writer.write(RX, model.sts().encode(), mono_ns + rand.randint(14000000, 20000000))
+            records += 2
+    writer.close()
+    return records
+
+def compress(prefix, runfile, jitter, by_command=True):
+    """Compress the capture, return (seconds, runs, file size)
+    """
+
+    key = rle._key     # pylint: disable=protected-access
+    if not by_command:
+        rle._key = lambda direction, data: (direction,)     # pylint: disable=protected-access
+    try:
+        start = time.perf_counter()
+        rle.compress_capture(prefix, runfile, jitter=jitter)
+        elapsed = time.perf_counter() - start
+    finally:
+        rle._key = key     # pylint: disable=protected-access
+    return (elapsed, len(rle.read_runs(runfile)[2]), os.path.getsize(runfile))
+
+def differences(prefix, runfile):
+    """Records that differ between the raw capture and the expanded run file
+    """
+
+    original = [(r.mono_ns, r.direction, bytes(r.data)) for r in read_capture(prefix)]
+    expanded = [(r.mono_ns, r.direction, bytes(r.data)) for r in rle.expand(runfile)]
+    wrong = sum(1 for (a, b) in zip(original, expanded) if a != b)
+    return wrong + abs(len(original) - len(expanded))
+
+def main():
+    """Parse the arguments and run.
+    """
+
+    parser = argparse.ArgumentParser(description="Run length encoding by direction and by command")
+    parser.add_argument("--hours", type=float, default=2.0, help="Simulated hours, default 2")
+    parser.add_argument("--sts-every", dest='sts_every', type=int, default=1,
+                        help="STS every N polls, default 1 (statuspoll)")
+    parser.add_argument("--jitter", type=int, default=rle.JITTER,
+                        help="Run timing tolerance in ns, default {}".format(rle.JITTER))
+    parser.add_argument("--seed", type=int, default=29, help="Random seed, default 29")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        prefix = os.path.join(tmp, 'capture')
+        records = write_capture(prefix, args.hours, args.sts_every, args.seed)
+        raw = sum(os.path.getsize(name) for name in segments(prefix))
+        print("{} records, {:.0f} KiB raw".format(records, raw / 1024))
+
+        ratios = {}
+        wrong = 0
+        for (name, by_command) in (('direction', False), ('command', True)):
+            runfile = os.path.join(tmp, name + rle.SUFFIX)
+            (elapsed, runs, size) = compress(prefix, runfile, args.jitter, by_command)
+            ratios[name] = raw / size
+            print("Runs by {:9s}: {:7d} runs, {:7.0f} KiB, ratio {:6.1f}, {:.2f} s".format(
+                name, runs, size / 1024, ratios[name], elapsed))
+
+            exact = os.path.join(tmp, name + '.exact' + rle.SUFFIX)
+            compress(prefix, exact, 0, by_command)
+            differ = differences(prefix, exact)
+            wrong += differ
+            print("  jitter 0 round trip: {}".format('exact' if not differ else '{} records differ'.format(differ)))
+
+    # Without STS the two are the same, with it by command must be better
+    improved = ratios['command'] > ratios['direction'] if args.sts_every else \
+        ratios['command'] >= ratios['direction']
+    print("By command is {:.1f} times smaller".format(ratios['command'] / ratios['direction']))
+    return 0 if improved and not wrong else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark the energy squelch: speed against real time and edge accuracy.
+
+A synthetic 16 bit PCM stream (background noise with bursts of noisy tone at
+random times) is fed in recorder sized blocks. GLG times are made by quantizing
+each burst to a 0.5 s poll, then refined from the audio and compared with the
+true edges.
+
+Usage: python3 benchsquelch.py [--seconds S] [--rate HZ]
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from scanmon.recorder import CHUNK
+from scanmon.squelch import EnergySquelch
+
+POLL = 0.5
+
+def synthetic(seconds, rate, seed=41):
+    """PCM bytes and the true (start, end) of each burst
+    """
+
+    rand = np.random.default_rng(seed)
+    samples = rand.normal(0, 60, int(seconds * rate))
+    bursts = []
+    now = 2.0
+    while now < seconds - 10:
+        length = rand.uniform(0.8, 6.0)
+        first = int(now * rate)
+        last = int((now + length) * rate)
+        tone = np.sin(2 * np.pi * 1000 * np.arange(last - first) / rate) * 3000
+        samples[first:last] += tone + rand.normal(0, 800, last - first)
+        bursts.append((first / rate, last / rate))
+        now += length + rand.uniform(1.5, 12.0)
+
+    return (np.clip(samples, -32768, 32767).astype('<i2').tobytes(), bursts)
+
+def main():
+    """Run the benchmark and print the results.
+    """
+
+    parser = argparse.ArgumentParser(description="Energy squelch speed and edge accuracy")
+    parser.add_argument("--seconds", type=float, default=3600.0,
+                        help="Seconds of synthetic audio, default 3600")
+    parser.add_argument("--rate", type=int, default=8000, help="Sample rate in Hz, default 8000")
+    args = parser.parse_args()
+
+    (seconds, rate) = (args.seconds, args.rate)
+    (pcm, bursts) = synthetic(seconds, rate)
+    view = memoryview(pcm)
+    detector = EnergySquelch(rate=rate, history=seconds + 60)
+
+    epoch = 1.7e9
+    start = time.process_time()
+    for offset in range(0, len(pcm), CHUNK):
+        block = view[offset:offset + CHUNK]
+        detector.feed(block, epoch + (offset + len(block)) / 2 / rate)
+    cpu = time.process_time() - start
+
+    errors = []
+    for (first, last) in bursts:
+        glg_start = np.ceil(first / POLL) * POLL
+        glg_end = np.floor(last / POLL) * POLL
+        (rstart, rend) = detector.edges(epoch + glg_start, epoch + glg_end, poll=POLL)
+        errors.append((abs(rstart - epoch - first), abs(rend - epoch - last),
+                       abs(glg_start - first), abs(glg_end - last)))
+
+    errors = np.array(errors) * 1000
+    print("{:.0f}s of {} Hz audio in {:.3f}s CPU: {:.0f}x real time, {:.3f}% of one core".format(
+        seconds, rate, cpu, seconds / cpu, cpu / seconds * 100))
+    print("{} bursts, edge error ms (mean/max): refined start {:.1f}/{:.1f} end {:.1f}/{:.1f}, "
+          "GLG start {:.1f}/{:.1f} end {:.1f}/{:.1f}".format(
+              len(bursts), errors[:, 0].mean(), errors[:, 0].max(), errors[:, 1].mean(),
+              errors[:, 1].max(), errors[:, 2].mean(), errors[:, 2].max(),
+              errors[:, 3].mean(), errors[:, 3].max()))
+
+if __name__ == '__main__':
+    main()
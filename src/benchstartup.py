@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark scanmon startup.
+
+Three measurements, each in a fresh interpreter:
+
+* The slowest imports of ``scanmon.app`` from ``python -X importtime``
+* Wall time of ``python -m scanmon --check-config``
+* Cold start to first GLG poll: scanmon is started on a pty against the scanner
+  emulator and timed until the emulator answers its first GLG command
+
+Usage: python3 benchstartup.py [runs] [top imports]
+"""
+
+import os
+import pty
+import subprocess
+import sys
+import tempfile
+import time
+
+from scanemu import ScannerEmulator
+
+_CONFIG = """[scanmon]
+logfile={tmp}/scanmon.log
+[monitor]
+start=true
+titleupdate=false
+database={tmp}/scanmon.db
+[scanner]
+device={device}
+"""
+
+def import_times(module, top):
+    """The *top* imports with the largest cumulative time, in us.
+    """
+
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import ' + module],
+                            stderr=subprocess.PIPE, universal_newlines=True, check=True)
+    times = []
+    for line in result.stderr.splitlines():
+        fields = line.split('|')
+        if len(fields) == 3 and fields[1].strip().isdigit():
+            times.append((int(fields[1]), fields[2].rstrip()))
+
+    return sorted(times, reverse=True)[:top]
+
+def check_config_time(config):
+    """Seconds for ``--check-config`` to run.
+    """
+
+    start = time.perf_counter()
+    subprocess.run([sys.executable, '-m', 'scanmon', '--check-config', '-C', config],
+                   stdout=subprocess.DEVNULL, check=False)
+    return time.perf_counter() - start
+
+def first_glg_time(emulator, config, timeout=30.0):
+    """Seconds from starting scanmon to the emulator's first GLG command.
+    """
+
+    emulator.first_command.clear()
+    (pid, master) = pty.fork()
+    if pid == 0:
+        os.environ['TERM'] = 'xterm'
+        os.execv(sys.executable, [sys.executable, '-m', 'scanmon', '-C', config])
+
+    start = time.monotonic()
+    try:
+        while 'GLG' not in emulator.first_command and time.monotonic() - start < timeout:
+            try:
+                os.read(master, 65536)      # Drain the screen output
+            except OSError:
+                break
+        return emulator.first_command.get('GLG', float('nan')) - start
+    finally:
+        os.kill(pid, 15)
+        os.waitpid(pid, 0)
+        os.close(master)
+
+def main():
+    """Run the startup benchmarks and print the results.
+    """
+
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    top = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+
+    print("Slowest imports of scanmon.app (cumulative us):")
+    for (usec, name) in import_times('scanmon.app', top):
+        print("{:10d} {}".format(usec, name))
+
+    emulator = ScannerEmulator()
+    emulator.start()
+    with tempfile.TemporaryDirectory() as tmp:
+        config = os.path.join(tmp, 'config.ini')
+        with open(config, 'w') as configfile:
+            configfile.write(_CONFIG.format(tmp=tmp, device=emulator.device))
+
+        checks = sorted(check_config_time(config) for _ in range(runs))
+        print("--check-config: median {:.3f}s min {:.3f}s".format(checks[runs // 2], checks[0]))
+
+        starts = sorted(first_glg_time(emulator, config) for _ in range(runs))
+        print("Start to first GLG: median {:.3f}s min {:.3f}s".format(starts[runs // 2], starts[0]))
+
+    emulator.stop()
+
+if __name__ == '__main__':
+    main()
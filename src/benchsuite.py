@@ -0,0 +1,290 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark suite for the decode, monitor, storage and window hot paths.
+
+Every benchmark runs on a fixed dataset: a synthetic GLG poll stream built from a
+seeded random generator, so it is the same on every run, and optionally a capture
+given with ``--capture``. Each benchmark is run several times and the best and
+median times are kept.
+
+* ``read_scanner``: line framing, decode and dispatch of the synthetic stream
+  delivered in serial sized chunks
+* ``decode_GLG``, ``decode_GLG_idle``, ``decode_STS``, ``decode_unknown``: Response
+* ``monitor_summary``, ``monitor_detail``: GLGMonitor.process over the synthetic
+  stream (idle, receiving, channel changes and timeouts) at each dblevel. There
+  is no ``monitor_both``, dblevel=both writes no Reception rows yet so it would
+  be a second summary run
+* ``monitor_status``: the same at detail with an STS after every GLG, statuspoll
+* ``monitor_chanstats``: detail with the channel activity statistics
+* ``replay_capture``: the same for the ``--capture`` dataset
+* ``scrollwin_append``: ScrollWin.append with the scrollback full (every append evicts)
+
+Results are written as JSON, ``--compare`` prints the change from an earlier file.
+
+Usage: python3 benchsuite.py [--output FILE] [--compare FILE] [--capture PREFIX] [--repeat N]
+"""
+
+import argparse
+import configparser
+import json
+import logging
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from scanemu import ScannerEmulator
+from scanmon.monwin import Monwin
+from scanmon.replay import Replay, capture_lines
+from scanmon.scanner import Scanner
+from scanmon.scanner.formatter import Response
+
+SEED = 996
+POLL = 0.5          # Seconds between GLG polls
+LINES = 20000       # Synthetic stream length
+IDLE = 'GLG,,,,,,,,,,,,'
+GLG = 'GLG,{freq},FM,0,0,{sys},{grp},{chan},1,0,NONE,NONE,NONE'
+ACTIVE = GLG.format(freq='0463.0000', sys='Public Safety', grp='EMS MED Channels', chan='Med 1')
+STS = ('STS,011000,        ????    ,,Fairfield County,,FAPERN VHF      ,, 154.1000 C151.4,,'
+       'S0:12-*5*7*9-   ,,GRP----5-----   ,,1,0,0,0,0,0,5,GREEN,1')
+UNKNOWN = 'XYZ,1,2,3'
+
+def synthetic_stream(lines=LINES, seed=SEED):
+    """A fixed GLG poll stream as (timestamp, line) pairs.
+
+    Quiet spells and transmissions alternate. A transmission stays on one channel
+    or moves to another without a quiet poll between, so every monitor state
+    change is covered.
+    """
+
+    rand = random.Random(seed)
+    channels = [GLG.format(freq='{:09.4f}'.format(150 + i * 0.0125),
+                           sys='System {}'.format(i % 4),
+                           grp='Group {}'.format(i % 12),
+                           chan='Channel {}'.format(i))
+                for i in range(60)]
+
+    stream = []
+    now = 1.6e9
+    while len(stream) < lines:
+        for _ in range(rand.randint(1, 40)):
+            stream.append((now, IDLE))
+            now += POLL
+        for _ in range(rand.randint(1, 3)):
+            line = rand.choice(channels)
+            for _ in range(rand.randint(1, 30)):
+                stream.append((now, line))
+                now += POLL
+
+    return stream[:lines]
+
+def timed(func, repeat):
+    """Best and median seconds of *repeat* calls of *func*.
+    """
+
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return (min(times), statistics.median(times))
+
+class _ChunkSerial(object):
+    """Stands in for the serial port, hands out a byte stream in fixed chunks.
+    """
+
+    def __init__(self, data, chunk=64):
+        self.chunks = [data[i:i + chunk] for i in range(0, len(data), chunk)]
+        self.index = 0
+
+    def inWaiting(self):    # pylint: disable=invalid-name
+        """Bytes in the next chunk
+        """
+
+        return len(self.chunks[self.index]) if self.index < len(self.chunks) else 0
+
+    def read(self, size):
+        """The next chunk
+        """
+
+        del size
+        self.index += 1
+        return self.chunks[self.index - 1]
+
+def bench_read_scanner(stream, repeat):
+    """Frame, decode and dispatch the stream through Scanner.read_scanner.
+    """
+
+    data = ''.join(line + '\r' for (_, line) in stream).encode('ascii')
+    emulator = ScannerEmulator()
+    emulator.start()
+    scanner = Scanner(emulator.device)
+    port = scanner._serscanner     # pylint: disable=protected-access
+
+    def run():
+        scanner._serscanner = _ChunkSerial(data)     # pylint: disable=protected-access
+        while scanner._serscanner.inWaiting():      # pylint: disable=protected-access
+            scanner.read_scanner()
+
+    try:
+        return (len(stream), timed(run, repeat))
+    finally:
+        scanner._serscanner = port     # pylint: disable=protected-access
+        scanner.close()
+        emulator.stop()
+
+def bench_decode(line, count, repeat):
+    """Decode one line *count* times.
+    """
+
+    def run():
+        for _ in range(count):
+            Response(line)
+
+    return (count, timed(run, repeat))
+
+def bench_monitor(stream, dblevel, repeat, polls=None, **options):
+    """Run the stream through a GLGMonitor writing to a new database each time.
+
+    Args:
+        polls (int): Operations counted, default the stream length
+        options: More [monitor] options
+    """
+
+    config = configparser.ConfigParser()
+    receptions = []
+
+    def run():
+        with tempfile.TemporaryDirectory() as tmp:
+            config['monitor'] = dict({'database': os.path.join(tmp, 'bench.db'),
+                                      'dblevel': dblevel,
+                                      'titleupdate': 'false'}, **options)
+            replay = Replay(config['monitor'])
+            replay.run(stream)
+            receptions.append(replay.monitor.reception_count)
+
+    result = timed(run, repeat)
+    return (polls or len(stream), result, {'receptions': receptions[-1]})
+
+def bench_scrollwin(count, repeat, scrollback=300):
+    """Append *count* lines to a full ScrollWin.
+    """
+
+    def run():
+        win = Monwin.ScrollWin(title='bench', s_max=scrollback)
+        for i in range(scrollback):
+            win.append(('NORM', 'fill {}'.format(i)))
+        for i in range(count):
+            win.append(('NORM', 'line {}'.format(i)))
+
+    return (count, timed(run, repeat))
+
+def git_commit():
+    """The current commit id or None
+    """
+
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], stdout=subprocess.PIPE,
+                              stderr=subprocess.DEVNULL, universal_newlines=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_suite(args):
+    """Run every benchmark.
+
+    Returns:
+        The results dict written as JSON
+    """
+
+    stream = synthetic_stream()
+    benches = [('read_scanner', lambda: bench_read_scanner(stream, args.repeat)),
+               ('decode_GLG', lambda: bench_decode(ACTIVE, 20000, args.repeat)),
+               ('decode_GLG_idle', lambda: bench_decode(IDLE, 20000, args.repeat)),
+               ('decode_STS', lambda: bench_decode(STS, 20000, args.repeat)),
+               ('decode_unknown', lambda: bench_decode(UNKNOWN, 20000, args.repeat))]
+    for dblevel in ('summary', 'detail'):
+        benches.append(('monitor_' + dblevel,
+                        lambda dblevel=dblevel: bench_monitor(stream, dblevel, args.repeat)))
+    status_stream = [pair for (when, line) in stream for pair in ((when, line), (when, STS))]
+    benches.append(('monitor_status',
+                    lambda: bench_monitor(status_stream, 'detail', args.repeat, polls=len(stream),
+                                          statuspoll='true', signalpoll='sts')))
+    benches.append(('monitor_chanstats',
+                    lambda: bench_monitor(stream, 'detail', args.repeat, chanstats='true')))
+    if args.capture:
+        captured = list(capture_lines(args.capture))
+        benches.append(('replay_capture', lambda: bench_monitor(captured, 'detail', args.repeat)))
+    benches.append(('scrollwin_append', lambda: bench_scrollwin(20000, args.repeat)))
+
+    results = {}
+    for (name, bench) in benches:
+        if args.only and name not in args.only:
+            continue
+        outcome = bench()
+        (ops, (best, median)) = outcome[:2]
+        results[name] = {'ops': ops,
+                         'best_s': best,
+                         'median_s': median,
+                         'ops_per_s': ops / best if best else None}
+        if len(outcome) > 2:
+            results[name].update(outcome[2])
+        print("{:20s} {:10d} ops {:10.4f}s best {:12.1f} ops/s".format(
+            name, ops, best, results[name]['ops_per_s']))
+
+    return {'commit': git_commit(),
+            'time': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'repeat': args.repeat,
+            'capture': args.capture,
+            'results': results}
+
+def compare(old, new):
+    """Print the change in ops/s from an earlier result file.
+    """
+
+    print("Compared with {} ({}):".format(old.get('commit'), old.get('time')))
+    for (name, result) in new['results'].items():
+        before = old['results'].get(name)
+        if before and before.get('ops_per_s') and result['ops_per_s']:
+            print("{:20s} {:+7.1f}%".format(
+                name, (result['ops_per_s'] / before['ops_per_s'] - 1) * 100))
+        else:
+            print("{:20s} {:>8s}".format(name, 'new'))
+
+def main():
+    """Parse the arguments, run the suite and write the results.
+    """
+
+    parser = argparse.ArgumentParser(description="Scanmon benchmark suite")
+    parser.add_argument("--output", "-o", default=None,
+                        help="JSON result file, default bench-<commit>.json")
+    parser.add_argument("--compare", default=None,
+                        help="Earlier JSON result file to compare with")
+    parser.add_argument("--capture", default=None,
+                        help="Capture path prefix or run file (.srle) to replay as well")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="Runs of each benchmark, default 5")
+    parser.add_argument("only", nargs='*',
+                        help="Run only these benchmarks")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+    result = run_suite(args)
+    output = args.output or 'bench-{}.json'.format(result['commit'] or 'unknown')
+    with open(output, 'w') as outfile:
+        json.dump(result, outfile, indent=2)
+    print("Results in", output)
+
+    if args.compare:
+        with open(args.compare) as infile:
+            compare(json.load(infile), result)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark the command write path against the scanner emulator.
+
+Compares the original per command write (payload, '\\\\r', drain) with the
+batched write (all queued commands in one ``os.write``) and prints commands per second.
+
+Usage: python3 benchwrite.py [commands] [batch size]
+"""
+
+import select
+import sys
+import time
+
+from scanemu import ScannerEmulator
+from scanmon.scanner import Scanner, Command, _NEWLINE
+
+def legacy_send(scanner, command):
+    """The write path as it was before batching, three calls per command.
+
+    Note that flushOutput discards unsent output on a pty so the drain (tcdrain)
+    that it was meant to be is used here instead.
+    """
+
+    scanner.watch_command(command)
+    with scanner.iolock:
+        scanner._serscanner.write(bytes(command.cmdstring, 'UTF-8', 'ignore'))   # pylint: disable=protected-access
+        scanner._serscanner.write(_NEWLINE)                                       # pylint: disable=protected-access
+        scanner._serscanner.flush()                                               # pylint: disable=protected-access
+
+def batched_send(scanner, command):
+    """Queue only, flushed once per batch.
+    """
+
+    scanner.send_command(command)
+
+def run(device, send, commands, batch_size, flush=False):
+    """Send *commands* GLG commands in groups of *batch_size*, wait for every response.
+
+    Returns:
+        float: Elapsed seconds
+    """
+
+    scanner = Scanner(device, batch=True)
+    received = [0]
+
+    def count(cmd, resp):
+        """Count every response"""
+        del cmd, resp
+        received[0] += 1
+        return False
+
+    scanner.watch_command(Command('*', callback=count))
+    sent = 0
+    start = time.perf_counter()
+
+    while received[0] < commands:
+        if sent - received[0] < batch_size and sent < commands:
+            for _ in range(min(batch_size, commands - sent)):
+                send(scanner, Command('GLG'))
+                sent += 1
+            if flush:
+                scanner.flush_commands()
+
+        (ready, _, _) = select.select([scanner.fileno], [], [], 1.0)
+        if ready:
+            scanner.read_scanner()
+        elif flush:
+            scanner.flush_commands()
+
+    elapsed = time.perf_counter() - start
+    scanner.close()
+    return elapsed
+
+def main():
+    """Run both write paths and report.
+    """
+
+    commands = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    batch_size = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+
+    emulator = ScannerEmulator()
+    emulator.start()
+
+    try:
+        for (name, send, flush) in (('legacy', legacy_send, False),
+                                    ('batched', batched_send, True)):
+            elapsed = run(emulator.device, send, commands, batch_size, flush)
+            print("{:8s} {:6d} commands, batch {:3d}: {:7.3f}s {:9.1f} cmd/s".format(
+                name, commands, batch_size, elapsed, commands / elapsed))
+    finally:
+        emulator.stop()
+
+if __name__ == '__main__':
+    main()
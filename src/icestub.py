@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""
+A stand-in for the icecast server: streams a file over HTTP in real time.
+
+Every GET gets the file, looped, paced at the byte rate like a live mount, so
+the clip recorder can be tried without darkice and icecast. Title updates
+(``/admin/metadata``) are accepted and ignored.
+
+Usage: python3 icestub.py FILE [--port 8000] [--byterate 16000]
+"""
+
+import argparse
+import http.server
+import time
+
+class StreamHandler(http.server.BaseHTTPRequestHandler):
+    """Stream the file to each client.
+    """
+
+    filename = None
+    byterate = 16000
+    chunk = 1024
+
+    def do_GET(self):   # pylint: disable=invalid-name
+        """Stream the file, or accept a title update
+        """
+
+        if self.path.startswith('/admin/'):
+            self.send_response(200)
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'audio/mpeg')
+        self.end_headers()
+
+        with open(self.filename, 'rb') as audio:
+            started = time.monotonic()
+            sent = 0
+            while True:
+                data = audio.read(self.chunk)
+                if not data:
+                    audio.seek(0)
+                    continue
+                try:
+                    self.wfile.write(data)
+                except OSError:
+                    return      # Client went away
+                sent += len(data)
+                delay = started + sent / self.byterate - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        """Quiet
+        """
+
+def main():
+    """Parse the arguments and serve.
+    """
+
+    parser = argparse.ArgumentParser(description="Stream a file like an icecast mount")
+    parser.add_argument("file", help="Audio file to stream")
+    parser.add_argument("--port", type=int, default=8000, help="Port, default 8000")
+    parser.add_argument("--byterate", type=int, default=16000,
+                        help="Bytes per second, default 16000 (128 kbit/s)")
+    args = parser.parse_args()
+
+    StreamHandler.filename = args.file
+    StreamHandler.byterate = args.byterate
+    server = http.server.ThreadingHTTPServer(('', args.port), StreamHandler)
+    print("Streaming {} on port {}".format(args.file, args.port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+"""
+A pty based stand-in for the BCD996XT scanner.
+
+Opens a pseudo terminal and answers scanner commands on the master side. The
+slave side name (``device``) can be given to Scanner (or ``scanmon -s``) in place
+of ``/dev/ttyUSB0``.
+
+ScannerMemory adds a programmed memory (systems, groups and channels) that
+answers the program mode commands.
+
+Run directly to leave an emulator running, the device name is printed.
+"""
+
+import os
+import random
+import select
+import threading
+import time
+
+_NEWLINE = b'\r'
+
+# Canned responses, anything else is answered with "CMD,OK".
+# A response may be a function, it is called with the command's arguments
+# (the text after the first comma) for each command.
+RESPONSES = {
+    'GLG': 'GLG,0463.0000,FM,0,0,Public Safety,EMS MED Channels,Med 1,1,0,NONE,NONE,NONE',
+    'STS': 'STS,011000,        ????    ,,Fairfield County,,FAPERN VHF      ,, 154.1000 C151.4,,'
+           'S0:12-*5*7*9-   ,,GRP----5-----   ,,1,0,0,0,0,0,5,GREEN,1',
+    'MDL': 'MDL,BCD996XT',
+    'VER': 'VER,Version 1.04.00',
+    'VOL': 'VOL,OK',
+}
+
+class ScannerEmulator(threading.Thread):
+    """Answer scanner commands on a pty.
+
+    Args:
+        responses (dict): Optional. Response for each command, default RESPONSES.
+        latency (float): Optional. Seconds before the responses to each read are
+            written, like the turnaround of the USB serial link. Default 0.
+    """
+
+    def __init__(self, responses=None, latency=0.0):
+        super().__init__()
+        self.responses = RESPONSES if responses is None else responses
+        self.latency = latency
+        (self._master, slave) = os.openpty()
+        self.device = os.ttyname(slave)
+        self._slave = slave     # Held open so the pty stays up between connections
+        self.daemon = True
+        self.name = "**ScannerEmulator**"
+        self.command_count = 0
+        self.read_count = 0
+        self.first_command = {}     # Command to time.monotonic() it was first seen
+        self._running = False
+
+    def respond(self, line):
+        """Build the response for one command line (bytes without the '\\\\r').
+        """
+
+        (cmd, _, args) = line.decode('ascii', 'replace').partition(',')
+        self.first_command.setdefault(cmd, time.monotonic())
+        response = self.responses.get(cmd, cmd + ',OK')
+        if callable(response):
+            response = response(args)
+        return response.encode('ascii') + _NEWLINE
+
+    def run(self):
+        """Read commands and write the responses until stopped.
+        """
+
+        self._running = True
+        buffer = b''
+
+        while self._running:
+            (ready, _, _) = select.select([self._master], [], [], 0.1)
+            if not ready:
+                continue
+
+            try:
+                data = os.read(self._master, 4096)
+            except OSError:
+                break
+
+            self.read_count += 1
+            buffer += data
+            out = []
+            while _NEWLINE in buffer:
+                (line, _, buffer) = buffer.partition(_NEWLINE)
+                if line:
+                    self.command_count += 1
+                    out.append(self.respond(line))
+
+            if out:
+                if self.latency:
+                    time.sleep(self.latency)
+                os.write(self._master, b''.join(out))
+
+    def stop(self):
+        """Stop answering and close the pty.
+        """
+
+        self._running = False
+        self.join()
+        os.close(self._master)
+        os.close(self._slave)
+
+class ScannerMemory(object):
+    """A programmed scanner memory answering PRG, EPG, SIH, SIN, GIN, CIN and TIN.
+
+    Systems, groups and channels are linked lists through memory indexes spread
+    over the memory, as in the scanner. Every other system is trunked, its groups
+    hold talkgroups.
+
+    Args:
+        systems (int): Systems
+        groups (int): Groups in each system
+        channels (int): Channels or talkgroups in each group
+        seed (int): Random seed for the memory layout
+    """
+
+    def __init__(self, systems=10, groups=10, channels=25, seed=1):
+        self.rand = random.Random(seed)
+        self._free = list(range(1, 1 + 2 * systems * (1 + groups * (1 + channels))))
+        self.rand.shuffle(self._free)
+        self.records = {}       # Index to [cmd, fields dict]
+        self.system_head = -1
+        self.program_mode = False
+        last = -1
+        for sysno in range(systems):
+            index = self._free.pop()
+            trunked = sysno % 2 == 1
+            self.records[index] = ['SIN', {
+                'type': 'MOT' if trunked else 'CNV', 'name': 'System {}'.format(sysno),
+                'rev': last, 'fwd': -1, 'head': -1, 'tail': -1}]
+            self._link(last, index, 'head')
+            last = index
+            for grpno in range(groups):
+                group = self.add_group(index, 'Group {}-{}'.format(sysno, grpno))
+                for chno in range(channels):
+                    self.add_channel(group, 'Chan {}-{}-{}'.format(sysno, grpno, chno))
+
+    def _link(self, last, index, headname, owner=None):
+        """Append *index* after *last*, or make it the head of the owner's list
+        """
+
+        if last == -1:
+            if owner is None:
+                self.system_head = index
+            else:
+                self.records[owner][1][headname] = index
+        else:
+            self.records[last][1]['fwd'] = index
+
+    def add_group(self, system, name):
+        """Append a group to a system, returns its index
+        """
+
+        index = self._free.pop()
+        sysrec = self.records[system][1]
+        self.records[index] = ['GIN', {
+            'type': 'T' if sysrec['type'] != 'CNV' else 'C', 'name': name, 'sys': system,
+            'rev': sysrec['tail'], 'fwd': -1, 'head': -1, 'tail': -1}]
+        self._link(sysrec['tail'], index, 'head', system)
+        sysrec['tail'] = index
+        return index
+
+    def add_channel(self, group, name):
+        """Append a channel or talkgroup to a group, returns its index
+        """
+
+        index = self._free.pop()
+        grprec = self.records[group][1]
+        trunked = grprec['type'] == 'T'
+        self.records[index] = ['TIN' if trunked else 'CIN', {
+            'name': name, 'sys': grprec['sys'], 'grp': group,
+            'frq': str(self.rand.randint(1000, 65000)) if trunked else
+                   '{:08d}'.format(self.rand.choice((1500000, 4500000, 8510000)) +
+                                   self.rand.randrange(0, 20000, 125)),
+            'rev': grprec['tail'], 'fwd': -1}]
+        self._link(grprec['tail'], index, 'head', group)
+        grprec['tail'] = index
+        return index
+
+    def rename(self, index, name):
+        """Change the name of a record, as editing a channel does
+        """
+
+        self.records[index][1]['name'] = name
+
+    def indexes(self, cmd):
+        """Indexes of the records of one kind
+        """
+
+        return [index for (index, (kind, _)) in self.records.items() if kind == cmd]
+
+    def _record(self, cmd, args):
+        """Answer SIN, GIN, CIN or TIN
+        """
+
+        if not self.program_mode:
+            return cmd + ',NG'
+        try:
+            (kind, rec) = self.records[int(args)]
+        except (KeyError, ValueError):
+            return cmd + ',NG'
+        if kind != cmd:
+            return cmd + ',NG'
+
+        if kind == 'SIN':
+            return ('SIN,{type},{name},.,0,0,2,,,,,,{rev},{fwd},{head},{tail},1,.,,,,,,NONE,0,0,0,0,'
+                    .format(**rec))
+        if kind == 'GIN':
+            return 'GIN,{type},{name},.,0,{rev},{fwd},{sys},{head},{tail},1,,,,'.format(**rec)
+        if kind == 'CIN':
+            return ('CIN,{name},{frq},AUTO,0,0,0,0,0,0,0,{rev},{fwd},{sys},{grp},,0,NONE,NONE,OFF,0,0'
+                    .format(**rec))
+        return 'TIN,{name},{frq},0,0,0,0,{rev},{fwd},{sys},{grp},,0,NONE,OFF,0,0'.format(**rec)
+
+    def _mode(self, cmd, on):
+        """Enter or leave program mode
+        """
+
+        self.program_mode = on
+        return cmd + ',OK'
+
+    def responses(self, base=None):
+        """The emulator responses, *base* (default RESPONSES) with the memory commands
+        """
+
+        responses = dict(RESPONSES if base is None else base)
+        responses['PRG'] = lambda _: self._mode('PRG', True)
+        responses['EPG'] = lambda _: self._mode('EPG', False)
+        responses['SIH'] = lambda _: 'SIH,{}'.format(self.system_head) if self.program_mode else 'SIH,NG'
+        for cmd in ('SIN', 'GIN', 'CIN', 'TIN'):
+            responses[cmd] = lambda args, cmd=cmd: self._record(cmd, args)
+        return responses
+
+if __name__ == '__main__':
+    EMULATOR = ScannerEmulator()
+    EMULATOR.start()
+    print("Scanner emulator on:", EMULATOR.device)
+    try:
+        EMULATOR.join()
+    except KeyboardInterrupt:
+        print("\nCommands answered:", EMULATOR.command_count)
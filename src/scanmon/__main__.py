@@ -5,7 +5,9 @@ Scanmon __main__ routine. Runs the Scanmon system.
 """
 
 import argparse
-from scanmon import Scanmon
+import sys
+
+from scanmon.config import merge_config, check_config
 
 _COLORHELP = "{} text color, default={}"
 
@@ -23,6 +25,14 @@ def main():
                         help="System configuration file")
     # No mapping for config
 
+    parser.add_argument("--check-config",
+                        dest='check_config',
+                        required=False,
+                        action='store_true',
+                        default=False,
+                        help="Check the configuration and exit")
+    # No mapping for check-config
+
     _arg = 'logfile'
     parser.add_argument("--" + _arg,
                         dest=_arg,
@@ -42,6 +52,14 @@ def main():
                         "The first valid device will be used.")
     argmap[_arg] = ('scanner', 'device')
 
+    _arg = 'capture'
+    parser.add_argument("--" + _arg,
+                        dest=_arg,
+                        required=False,
+                        default=argparse.SUPPRESS,
+                        help="Path prefix for raw serial capture files")
+    argmap[_arg] = ('scanner', 'capture')
+
     _arg = 'debug'
     parser.add_argument("--" + _arg, "-d",
                         dest=_arg,
@@ -51,6 +69,15 @@ def main():
                         help="Debugging flag, default False")
     argmap[_arg] = ('scanmon', 'debug')
 
+    _arg = 'logring'
+    parser.add_argument("--" + _arg,
+                        dest=_arg,
+                        required=False,
+                        type=int,
+                        default=argparse.SUPPRESS,
+                        help="Recent log records kept for dumps, 0 to log debug to the file")
+    argmap[_arg] = ('scanmon', 'logring')
+
     _arg = 'monitor'
     parser.add_argument("--" + _arg, "-M",
                         dest=_arg,
@@ -100,6 +127,24 @@ def main():
                         help="How display lines with the focus are highlighted, default=STANDOUT")
     argmap[_arg] = ('window', 'focus')
 
+    _arg = 'scrollback'
+    parser.add_argument("--" + _arg,
+                        dest=_arg,
+                        required=False,
+                        default=argparse.SUPPRESS,
+                        type=int,
+                        help="Lines kept in each scrolling window, default=300")
+    argmap[_arg] = ('window', 'scrollback')
+
+    _arg = 'fps'
+    parser.add_argument("--" + _arg,
+                        dest=_arg,
+                        required=False,
+                        default=argparse.SUPPRESS,
+                        type=float,
+                        help="Screen redraw limit in frames per second, default=10")
+    argmap[_arg] = ('window', 'fps')
+
     _arg = 'database'
     parser.add_argument("--" + _arg, "--db",
                         dest=_arg,
@@ -125,6 +170,65 @@ def main():
                         help="Idle timeout for receptions")
     argmap[_arg] = ('monitor', 'timeout')
 
+    _arg = 'signalpoll'
+    parser.add_argument("--" + _arg,
+                        dest=_arg,
+                        required=False,
+                        default=argparse.SUPPRESS,
+                        choices=('off', 'pwr', 'sts'),
+                        help="Signal strength poll while receiving")
+    argmap[_arg] = ('monitor', 'signalpoll')
+
+    _arg = 'statuspoll'
+    parser.add_argument("--" + _arg,
+                        dest=_arg,
+                        required=False,
+                        default=argparse.SUPPRESS,
+                        action='store_true',
+                        help="Poll STS with every GLG")
+    argmap[_arg] = ('monitor', 'statuspoll')
+
+    _arg = 'reference'
+    parser.add_argument("--" + _arg,
+                        dest=_arg,
+                        required=False,
+                        default=argparse.SUPPRESS,
+                        help="Frequency and talkgroup reference CSV")
+    argmap[_arg] = ('monitor', 'reference')
+
+    _arg = 'chanstats'
+    parser.add_argument("--" + _arg,
+                        dest=_arg,
+                        required=False,
+                        default=argparse.SUPPRESS,
+                        action='store_true',
+                        help="Keep channel activity statistics and report anomalies")
+    argmap[_arg] = ('monitor', 'chanstats')
+
+    _arg = 'publish'
+    parser.add_argument("--" + _arg,
+                        dest=_arg,
+                        required=False,
+                        default=argparse.SUPPRESS,
+                        help="Publish receptions to the aggregator at HOST:PORT")
+    argmap[_arg] = ('monitor', 'publish')
+
+    _arg = 'node'
+    parser.add_argument("--" + _arg,
+                        dest=_arg,
+                        required=False,
+                        default=argparse.SUPPRESS,
+                        help="This monitor's name for the aggregator")
+    argmap[_arg] = ('monitor', 'node')
+
+    _arg = 'clipsource'
+    parser.add_argument("--" + _arg,
+                        dest=_arg,
+                        required=False,
+                        default=argparse.SUPPRESS,
+                        help="Audio stream URL, file or pipe to cut reception clips from")
+    argmap[_arg] = ('monitor', 'clipsource')
+
     _arg = 'titleupdate'
     parser.add_argument("--" + _arg, "-T",
                         dest=_arg,
@@ -184,6 +288,16 @@ def main():
 
     args = parser.parse_args()
 
+    if args.check_config:
+        problems = check_config(merge_config(args, argmap))
+        for problem in problems:
+            print(problem)
+        print("{}: {}".format(args.config, "{} problem(s)".format(len(problems)) if problems else "OK"))
+        sys.exit(1 if problems else 0)
+
+    # Only now load the display, scanner and monitor
+    from scanmon.app import Scanmon
+
     scanner = Scanmon(args, argmap)
     scanner.run()
 
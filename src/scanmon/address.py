@@ -0,0 +1,31 @@
+"""Address - HOST:PORT of the reception aggregator
+
+Shared by :mod:`scanmon.publish`, :mod:`scanmon.aggregator` and the
+configuration check, which must stay quick to import.
+
+`Source <src/scanmon.address.html>`__
+"""
+
+PORT = 5170         # Default aggregator port
+
+def parse_address(text, default_host='localhost'):
+    """Split HOST:PORT, either part can be left out.
+
+    Args:
+        text (str): The address
+        default_host (str): The host when only :PORT or PORT is given
+
+    Returns:
+        (host, port)
+
+    Raises:
+        ValueError: The port is not a number or out of range
+    """
+
+    (host, colon, port) = text.strip().rpartition(':')
+    if not colon:
+        (host, port) = (port, '') if not port.isdigit() else ('', port)
+    port = int(port) if port else PORT
+    if not 0 < port < 65536:
+        raise ValueError("port {} out of range".format(port))
+    return (host.strip('[]') or default_host, port)
@@ -0,0 +1,472 @@
+"""Aggregator - Merge the Receptions published by many monitors
+
+Monitors with ``publish=HOST:PORT`` stream their completed Receptions here, see
+:mod:`scanmon.publish`. Each node connection has a reader thread, and one
+writer owns the unified database: it commits the receptions in batches,
+records the last sequence number of each node with them and then acknowledges
+them, so a reception sent again after a reconnect is recognized and dropped.
+
+The same transmission heard by several nodes is stored once. Receptions join
+when they are on the same channel (frequency, talkgroup or, failing those, the
+System-Group-Channel names) from different nodes and start within the join
+window of each other. Recent transmissions are joined in memory, spooled
+receptions arriving late are joined through the database index.
+
+The unified database has the monitor's Reception table (so ``scanmon-report``
+reads it) with the first node, the number of nodes that heard it and the
+channel key added, and a Hearing table with each node's reception of it.
+
+`Source <src/scanmon.aggregator.html>`__
+"""
+
+import argparse
+import configparser
+import json
+import logging
+import queue
+import signal
+import socket
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime
+
+from scanmon.address import parse_address, PORT
+from scanmon.publish import LineReader, decode_record
+
+WINDOW = 3.0        # Seconds between the starts of one transmission heard by two nodes
+HORIZON = 600.0     # Seconds of transmissions kept in memory for the join
+BATCH = 1000        # Receptions per commit
+BACKLOG = 20000     # Receptions queued for the writer before the readers wait
+STATUS = 60.0       # Seconds between status log lines
+
+def channel_key(params):
+    """The channel a Reception is joined on
+    """
+
+    if params['frequency_hz'] is not None:
+        return 'F{}'.format(params['frequency_hz'])
+    if params['tgid'] is not None:
+        return 'T{}/{}'.format((params['system'] or '').lower(), params['tgid'])
+    return 'N{}/{}/{}'.format(params['system'], params['group'], params['channel']).lower()
+
+class Transmission(object):
+    """A stored Reception that later hearings can join.
+    """
+
+    __slots__ = ('rowid', 'start_ms', 'end_ms', 'nodes')
+
+    def __init__(self, rowid, start_ms, end_ms, nodes):
+        self.rowid = rowid
+        self.start_ms = start_ms
+        self.end_ms = end_ms
+        self.nodes = nodes
+
+class NodeConnection(threading.Thread):
+    """Reads one node's stream and queues it for the writer.
+
+    Args:
+        aggregator (Aggregator): The writer
+        sock (socket.socket): The accepted connection
+        peer (str): The peer address, for the log
+    """
+
+    def __init__(self, aggregator, sock, peer):
+        super().__init__()
+        self.__logger = logging.getLogger(__name__).getChild(type(self).__name__)
+        self.aggregator = aggregator
+        self.sock = sock
+        self.peer = peer
+        self.node = None
+        self.daemon = True
+        self.name = "**Node {}**".format(peer)
+        self._lock = threading.Lock()
+
+    def run(self):
+        """Queue the hello and then each reception until the connection closes.
+        """
+
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        reader = LineReader(self.sock)
+        try:
+            while True:
+                for message in reader.read():
+                    if self.node is None:
+                        self.node = str(message['hello'])
+                        self.name = "**Node {}**".format(self.node)
+                        self.aggregator.put(('hello', self, self.node, str(message['epoch'])))
+                    else:
+                        self.aggregator.put(('reception', self, int(message['seq']), message['reception']))
+        except (ConnectionError, OSError) as err:
+            self.__logger.info("%s (%s) disconnected: %s", self.node, self.peer, err)
+        except (ValueError, KeyError, TypeError) as err:
+            self.__logger.error("%s (%s) protocol error: %s", self.node, self.peer, err)
+        self.close()
+        if self.node is not None:
+            self.aggregator.put(('closed', self))
+
+    def send(self, message):
+        """Send a message, a failure closes the connection.
+        """
+
+        try:
+            with self._lock:
+                self.sock.sendall(json.dumps(message).encode() + b'\n')
+        except OSError as err:
+            self.__logger.info("%s (%s) send failed: %s", self.node, self.peer, err)
+            self.close()
+
+    def close(self):
+        """Close the connection, the reader stops.
+        """
+
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+
+class Aggregator(object):
+    """Writes the merged Receptions of all nodes to the unified database.
+
+    Args:
+        database (str): The unified database
+        window (float): Join window in seconds
+    """
+
+    def __init__(self, database, window=WINDOW):
+        self.__logger = logging.getLogger(__name__).getChild(type(self).__name__)
+        self.database = database
+        self.window_ms = int(window * 1000)
+        self.horizon_ms = int(HORIZON * 1000)
+        self._queue = queue.Queue(BACKLOG)
+        self._listener = None
+        self._recent = {}       # Channel key: [Transmission], joined in memory
+        self._newest = 0        # Latest start, the memory horizon follows it
+        self._pruned = 0
+        self.nodes = {}         # Node: [epoch, last sequence]
+        self.connections = {}   # Node: its current NodeConnection
+        self.running = False
+        self.address = None
+        self.received = 0
+        self.joined = 0
+        self.duplicates = 0
+        self.rejected = 0
+        self.__initdb__()
+
+    def __initdb__(self):
+        """Create the unified database tables and load the node sequence numbers.
+        """
+
+        self.dbconn = sqlite3.connect(self.database, detect_types=sqlite3.PARSE_DECLTYPES,
+                                      isolation_level=None, check_same_thread=False)
+        self.dbconn.execute('PRAGMA journal_mode=WAL')     # Readers while writing
+        self.dbconn.execute("""CREATE TABLE IF NOT EXISTS "Reception"
+            ("Starttime" timestamp, "Duration" integer, "System" text, "Group" text, "Channel" text,
+             "Frequency_TGID" text, "CTCSS_DCS" integer, "Modulation" text, "Attenuation" boolean,
+             "SystemTag" integer, "ChannelTag" integer, "P25NAC" text, "Clip" text,
+             "DurationMs" integer, "StartUtcMs" integer, "SignalKind" text, "Signal" blob,
+             "SignalMin" integer, "SignalMean" real, "SignalMax" integer, "FrequencyHz" integer,
+             "TGID" integer, "AgencyId" integer, "ServiceId" integer, "TagSetId" integer,
+             "Node" text, "Hearings" integer, "ChannelKey" text)""")
+        self.dbconn.execute("""CREATE INDEX IF NOT EXISTS "ReceptionChannel"
+            ON "Reception" ("ChannelKey", "StartUtcMs")""")
+        self.dbconn.execute("""CREATE TABLE IF NOT EXISTS "Hearing"
+            ("ReceptionId" integer, "Node" text, "Seq" integer, "StartUtcMs" integer,
+             "DurationMs" integer, "SignalMax" integer, "Clip" text)""")
+        self.dbconn.execute("""CREATE INDEX IF NOT EXISTS "HearingReception" ON "Hearing" ("ReceptionId")""")
+        self.dbconn.execute("""CREATE TABLE IF NOT EXISTS "NodeState"
+            ("Node" text PRIMARY KEY, "Epoch" text, "LastSeq" integer, "LastTime" timestamp)""")
+        self.dbconn.execute("""CREATE TABLE IF NOT EXISTS "RefName"
+            ("Id" integer PRIMARY KEY, "Name" text)""")
+        self.reload()
+
+    def put(self, item):
+        """Queue a hello or reception from a reader, waits while the writer is behind.
+        """
+
+        self._queue.put(item)
+
+    def listen(self, address):
+        """Accept node connections on *address* (host, port), on a thread.
+        """
+
+        self._listener = socket.create_server(address, reuse_port=False)
+        self.address = self._listener.getsockname()[:2]
+        self.__logger.info("Listening on %s:%d, database %s", *self.address, self.database)
+        threading.Thread(target=self.accept, name="**Accept**", daemon=True).start()
+
+    def accept(self):
+        """Start a reader for each connection until the listener closes.
+        """
+
+        while True:
+            try:
+                (sock, peer) = self._listener.accept()
+            except OSError:
+                break
+            NodeConnection(self, sock, '{}:{}'.format(*peer[:2])).start()
+
+    def stop(self):
+        """Stop accepting and reading, the writer finishes the queued receptions.
+        """
+
+        self.running = False
+        if self._listener is not None:
+            self._listener.close()
+        for connection in list(self.connections.values()):
+            connection.close()
+
+    def run(self):
+        """Write the queued receptions until stopped.
+        """
+
+        self.running = True
+        status = time.monotonic()
+        while self.running or not self._queue.empty():
+            try:
+                items = [self._queue.get(timeout=1.0)]
+            except queue.Empty:
+                continue
+            try:
+                while len(items) < BATCH:
+                    items.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+            self.write(items)
+
+            if time.monotonic() - status >= STATUS:
+                status = time.monotonic()
+                self.__logger.info("%d nodes connected, %d received, %d joined, %d duplicates, %d rejected",
+                                   len(self.connections), self.received, self.joined,
+                                   self.duplicates, self.rejected)
+        self.dbconn.close()
+
+    def write(self, items):
+        """Store a batch in one transaction, then acknowledge it.
+        """
+
+        acks = {}
+        changed = set()
+        try:
+            self.dbconn.execute('BEGIN')
+            for item in items:
+                if item[0] == 'hello':
+                    self.hello(*item[1:], acks=acks, changed=changed)
+                elif item[0] == 'closed':
+                    if self.connections.get(item[1].node) is item[1]:
+                        del self.connections[item[1].node]
+                else:
+                    self.reception(*item[1:], acks=acks, changed=changed)
+            self.dbconn.executemany(
+                'INSERT OR REPLACE INTO "NodeState" ("Node", "Epoch", "LastSeq", "LastTime") VALUES (?, ?, ?, ?)',
+                [(node, *self.nodes[node], datetime.now()) for node in changed])
+            self.dbconn.execute('COMMIT')
+        except sqlite3.Error:
+            self.__logger.exception("Error writing %d receptions, the nodes send them again", len(items))
+            self.dbconn.execute('ROLLBACK')
+            self.reload()
+            for connection in {item[1] for item in items}:
+                connection.close()
+            return
+
+        for (connection, seq) in acks.items():
+            connection.send({'ack': seq})
+        if self._newest - self._pruned >= self.horizon_ms // 10:
+            self.prune()
+
+    def reload(self):
+        """Load the node sequence numbers and the transmissions within the
+        memory horizon, at the start and after a rollback.
+        """
+
+        self.nodes = {node: [epoch, lastseq] for (node, epoch, lastseq) in
+                      self.dbconn.execute('SELECT "Node", "Epoch", "LastSeq" FROM "NodeState"')}
+        self._newest = self.dbconn.execute('SELECT MAX("StartUtcMs") FROM "Reception"').fetchone()[0] or 0
+        self._pruned = self._newest
+        self._recent = {}
+        recent = {}
+        for (rowid, key, start_ms, duration_ms, node) in self.dbconn.execute(
+                'SELECT r.rowid, r."ChannelKey", r."StartUtcMs", r."DurationMs", h."Node" '
+                'FROM "Reception" r JOIN "Hearing" h ON h."ReceptionId" = r.rowid '
+                'WHERE r."StartUtcMs" >= ?', (self._newest - self.horizon_ms,)):
+            if rowid not in recent:
+                recent[rowid] = Transmission(rowid, start_ms, start_ms + duration_ms, set())
+                self._recent.setdefault(key, []).append(recent[rowid])
+            recent[rowid].nodes.add(node)
+
+    def hello(self, connection, node, epoch, acks, changed):
+        """A node connected, its reply is the last sequence number stored.
+        """
+
+        previous = self.connections.get(node)
+        if previous is not None and previous is not connection:
+            self.__logger.info("%s connected again, closing %s", node, previous.peer)
+            previous.close()
+        self.connections[node] = connection
+        state = self.nodes.get(node)
+        if state is None or state[0] != epoch:
+            if state is not None:
+                self.__logger.warning("%s has a new spool, its sequence numbers start again", node)
+            self.nodes[node] = state = [epoch, 0]
+            changed.add(node)
+        self.__logger.info("%s connected from %s, last sequence %d", node, connection.peer, state[1])
+        acks[connection] = state[1]
+
+    def reception(self, connection, seq, record, acks, changed):
+        """Store a reception unless it was stored already.
+        """
+
+        if self.connections.get(connection.node) is not connection:
+            return                  # A replaced connection, the new one sends it again
+        state = self.nodes[connection.node]
+        acks[connection] = max(seq, state[1])
+        if seq <= state[1]:
+            self.duplicates += 1
+            return
+        state[1] = seq
+        changed.add(connection.node)
+        try:
+            params = decode_record(record)
+        except (KeyError, TypeError, ValueError) as err:
+            self.rejected += 1
+            self.__logger.error("%s reception %d rejected: %s", connection.node, seq, err)
+            return
+        self.received += 1
+        self.store(connection.node, seq, params, record.get('names'))
+
+    def store(self, node, seq, params, names=None):
+        """Join the reception to a stored transmission or store it as a new one.
+
+        Args:
+            node (str): The node that heard it
+            seq (int): Its sequence number
+            params (dict): The Reception column values, see :func:`scanmon.publish.decode_record`
+            names (list): Optional. [id, name] of its reference ids
+        """
+
+        key = channel_key(params)
+        start = params['start_utc_ms']
+        end = start + params['duration_ms']
+        transmission = self.join(key, start, node)
+        if transmission is None:
+            params.update(node=node, hearings=1, channel_key=key)
+            rowid = self.dbconn.execute("""INSERT INTO "Reception"
+                ("Starttime", "Duration", "System", "Group", "Channel", "Frequency_TGID", "CTCSS_DCS",
+                 "Modulation", "Attenuation", "SystemTag", "ChannelTag", "P25NAC", "Clip",
+                 "DurationMs", "StartUtcMs", "SignalKind", "Signal", "SignalMin", "SignalMean",
+                 "SignalMax", "FrequencyHz", "TGID", "AgencyId", "ServiceId", "TagSetId",
+                 "Node", "Hearings", "ChannelKey") VALUES
+                (:starttime, :duration, :system, :group, :channel, :frequency_tgid, :ctcss_dcs,
+                 :modulation, :attenuation, :system_tag, :channel_tag, :p25nac, :clip,
+                 :duration_ms, :start_utc_ms, :signal_kind, :signal, :signal_min, :signal_mean,
+                 :signal_max, :frequency_hz, :tgid, :agency_id, :service_id, :tagset_id,
+                 :node, :hearings, :channel_key)""", params).lastrowid
+            if start >= self._newest - self.horizon_ms:
+                self._recent.setdefault(key, []).append(Transmission(rowid, start, end, {node}))
+            self._newest = max(self._newest, start)
+        else:
+            self.joined += 1
+            rowid = transmission.rowid
+            transmission.nodes.add(node)
+            if start < transmission.start_ms:
+                transmission.start_ms = start
+                self.dbconn.execute('UPDATE "Reception" SET "Starttime" = ?, "StartUtcMs" = ? WHERE rowid = ?',
+                                    (params['starttime'], start, rowid))
+            transmission.end_ms = max(transmission.end_ms, end)
+            duration_ms = transmission.end_ms - transmission.start_ms
+            self.dbconn.execute('UPDATE "Reception" SET "DurationMs" = ?, "Duration" = ?, '
+                                '"Hearings" = "Hearings" + 1 WHERE rowid = ?',
+                                (duration_ms, duration_ms // 1000, rowid))
+        self.dbconn.execute('INSERT INTO "Hearing" ("ReceptionId", "Node", "Seq", "StartUtcMs", "DurationMs", '
+                            '"SignalMax", "Clip") VALUES (?, ?, ?, ?, ?, ?, ?)',
+                            (rowid, node, seq, start, params['duration_ms'], params['signal_max'], params['clip']))
+        if names:
+            self.dbconn.executemany('INSERT OR IGNORE INTO "RefName" ("Id", "Name") VALUES (?, ?)', names)
+
+    def join(self, key, start, node):
+        """The transmission on the channel starting nearest *start* within the
+        window that *node* has not heard, None if there is none.
+        """
+
+        best = None
+        for transmission in self._recent.get(key, ()):
+            gap = abs(transmission.start_ms - start)
+            if gap <= self.window_ms and node not in transmission.nodes \
+                    and (best is None or gap < abs(best.start_ms - start)):
+                best = transmission
+        if best is None and start - self.window_ms < self._newest - self.horizon_ms:
+            best = self.lookup(key, start, node)
+        return best
+
+    def lookup(self, key, start, node):
+        """Join a late reception through the database.
+        """
+
+        best = None
+        for (rowid, start_ms, duration_ms) in self.dbconn.execute(
+                'SELECT rowid, "StartUtcMs", "DurationMs" FROM "Reception" '
+                'WHERE "ChannelKey" = ? AND "StartUtcMs" BETWEEN ? AND ?',
+                (key, start - self.window_ms, start + self.window_ms)):
+            if best is not None and abs(start_ms - start) >= abs(best.start_ms - start):
+                continue
+            nodes = {row[0] for row in self.dbconn.execute(
+                'SELECT "Node" FROM "Hearing" WHERE "ReceptionId" = ?', (rowid,))}
+            if node not in nodes:
+                best = Transmission(rowid, start_ms, start_ms + duration_ms, nodes)
+        return best
+
+    def prune(self):
+        """Drop the transmissions behind the memory horizon.
+        """
+
+        self._pruned = self._newest
+        cutoff = self._newest - self.horizon_ms
+        for key in list(self._recent):
+            kept = [transmission for transmission in self._recent[key] if transmission.start_ms >= cutoff]
+            if kept:
+                self._recent[key] = kept
+            else:
+                del self._recent[key]
+
+def main():
+    """Parse the arguments and aggregate until interrupted.
+    """
+
+    parser = argparse.ArgumentParser(description="Merge the receptions of many monitors",
+                                     prog="scanmon-aggregator")
+    parser.add_argument("--config", "-C",
+                        default="config.ini",
+                        help="Configuration file with an [aggregator] section, default config.ini")
+    parser.add_argument("--listen", default=None,
+                        help="HOST:PORT to listen on, default [aggregator] listen or 0.0.0.0:{}".format(PORT))
+    parser.add_argument("--database", "--db", default=None,
+                        help="Unified database, default [aggregator] database or aggregate.db")
+    parser.add_argument("--window", type=float, default=None,
+                        help="Join window in seconds, default {:.0f}".format(WINDOW))
+    parser.add_argument("--debug", "-d", action='store_true', help="Debugging flag")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.DEBUG if args.debug else logging.INFO,
+                        format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    config = configparser.ConfigParser()
+    config.read(args.config)
+    try:
+        address = parse_address(args.listen or config.get('aggregator', 'listen', fallback=''), '0.0.0.0')
+        window = args.window if args.window is not None else \
+            config.getfloat('aggregator', 'window', fallback=WINDOW)
+        aggregator = Aggregator(args.database or config.get('aggregator', 'database', fallback='aggregate.db'),
+                                window)
+        aggregator.listen(address)
+    except (ValueError, OSError, sqlite3.Error) as err:
+        print("scanmon-aggregator: {}".format(err))
+        return 1
+
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda signum, frame: aggregator.stop())
+    aggregator.run()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,445 @@
+"""
+Alerts - Alert rules for Receptions, compiled for many rules.
+
+`Source <src/scanmon.alerts.html>`__
+
+Each ``[alert NAME]`` section of config.ini is a rule. All the conditions given
+must hold::
+
+    [alert fire]
+    ; Globs (* and ?, case insensitive), a comma separated list of alternatives
+    system=Bethel*
+    group=
+    channel=*Fire*,*EMS*
+    ; MHz, frequencies or low-high ranges
+    frequency=150.0-160.0,453.1000
+    ; Time of day of the start, ranges may wrap midnight
+    time=22:00-06:00
+    ; Seconds the reception has lasted
+    minduration=5
+    ; Not seen in this many days, or never
+    firstseen=30
+    ; Instead of a reception, an anomaly of the channel's activity statistics:
+    ; busy, long, or any (see scanmon.chanstats). minduration and firstseen
+    ; do not apply, {anomaly} describes it.
+    anomaly=busy
+    ; alert (message window), bell, highlight (the monitor line) and/or sink
+    action=alert,highlight
+    message={rule}: {system}|{group}|{channel} {frequency}
+    ; The sink runs a command with SCANMON_<FIELD> in the environment
+    ; and/or posts the fields as JSON to a URL
+    command=/usr/local/bin/notify-fire
+    url=http://localhost:8080/alert
+
+The rules are compiled so matching a Reception does not look at every rule:
+literal names are dict lookups, globs run together in one DFA built as names
+are seen, frequencies and times of day are sorted segments with the set of rules
+covering each. The sets for a System-Group-Channel are cached.
+
+Only the standard library is used, config checking loads this module.
+"""
+
+import bisect
+import json
+import logging
+import os
+import queue
+import shlex
+import subprocess
+import threading
+from datetime import timedelta
+from operator import attrgetter
+
+ACTIONS = ('alert', 'bell', 'highlight', 'sink')
+ANOMALIES = ('busy', 'long')
+PREFIX = 'alert '
+MESSAGE = '{rule}: {system}|{group}|{channel} {frequency}'
+ANOMALY_MESSAGE = '{rule}: {system}|{group}|{channel} {anomaly}'
+_MAXNAMES = 4096        # System-Group-Channel sets cached
+_EMPTY = frozenset()
+_FIELDS = ('system', 'group', 'channel')
+
+class AlertRule(object):
+    """One compiled rule.
+
+    Args:
+        name (str): The rule name, from the section
+        index (int): Position in the config, the order alerts fire in
+        options (dict): The section options
+    """
+
+    def __init__(self, name, index, options):
+        self.name = name
+        self.index = index
+        self.globs = {field: [pattern.strip().lower() for pattern in options.get(field, '').split(',')
+                              if pattern.strip()]
+                      for field in _FIELDS}
+        self.frequencies = [self._frequency(text) for text in options.get('frequency', '').split(',')
+                            if text.strip()]
+        self.times = [self._time(text) for text in options.get('time', '').split(',') if text.strip()]
+        try:
+            self.minduration_ms = int(float(options.get('minduration', '0')) * 1000)
+            days = options.get('firstseen', '')
+            self.firstseen = timedelta(days=float(days)) if days.strip() else None
+        except ValueError as err:
+            raise ValueError('[{}{}] {}'.format(PREFIX, name, err))
+        self.actions = {action.strip().lower() for action in options.get('action', 'alert').split(',')
+                        if action.strip()}
+        unknown = self.actions - set(ACTIONS)
+        if unknown:
+            raise ValueError('[{}{}] action={}: not one of {}'.format(
+                PREFIX, name, ','.join(sorted(unknown)), ', '.join(ACTIONS)))
+        anomalies = {kind.strip().lower() for kind in options.get('anomaly', '').split(',') if kind.strip()}
+        self.anomalies = set(ANOMALIES) if 'any' in anomalies else anomalies
+        unknown = self.anomalies - set(ANOMALIES)
+        if unknown:
+            raise ValueError('[{}{}] anomaly={}: not any or one of {}'.format(
+                PREFIX, name, ','.join(sorted(unknown)), ', '.join(ANOMALIES)))
+        self.message = options.get('message', ANOMALY_MESSAGE if self.anomalies else MESSAGE)
+        self.command = options.get('command', '').strip()
+        self.url = options.get('url', '').strip()
+        self.order = (self.minduration_ms, index)       # Firing order
+        self.fired = 0
+
+    def _frequency(self, text):
+        """(low, high + 1) Hz of a frequency or range in MHz
+        """
+
+        (low, _, high) = text.strip().partition('-')
+        try:
+            low = round(float(low) * 1000000)
+            high = round(float(high) * 1000000) if high.strip() else low
+        except ValueError:
+            raise ValueError('[{}{}] frequency={}: not MHz or a MHz range'.format(PREFIX, self.name, text))
+        return (min(low, high), max(low, high) + 1)
+
+    def _time(self, text):
+        """(start, end) minute of the day of a HH:MM-HH:MM range, end excluded
+        """
+
+        minutes = []
+        for part in text.split('-'):
+            (hour, _, minute) = part.strip().partition(':')
+            if not (hour.isdigit() and minute.isdigit() and int(hour) < 24 and int(minute) < 60):
+                break
+            minutes.append(int(hour) * 60 + int(minute))
+        if len(minutes) != 2:
+            raise ValueError('[{}{}] time={}: not HH:MM-HH:MM'.format(PREFIX, self.name, text))
+        return tuple(minutes)
+
+    def __repr__(self):
+        return '<AlertRule {}>'.format(self.name)
+
+class GlobSet(object):
+    """The patterns, * and ? globs, that match a name.
+
+    The patterns run together as one NFA; its state sets become DFA states as
+    names are matched, so each character of a name is one dict lookup once the
+    DFA has seen similar names.
+    """
+
+    def __init__(self):
+        self.patterns = []      # Distinct patterns
+        self._index = {}        # Pattern to its position
+        self._rules = []        # Position to the pattern's rules
+        self._states = {}       # NFA state set to DFA state
+        self._nfas = []         # DFA state to NFA state set
+        self._moves = []        # DFA state to {character: DFA state}
+        self._accepts = []      # DFA state to the rules it matches
+        self._start = None
+
+    def add(self, pattern, rule):
+        """Add a pattern, before the first match
+        """
+
+        if pattern not in self._index:
+            self._index[pattern] = len(self.patterns)
+            self.patterns.append(pattern)
+            self._rules.append(set())
+        self._rules[self._index[pattern]].add(rule)
+
+    def _closure(self, nfa):
+        """The NFA states with each * also skipped
+        """
+
+        closed = set(nfa)
+        for (index, pos) in list(closed):
+            pattern = self.patterns[index]
+            while pos < len(pattern) and pattern[pos] == '*':
+                pos += 1
+                closed.add((index, pos))
+        return frozenset(closed)
+
+    def _state(self, nfa):
+        """The DFA state of an NFA state set
+        """
+
+        state = self._states.get(nfa)
+        if state is None:
+            state = len(self._moves)
+            self._states[nfa] = state
+            self._nfas.append(nfa)
+            self._moves.append({})
+            self._accepts.append(frozenset().union(*(self._rules[index] for (index, pos) in nfa
+                                                     if pos == len(self.patterns[index]))))
+        return state
+
+    def _move(self, state, char):
+        """The DFA state after a character
+        """
+
+        nfa = set()
+        for (index, pos) in self._nfas[state]:
+            pattern = self.patterns[index]
+            if pos < len(pattern):
+                if pattern[pos] == '*':
+                    nfa.add((index, pos))
+                elif pattern[pos] in ('?', char):
+                    nfa.add((index, pos + 1))
+        target = self._state(self._closure(nfa))
+        self._moves[state][char] = target
+        return target
+
+    def match(self, name):
+        """The rules of the patterns matching a lower case name
+        """
+
+        if not self.patterns:
+            return _EMPTY
+        if self._start is None:
+            self._start = self._state(self._closure((index, 0) for index in range(len(self.patterns))))
+
+        state = self._start
+        for char in name:
+            move = self._moves[state].get(char)
+            state = self._move(state, char) if move is None else move
+        return self._accepts[state]
+
+class IntervalSets(object):
+    """The rules covering a value, over half open intervals.
+
+    Args:
+        intervals: (low, end, rule) triples
+    """
+
+    def __init__(self, intervals):
+        self.starts = [None]
+        self.sets = [_EMPTY]
+        events = sorted([(low, 1, rule) for (low, _, rule) in intervals]
+                        + [(end, 0, rule) for (_, end, rule) in intervals], key=lambda e: e[:2])
+        active = set()
+        for (pos, (bound, starting, rule)) in enumerate(events):
+            if starting:
+                active.add(rule)
+            else:
+                active.discard(rule)
+            if pos + 1 < len(events) and events[pos + 1][0] == bound:
+                continue        # Same boundary, finish it first
+            covering = frozenset(active)
+            if covering != self.sets[-1]:
+                self.starts.append(bound)
+                self.sets.append(covering)
+        self.starts[0] = float('-inf')
+
+    def lookup(self, value):
+        """The rules covering a value
+        """
+
+        return self.sets[bisect.bisect_right(self.starts, value) - 1]
+
+class AlertRules(object):
+    """Compiled alert rules.
+
+    Args:
+        rules ([AlertRule]): The rules, in config order
+    """
+
+    def __init__(self, rules):
+        self.rules = rules
+        self._literals = {field: {} for field in _FIELDS}
+        self._globs = {field: GlobSet() for field in _FIELDS}
+        self._any = {}
+        for field in _FIELDS:
+            anyname = set()
+            for rule in rules:
+                if not rule.globs[field]:
+                    anyname.add(rule)
+                for pattern in rule.globs[field]:
+                    if '*' in pattern or '?' in pattern:
+                        self._globs[field].add(pattern, rule)
+                    else:
+                        self._literals[field].setdefault(pattern, set()).add(rule)
+            self._any[field] = frozenset(anyname)
+
+        self._frequencies = IntervalSets(
+            [(low, end, rule) for rule in rules for (low, end) in rule.frequencies])
+        self._anyfrequency = frozenset(rule for rule in rules if not rule.frequencies)
+        intervals = []
+        for rule in rules:
+            for (start, end) in rule.times:
+                if start < end:
+                    intervals.append((start, end, rule))
+                else:           # Wraps midnight, or all day when equal
+                    intervals.extend(((start, 1440, rule), (0, end, rule)))
+        self._times = IntervalSets(intervals)
+        self._anytime = frozenset(rule for rule in rules if not rule.times)
+        self._kinds = {kind: frozenset(rule for rule in rules if kind in rule.anomalies) for kind in ANOMALIES}
+        self._kinds[None] = frozenset(rule for rule in rules if not rule.anomalies)
+        self._names = {}
+
+    @classmethod
+    def from_config(cls, config):
+        """Compile the ``[alert NAME]`` sections.
+
+        Args:
+            config (configparser.ConfigParser): The whole configuration
+
+        Raises:
+            ValueError: A rule is invalid, the message names it
+        """
+
+        rules = []
+        for section in config.sections():
+            if section.startswith(PREFIX):
+                rules.append(AlertRule(section[len(PREFIX):].strip(), len(rules), config[section]))
+        return cls(rules)
+
+    def __len__(self):
+        return len(self.rules)
+
+    def _named(self, kind, system, group, channel):
+        """Rules for receptions (kind None) or an anomaly matching a System-Group-Channel
+        by name, and those of them for any frequency
+        """
+
+        key = (kind, system, group, channel)
+        named = self._names.get(key)
+        if named is None:
+            found = self._kinds[kind]
+            for (field, name) in zip(_FIELDS, key[1:]):
+                name = name.lower()
+                rules = (self._any[field] | self._globs[field].match(name)
+                         | self._literals[field].get(name, _EMPTY))
+                found = found & rules
+                if not found:
+                    break
+            if len(self._names) >= _MAXNAMES:
+                self._names.clear()
+            found = frozenset(found)
+            named = (found, found & self._anyfrequency)
+            self._names[key] = named
+        return named
+
+    def match(self, reception):
+        """The rules a new Reception matches, apart from its duration.
+
+        Args:
+            reception (Reception): Uses system, group, channel, frequency_hz,
+                starttime and lastseen
+
+        Returns:
+            [AlertRule, ...] by minimum duration then config order
+        """
+
+        found = self._matched(None, reception)
+        rules = [rule for rule in found
+                 if rule.firstseen is None or reception.lastseen is None
+                 or reception.starttime - reception.lastseen >= rule.firstseen]
+        rules.sort(key=attrgetter('order'))
+        return rules
+
+    def match_anomaly(self, kind, reception):
+        """The rules for an anomaly found with a Reception.
+
+        Args:
+            kind (str): 'busy' or 'long'
+            reception (Reception): As for :meth:`match`, lastseen is not used
+
+        Returns:
+            [AlertRule, ...] in config order
+        """
+
+        return sorted(self._matched(kind, reception), key=attrgetter('index'))
+
+    def _matched(self, kind, reception):
+        """The rules of a kind matching a Reception's names, frequency and start time
+        """
+
+        (found, anyfrequency) = self._named(kind, reception.system, reception.group, reception.channel)
+        if not found:
+            return _EMPTY
+        if reception.frequency_hz is not None:
+            found = anyfrequency | (found & self._frequencies.lookup(reception.frequency_hz))
+        else:
+            found = anyfrequency
+        start = reception.starttime
+        return (found & self._anytime) | (found & self._times.lookup(start.hour * 60 + start.minute))
+
+class AlertSink(threading.Thread):
+    """Runs the sink commands and posts, off the main thread.
+    """
+
+    TIMEOUT = 30.0      # Seconds for a command or post
+
+    def __init__(self):
+        super().__init__()
+        self.__logger = logging.getLogger(__name__).getChild(type(self).__name__)
+        self._queue = queue.Queue()
+        self.daemon = True
+        self.name = "**AlertSink**"
+
+    def run(self):
+        """Handle (rule, fields) until None is put.
+        """
+
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            (rule, fields) = item
+            if rule.command:
+                self.run_command(rule, fields)
+            if rule.url:
+                self.post(rule, fields)
+
+    def put(self, rule, fields):
+        """Queue a sink call.
+
+        Args:
+            rule (AlertRule): The rule that fired
+            fields (dict): The message fields
+        """
+
+        self._queue.put((rule, fields))
+
+    def stop(self):
+        """Stop after the queued calls.
+        """
+
+        self._queue.put(None)
+
+    def run_command(self, rule, fields):
+        """Run the rule's command with the fields in the environment
+        """
+
+        env = dict(os.environ)
+        env.update(('SCANMON_' + name.upper(), str(value)) for (name, value) in fields.items())
+        try:
+            subprocess.run(shlex.split(rule.command), env=env, timeout=AlertSink.TIMEOUT,
+                           stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, check=True)
+        except (OSError, subprocess.SubprocessError) as err:
+            self.__logger.error("Alert %s command failed: %s", rule.name, err)
+
+    def post(self, rule, fields):
+        """Post the fields as JSON to the rule's URL
+        """
+
+        import requests     # Slow to import, only needed with a url
+        try:
+            result = requests.post(rule.url, data=json.dumps(fields, default=str),
+                                   headers={'Content-Type': 'application/json'},
+                                   timeout=AlertSink.TIMEOUT)
+            if not result.ok:
+                self.__logger.error("Alert %s post error (%d): %s", rule.name, result.status_code, result.text)
+        except requests.exceptions.RequestException as err:
+            self.__logger.error("Alert %s post failed: %s", rule.name, err)
@@ -0,0 +1,705 @@
+"""
+Scanmon application - The urwid window, scanner and monitor put together.
+
+`Source <src/scanmon.app.html>`__
+"""
+import datetime
+import decimal
+import logging
+import queue
+import sqlite3
+import threading
+import time
+
+from urwid import ExitMainLoop
+
+# Our own definitions
+from scanmon.glgmonitor import GLGMonitor
+from scanmon.history import HistoryFilter, HistoryWalker
+from scanmon.logring import LogPipeline, RINGSIZE
+from scanmon.memtrace import MemTracer, format_stat
+from scanmon.monwin import Monwin
+from scanmon.profiler import SamplingProfiler
+from scanmon.scanner import Scanner, Command
+from scanmon import signalseries
+from scanmon.scanner.capture import CaptureWriter, MAXSIZE as CAPTURESIZE
+from scanmon.scanner.rle import RunWriter
+from scanmon.scanner.formatter import Response, ScannerDecodeError
+from scanmon import config as scanconfig
+
+class Scanmon(Monwin):
+    """The main scanmon code. Everything begins here.
+
+    Arguments:
+        args: An args object from argparser.
+    """
+
+# Class constants
+    _TIMEFMT = '%H:%M:%S'
+    _DATETIMEFMT = '%a %d %b %Y %H:%M %Z'
+    _GLGTIME = 0.5  # Half second
+    _EPOCH = 3600 * 24 * 356    # A year of seconds
+    _MAXSIZE = 10
+    _FLUSHRETRY = 0.01  # Seconds until a write the scanner did not take is retried
+    _CAPTUREFLUSH = 1.0 # Seconds between capture flushes, a crash loses at most this much
+
+
+    @staticmethod
+    def _adapt_bool(value):
+        """sqllite3 adapter
+
+        Adapts a python bool value to an int to use in mysql.
+
+        Args:
+            value (object): A value to convert to an int
+
+        Returns:
+            A 1 or 0 from the converted boolean interpretation of 'value'
+        """
+        return int(bool(value))
+
+    @staticmethod
+    def _convert_bool(value):
+        """sqllite3 converter
+
+        Adapts a sql bool value (0 or 1) to a bool from mysql.
+
+        Args:
+            value (b'0' or b'1'): A value to convert to a bool
+
+        Returns:
+            A True or False from the converted boolean interpretation of 'value'
+        """
+        return value == b'1'
+
+    @staticmethod
+    def _adapt_decimal(value):
+        """sqllite3 adapter
+
+        Adapts a python decimal value to a str to use in mysql.
+
+        Args:
+            value (number): A value to convert to a str
+
+        Returns:
+            A str from the converted 'value'
+        """
+        return str(value)
+
+    @staticmethod
+    def _convert_decimal(value):
+        """sqllite3 converter
+
+        Adapts a sql decimal string value to a number
+
+        Args:
+            value (str): A string value to convert to a number (decimal)
+
+        Returns:
+            A decimal from the converted interpretation of 'value'
+            or Decimal('NaN')
+        """
+        try:
+            rval = decimal.Decimal(value.decode())
+        except decimal.InvalidOperation:
+            rval = decimal.Decimal("NaN")
+
+        return rval
+
+    def __init__(self, args, argmap):
+        """Initialize the instance.
+        """
+
+        self.config = self.merge_config(args, argmap)
+
+        # Establish logging, written by a listener thread
+        self.log_pipeline = LogPipeline(
+            self.config.get('scanmon', 'logfile', fallback='scanmon.log'),
+            debug=self.config.getboolean('scanmon', 'debug', fallback=False),
+            ringsize=self.config.getint('scanmon', 'logring', fallback=RINGSIZE))
+
+        self.__logger = logging.getLogger(__name__).getChild(type(self).__name__)
+        self.__logger.info("Scanmon initializing")
+
+        # Initialize the mainloop
+        super().__init__(self.config['window'])
+
+        # Get the scanner started
+        self.scanner = Scanner(self.config.get('scanner', 'device', fallback=None), batch=True,
+                               wake=self.wake_scanner)
+        self._flush_alarm = None
+        self.event_loop.enter_idle(self.flush_scanner)      # One write per loop pass
+        self.scanner_handle = self.watch_file(self.scanner.fileno, self.scanner.read_scanner)
+        self.scanner.watch_command(Command('*', callback=self.catch_all))
+
+        c_capture = self.config.get('scanner', 'capture', fallback=None)
+        if c_capture:
+            c_captureid = self.config.getint('scanner', 'captureid', fallback=0)
+            if self.config.get('scanner', 'captureformat', fallback='raw') == 'rle':
+                self.scanner.capture = RunWriter(c_capture, scanner_id=c_captureid)
+            else:
+                self.scanner.capture = CaptureWriter(
+                    c_capture,
+                    scanner_id=c_captureid,
+                    maxsize=self.config.getint('scanner', 'capturesize', fallback=CAPTURESIZE))
+            self.set_alarm_in(Scanmon._CAPTUREFLUSH, self.flush_capture)
+        self.running = False
+        self.autocmd = False
+
+        # Set automute time
+        self.automute = None
+        c_automute = self.config.get('monitor', 'automute', fallback="off")
+        newtime = None
+        if c_automute != "off":
+            newtime = self._mute_time(c_automute)
+            if newtime is not None:
+                self.set_automute(newtime)
+
+
+        # Mark for the perf command (wall time, cpu time, redraws)
+        self._perf_mark = (time.monotonic(), time.process_time(), 0)
+
+        # Commands entered at the console
+        self.q_cmdin = queue.Queue(maxsize=Scanmon._MAXSIZE)
+
+        # Set up GLG monitoring
+        self.glgmonitor = GLGMonitor(self, config=self.config['monitor'])
+        self.scanner.watch_command(Command('GLG', callback=self.glgmonitor.process))
+        self.hist_walker = None
+        self.profiler = None
+        self.memtracer = MemTracer()
+
+        # Setup sqlite3 adapters
+        sqlite3.register_adapter(decimal.Decimal, Scanmon._adapt_decimal)
+        sqlite3.register_converter('decimal', Scanmon._convert_decimal)
+        sqlite3.register_adapter(bool, Scanmon._adapt_bool)
+        sqlite3.register_converter('boolean', Scanmon._convert_bool)
+
+        # Initialization complete
+        self.__logger.info("Scanmon initialization complete")
+
+    def flush_scanner(self):
+        """Write the queued scanner commands when the loop goes idle.
+
+        What the device does not take is retried after a short alarm, so it
+        does not wait for some other event.
+        """
+
+        if self.scanner.flush_commands() and self._flush_alarm is None:
+            self._flush_alarm = self.set_alarm_in(Scanmon._FLUSHRETRY, self._flush_due)
+
+    def _flush_due(self, main_loop, user_data):
+        """Alarm for a flush retry, the loop goes idle after it and flushes.
+        """
+
+        del main_loop, user_data    # unused
+        self._flush_alarm = None
+
+    def flush_capture(self, main_loop, user_data):
+        """Alarm, write the buffered capture records to the file every _CAPTUREFLUSH seconds.
+        """
+
+        del main_loop, user_data    # unused
+        self.scanner.capture.flush()
+        self.set_alarm_in(Scanmon._CAPTUREFLUSH, self.flush_capture)
+
+    def wake_scanner(self):
+        """A command was queued, wake the loop to write it if it came from another thread.
+        """
+
+        if self.thread_id != threading.get_ident():
+            self.call_soon(self.flush_scanner)
+
+    def catch_all(self, command, response):
+        """Fallback response handler. If no other handler is registered this handler
+        will be called.
+
+        Args:
+            command (Command): The original command (unused)
+            response (Response): The formatted scanner response
+        """
+
+        del command
+        self.putline('resp', 'R({}): {}'.format(response.CMD, response.display(response)))
+        return False
+
+    def cmd_mute(self, cmd, cmd_args):
+        """Send a 'vol mute' command
+
+        Args:
+            cmd (str): The command entered (unused)
+            cmd_args (str): The command argument (unused)
+        """
+
+        del cmd, cmd_args # unused
+        self.cmd_vol('vol', 'mute')
+
+    def cmd_mon(self, _, cmd_args):
+        """Start or stop the GLG monitoring
+
+        Args:
+            cmd (str): The command entered (unused)
+            cmd_args (str): 'start', 'stop', or null
+        """
+
+        if len(cmd_args) > 0:
+            if cmd_args == 'start':
+                self.glgmonitor.start()
+            elif cmd_args == 'stop':
+                self.glgmonitor.stop()
+            else:
+                self.message("Unknown option: {}".format(cmd_args))
+        else:
+            startstop = 'Running' if self.glgmonitor.running else 'Stopped'
+            self.putline('resp', "Monitoring {}".format(startstop))
+
+    def cmd_hist(self, cmd, cmd_args):
+        """Show a filtered view of the reception history in the Channel Monitor
+
+        Args:
+            cmd (str): The command entered (unused)
+            cmd_args (str): 'off' for the live monitor, filter terms
+                (sys=GLOB grp=GLOB chan=GLOB freq=LOW-HIGH) or null for the status
+        """
+
+        del cmd # unused
+        history = self.glgmonitor.history
+
+        if cmd_args == '':
+            self.putline('resp', "History: {} rows, {} channels, showing {}".format(
+                len(history), len(history.channels),
+                self.hist_walker.view.filter if self.hist_walker else 'live'))
+            return
+
+        try:
+            hfilter = None if cmd_args in ('off', 'live') else HistoryFilter.parse(cmd_args)
+        except ValueError as err:
+            self.message(str(err))
+            return
+
+        if self.hist_walker:
+            self.hist_walker.close()
+            history.close_view(self.hist_walker.view)
+            self.hist_walker = None
+
+        if hfilter is None:
+            self.show_glg()
+        else:
+            self.hist_walker = HistoryWalker(history.view(hfilter))
+            self.show_glg(self.hist_walker, 'History: {} ({} rows)'.format(
+                hfilter, len(self.hist_walker)))
+
+    def cmd_perf(self, cmd, cmd_args):
+        """Show the screen redraw rate and CPU use since the last perf command
+
+        Args:
+            cmd (str): The command entered (unused)
+            cmd_args (str): The command argument (unused)
+        """
+
+        del cmd, cmd_args # unused
+        (m_wall, m_cpu, m_redraws) = self._perf_mark
+        self._perf_mark = (time.monotonic(), time.process_time(), self.redraws)
+        elapsed = max(self._perf_mark[0] - m_wall, 0.001)
+        self.putline('resp', "Perf: {:.1f} redraws/min, CPU {:.2f}% over {:.0f}s".format(
+            (self.redraws - m_redraws) * 60.0 / elapsed,
+            (self._perf_mark[1] - m_cpu) * 100.0 / elapsed,
+            elapsed))
+
+    def cmd_log(self, cmd, cmd_args):
+        """Write the ring of recent log records to the dump file
+
+        Args:
+            cmd (str): The command entered (unused)
+            cmd_args (str): "dump"
+        """
+
+        del cmd # unused
+        if cmd_args != 'dump':
+            self.message("Usage: log dump")
+        elif self.log_pipeline.dump():
+            self.putline('resp', "Log: ring written to {}".format(self.log_pipeline.ring.dumpfile))
+        else:
+            self.message("Log: no ring, logring=0")
+
+    def cmd_mem(self, cmd, cmd_args):
+        """Trace allocations and show the sites that grew since tracing started
+
+        Args:
+            cmd (str): The command entered (unused)
+            cmd_args (str): 'start [frames]', 'stop', '[top] [N]' or null for the top sites
+        """
+
+        del cmd # unused
+        (action, _, arg) = cmd_args.partition(' ')
+        if action.isdigit():
+            (action, arg) = ('top', action)
+        arg = arg.strip()
+
+        if action == 'start':
+            if self.memtracer.tracing:
+                self.message("Mem: already tracing")
+                return
+            self.memtracer.start(int(arg) if arg.isdigit() else 1)
+            self.putline('resp', "Mem: tracing")
+
+        elif action == 'stop':
+            self.memtracer.stop()
+            self.putline('resp', "Mem: stopped")
+
+        elif action in ('', 'top'):
+            if not self.memtracer.tracing:
+                self.message("Mem: not tracing, use mem start")
+                return
+            (current, peak) = self.memtracer.current()
+            self.putline('resp', "Mem: {:.1f} KiB traced, peak {:.1f} KiB; growth, size, count, site".format(
+                current / 1024, peak / 1024))
+            for stat in self.memtracer.top(int(arg) if arg.isdigit() else 10):
+                self.putline('resp', "Mem: " + format_stat(stat))
+
+        else:
+            self.message("Usage: mem start [frames] | stop | [top] [N]")
+
+    def cmd_prof(self, cmd, cmd_args):
+        """Start or stop the sampling profiler
+
+        Stopping writes the collapsed stacks (for flame graphs) and shows the
+        functions with the most samples.
+
+        Args:
+            cmd (str): The command entered (unused)
+            cmd_args (str): 'start [interval ms]', 'stop [file]' or null for the status
+        """
+
+        del cmd # unused
+        (action, _, arg) = cmd_args.partition(' ')
+        arg = arg.strip()
+
+        if action == 'start':
+            if self.profiler:
+                self.message("Profiler already running")
+                return
+            try:
+                interval = float(arg) / 1000 if arg else None
+            except ValueError:
+                self.message("Invalid interval: {}".format(arg))
+                return
+            self.profiler = SamplingProfiler(interval) if interval else SamplingProfiler()
+            self.profiler.start()
+            self.putline('resp', "Prof: sampling every {:.1f} ms".format(self.profiler.interval * 1000))
+
+        elif action == 'stop':
+            if not self.profiler:
+                self.message("Profiler not running")
+                return
+            profiler = self.profiler
+            self.profiler = None
+            profiler.stop()
+            filename = arg or self.config.get('scanmon', 'profile', fallback='scanmon.folded')
+            try:
+                profiler.write_collapsed(filename)
+            except OSError as err:
+                self.message("Prof: {}".format(err))
+            self.putline('resp', "Prof: {} samples in {:.1f}s to {}".format(
+                profiler.samples, profiler.elapsed, filename))
+            samples = max(profiler.samples, 1)
+            for (label, own, total) in profiler.top(self.config.getint('scanmon', 'proftop', fallback=10)):
+                self.putline('resp', "Prof: {:6.1f}% {:6.1f}% {}".format(
+                    own * 100.0 / samples, total * 100.0 / samples, label))
+
+        elif action == '':
+            self.putline('resp', "Prof: {}".format(
+                "{} samples".format(self.profiler.samples) if self.profiler else "Stopped"))
+
+        else:
+            self.message("Usage: prof start [ms] | stop [file]")
+
+    def cmd_sig(self, cmd, cmd_args):
+        """Show the stored signal strength, by channel or of the recent receptions
+
+        Args:
+            cmd (str): The command entered (unused)
+            cmd_args (str): '[hours]' for the channels, weakest first, over the
+                last hours (default 24) or 'recent [N]' for the last N receptions
+        """
+
+        del cmd # unused
+        (action, _, arg) = cmd_args.partition(' ')
+        arg = arg.strip()
+        dbconn = self.glgmonitor.dbconn
+
+        try:
+            if action == 'recent':
+                rows = signalseries.receptions(dbconn, limit=int(arg) if arg else 10)
+                for row in rows:
+                    self.putline('resp', "Sig: {:%m-%d %H:%M:%S} {}-{}-{} {} n={} {}/{:.1f}/{}".format(
+                        row['Starttime'], row['System'], row['Group'], row['Channel'],
+                        row['SignalKind'], row['Samples'],
+                        row['SignalMin'], row['SignalMean'], row['SignalMax']))
+            else:
+                hours = float(action) if action else 24.0
+                since = datetime.datetime.now() - datetime.timedelta(hours=hours)
+                rows = signalseries.channels(dbconn, since=since, limit=10)
+                for row in rows:
+                    self.putline('resp', "Sig: {}-{}-{} {} x{} {}/{:.1f}/{}".format(
+                        row['System'], row['Group'], row['Channel'], row['SignalKind'],
+                        row['Receptions'], row['SignalMin'], row['SignalMean'], row['SignalMax']))
+        except ValueError:
+            self.message("Usage: sig [hours] | recent [N]")
+            return
+
+        if not rows:
+            self.putline('resp', "Sig: no samples, needs signalpoll and dblevel=detail")
+
+    def cmd_stats(self, cmd, cmd_args):
+        """Show the channel activity statistics or the recent anomalies
+
+        Args:
+            cmd (str): The command entered (unused)
+            cmd_args (str): '[N]' for the N (default 10) busiest channels now or
+                'anomalies [N]' for the last N anomalies
+        """
+
+        del cmd # unused
+        stats = self.glgmonitor.stats
+        if stats is None:
+            self.message("Stats: off, needs chanstats=true")
+            return
+
+        (action, _, arg) = cmd_args.partition(' ')
+        try:
+            if action == 'anomalies':
+                count = int(arg) if arg.strip() else 10
+                for (utc_ms, key, kind, description) in stats.anomalies[-count:]:
+                    self.putline('resp', "Stats: {:%m-%d %H:%M:%S} {} {}: {}".format(
+                        datetime.datetime.fromtimestamp(utc_ms / 1000.0), kind, '-'.join(key), description))
+                return
+            count = int(action) if action else 10
+        except ValueError:
+            self.message("Usage: stats [N] | anomalies [N]")
+            return
+
+        metrics = stats.metrics(int(time.time() * 1000))
+        for (key, values) in sorted(metrics.items(), key=lambda item: -item[1]['rate'])[:count]:
+            self.putline('resp', "Stats: {} x{} {:.1f}/h ({:.1f} usual) dur {:.1f}/{:.1f} s".format(
+                '-'.join(key), values['count'], values['rate'], values['expected'],
+                values['p50_ms'] / 1000.0, values['p90_ms'] / 1000.0))
+
+    def cmd_vol(self, cmd, cmd_args):
+        """Send the volume request to the scanner
+
+        Args:
+            cmd (str): The command entered (unused)
+            cmd_args (str): The volume number (0-29) or 'mute'
+        """
+
+        del cmd # unused
+
+        if len(cmd_args) > 0:
+            vol = ','
+            if cmd_args == 'mute':
+                vol += '0'
+            else:
+                vol += cmd_args
+        else:
+            vol = ''
+
+        vol_cmd = Command('VOL' + vol)
+        self.scanner.send_command(vol_cmd)
+
+    def cmd_cmd(self, cmd, cmd_args):
+        """Proccess a request to send a scanner command.
+
+        Args:
+            cmd (str): The command entered (unused)
+            cmd_args (str): The command to send to the scanner
+        """
+
+        del cmd # Unused
+        cmd_args = cmd_args.lstrip()
+
+        # Split out the command and make it uppercase
+        (cmd, sep, rest) = cmd_args.partition(',')
+        cmd = cmd.upper()
+
+        # Put it back together
+        cmd_args = cmd + sep + rest
+
+        self.scanner.send_command(Command(cmd_args))
+
+    def cmd_autocmd(self, cmd, cmd_args):
+        """Display or set/reset the autocommand setting.
+
+        Args:
+            command (str): the command line as entered
+            cmd ([str]): the list [0] = 'autocmd', [1] = 'on', 'off', or None
+        """
+
+        del cmd # unused
+        if len(cmd_args) > 1:
+            self.autocmd = cmd_args == 'on'
+
+        self.message("autocommand is {}".format('on' if self.autocmd else 'off'))
+
+    def cmd_quit(self, cmd, cmd_args):
+        """Process a quit command.
+
+        Args:
+            command (str): the command line as entered
+            cmd ([str]): the list [0] = 'quit', [1] = **ignored**
+        """
+
+        del cmd, cmd_args # unused
+        self.message('Quitting...')
+        self.__logger.info('Quitting...')
+        self.running = False
+        raise ExitMainLoop
+
+    def set_automute(self, mute_t):
+        """Set the automute time.
+
+        Args:
+            mute_t (datetime): New automute time or None to cancel
+        """
+
+        if self.automute:
+            # First, cancel any existing automute
+            (_, t_handle) = self.automute
+            self.remove_alarm(t_handle)
+            self.automute = None
+
+        if mute_t:
+            self.automute = (mute_t, self.set_alarm_at(mute_t.timestamp(), self.do_automute))
+            self.message("Auto mute set to {}".format(mute_t.isoformat()))
+
+    def _mute_time(self, ctime):
+        """Make a datetime for today at "ctime" time
+        """
+        try:
+            newtime = datetime.datetime.strptime(ctime, "%H:%M")
+        except ValueError:
+            self.message("Invalid time for automute")
+            return None
+
+        thisday = datetime.date.today()
+        thistime = datetime.time(newtime.hour, newtime.minute, 0)
+        mute_t = datetime.datetime.combine(thisday, thistime)
+
+        while mute_t < datetime.datetime.today():
+            mute_t += datetime.timedelta(days=1)
+
+        return mute_t
+
+    def cmd_automute(self, cmd, cmd_args):
+        """Set or unset time to automatically mute the scanner.
+
+        Args:
+            cmd (str): "automute"
+            cmd_args (str): Either a time or "off"
+        """
+
+        if cmd_args == "":
+            if self.automute:
+                (m_time, _) = self.automute
+                ans = m_time.strftime(Scanmon._DATETIMEFMT)
+            else:
+                ans = "Off"
+
+            self.putline('resp', "Automute: {}".format(ans))
+
+        elif cmd_args == "off":
+            self.set_automute(None)
+
+            self.putline('resp', "Automute: Off")
+
+        else:
+            mute_t = self._mute_time(cmd_args)
+
+            if mute_t is not None:
+                self.set_automute(mute_t)
+                self.putline('resp', "Automute: {}".format(mute_t.strftime(Scanmon._DATETIMEFMT)))
+
+    def do_automute(self, win, user_data=None):
+        """Execute mute (VOL,0) and update the automute time if set.
+
+        Args:
+            none
+        """
+
+        self.cmd_vol("VOL", "0")
+        if self.automute:
+            (mute_t, _) = self.automute
+            mute_t = mute_t + datetime.timedelta(days=1)
+            self.set_automute(mute_t)
+            self.message("Auto muted")
+        else:
+            self.__logger.error("Automute called for no reason")
+            self.message("Automute called for no reason")
+
+    def dispatch_command(self, inputstr):
+        """Process commands.
+
+        Args:
+            inputstr (str): The user-entered command.
+        """
+
+        self.__logger.info('dispatch_command: Handling "%s"', inputstr)
+        (cmd, _, cmd_args) = inputstr.partition(' ')
+        cmd_method = 'cmd_' + cmd.strip()
+        cmd_args = cmd_args.lstrip()
+
+        handler = getattr(self, cmd_method, None)
+
+        if handler:
+            self.putline('resp', "CMD: {}".format(inputstr))
+
+        elif self.autocmd:
+            handler = self.cmd_cmd
+            cmd_args = inputstr
+
+        if handler:
+            handler(cmd, cmd_args)
+
+        else:
+            self.message("Unknown command: {}".format(inputstr))
+
+    def set_disp(self, cmd, resp):
+        """Set version in main window
+
+        Args:
+            cmd (Command): scanner command
+            resp (Response): scanner response
+        """
+
+        self.__logger.info("Setting response: %s", resp.parts[1])
+        cmd.userdata(resp.parts[1])
+
+    def run(self):
+        """Initialize the window, initialize and start the threads
+        Read and process commands from the monitor window.
+
+        """
+
+        if self.config.getboolean('monitor', 'start', fallback=True):
+            self.glgmonitor.start()
+
+        self.scanner.send_command(Command('VER', callback=self.set_disp, userdata=self.ver.set_text))
+        self.scanner.send_command(Command('MDL', callback=self.set_disp, userdata=self.mdl.set_text))
+
+        self.running = True
+        super().run()                   # Start the whole thing going
+
+
+    def close(self):
+        """Close the scanner and the main window."""
+        if self.profiler:
+            self.profiler.stop()
+        self.scanner.close()
+        self.glgmonitor.close()
+        self.log_pipeline.stop()
+
+    def merge_config(self, args, argmap):
+        """Merge an commandline arguments into the config.ini configuration.
+        """
+
+        return scanconfig.merge_config(args, argmap)
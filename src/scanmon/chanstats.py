@@ -0,0 +1,343 @@
+"""
+Chanstats - Streaming activity statistics of each channel, and anomalies.
+
+`Source <src/scanmon.chanstats.html>`__
+
+Every completed Reception updates the :class:`ChannelStats` of its
+System-Group-Channel, a fixed size record:
+
+* an exponentially weighted reception rate (receptions per hour, one hour time
+  constant),
+* a duration sketch of log spaced bins, each 12% wider than the one before, from
+  which the percentiles are read to within a bin (relative error about 6%),
+* an hour-of-week baseline: the exponentially weighted mean number of
+  receptions in each of the 168 hours of the week. Weeks without activity in an
+  hour are decayed when the hour is next seen.
+
+Anomalies are checked as each Reception is added:
+
+* ``busy``: the receptions so far this hour are improbable (Poisson tail below
+  :data:`PVALUE`) against the baseline of the hour and over :data:`BUSYFACTOR`
+  times it, once the channel has :data:`WARMUP` weeks of baseline. The factor
+  allows for the baseline being an estimate. Flagged once an hour.
+* ``long``: the duration is over :data:`LONGFACTOR` times the 99th percentile,
+  once :data:`MINSAMPLES` durations are in the sketch.
+
+:class:`ActivityStats` holds the channels and checkpoints the changed ones into
+the ``ChannelStats`` table of the monitor database, so the weeks of baseline
+survive a restart.
+"""
+
+import logging
+import math
+import sqlite3
+import struct
+import sys
+from array import array
+
+RATE_TAU = 3600.0   # Seconds, rate time constant
+BINS = 96           # Duration sketch bins ...
+BIN_BASE = 100      # ... the first ends at 100 ms ...
+BIN_GROWTH = 1.12   # ... each 12% wider, the last is over 5 hours
+SKETCH_MAX = 1 << 20    # Sketch total at which the counts are halved
+SLOTS = 168         # Hours in a week
+ALPHA = 0.1         # Baseline weight of the latest week
+WARMUP = 3          # Weeks of baseline before busy is flagged
+MINBUSY = 5         # Receptions in an hour before it can be busy ...
+BUSYFACTOR = 3.0    # ... and times the expected receptions
+PVALUE = 1e-4       # Poisson tail probability that is busy
+FLOOR = 0.05        # Lowest expected receptions in an hour
+LONGFACTOR = 2.0    # Times the 99th percentile that is long
+MINSAMPLES = 100    # Durations in the sketch before long is flagged
+CHECKPOINT = 300.0  # Seconds between checkpoints
+
+_HOUR_MS = 3600 * 1000
+_WEEK_HOURS = SLOTS
+_LOG_GROWTH = math.log(BIN_GROWTH)
+_HEADER = struct.Struct('<Bdqqqqiq')    # version, rate, rate_ms, count, first_hour, hour, hour_count, busy
+_VERSION = 1
+
+def poisson_tail(count, expected):
+    """P(X >= count) for a Poisson X with the expected mean.
+    """
+
+    term = math.exp(-expected)
+    below = 0.0
+    for k in range(count):
+        below += term
+        term *= expected / (k + 1)
+    return max(1.0 - below, 0.0)
+
+def _bin(duration_ms):
+    """The sketch bin of a duration
+    """
+
+    if duration_ms <= BIN_BASE:
+        return 0
+    return min(int(math.log(duration_ms / BIN_BASE) / _LOG_GROWTH) + 1, BINS - 1)
+
+def _bin_ms(index):
+    """The middle of a sketch bin in ms
+    """
+
+    if index == 0:
+        return BIN_BASE / 2.0
+    return BIN_BASE * BIN_GROWTH ** (index - 0.5)
+
+class ChannelStats(object):
+    """Activity statistics of one System-Group-Channel.
+
+    All times are UTC ms, as the Reception's start_utc_ms, so the state can be
+    saved and continued across restarts.
+
+    Attributes:
+        count (int): Receptions added
+        sketch (array('f')): Duration counts in log spaced bins
+        baseline (array('f')): Mean receptions in each hour of the week
+        weeks (array('l')): Week each baseline hour was last updated, -1 never
+    """
+
+    __slots__ = ('rate', 'rate_ms', 'count', 'first_hour', 'hour', 'hour_count', 'busy',
+                 'sketch', 'baseline', 'weeks')
+
+    def __init__(self):
+        self.rate = 0.0             # Receptions per hour at rate_ms
+        self.rate_ms = 0
+        self.count = 0
+        self.first_hour = -1        # Hour (since the epoch) of the first reception
+        self.hour = -1              # Hour being counted ...
+        self.hour_count = 0         # ... and its receptions so far
+        self.busy = -1              # Hour last flagged busy
+        self.sketch = array('f', bytes(4 * BINS))
+        self.baseline = array('f', bytes(4 * SLOTS))
+        self.weeks = array('l', [-1] * SLOTS)
+
+    def add(self, start_utc_ms, duration_ms):
+        """Add a completed Reception.
+
+        Args:
+            start_utc_ms (int): Start, UTC ms since the epoch
+            duration_ms (int): Duration in ms
+
+        Returns:
+            [(kind, description), ...] of the anomalies found, usually empty
+        """
+
+        anomalies = []
+        if self.count:
+            self.rate *= math.exp(-max(start_utc_ms - self.rate_ms, 0) / 1000.0 / RATE_TAU)
+        self.rate += 3600.0 / RATE_TAU
+        self.rate_ms = start_utc_ms
+        self.count += 1
+
+        hour = start_utc_ms // _HOUR_MS
+        if self.first_hour < 0:
+            self.first_hour = hour
+        if hour != self.hour:
+            if self.hour >= 0 and hour > self.hour:
+                self._close_hour()
+            self.hour = hour
+            self.hour_count = 0
+        self.hour_count += 1
+
+        if self.busy != hour and self.hour_count >= MINBUSY \
+                and (hour - self.first_hour) // _WEEK_HOURS >= WARMUP:
+            expected = self.expected(hour)
+            if self.hour_count >= BUSYFACTOR * expected \
+                    and poisson_tail(self.hour_count, expected) < PVALUE:
+                self.busy = hour
+                anomalies.append(('busy', '{} receptions this hour, {:.1f} expected'.format(
+                    self.hour_count, expected)))
+
+        samples = sum(self.sketch)
+        if samples >= MINSAMPLES:
+            p99 = self.percentile(0.99)
+            if duration_ms > LONGFACTOR * p99:
+                anomalies.append(('long', '{:.1f} s, 99% are under {:.1f} s'.format(
+                    duration_ms / 1000.0, p99 / 1000.0)))
+        self.sketch[_bin(duration_ms)] += 1.0
+        if samples + 1 >= SKETCH_MAX:
+            for index in range(BINS):
+                self.sketch[index] /= 2.0
+
+        return anomalies
+
+    def _close_hour(self):
+        """Fold the finished hour's count into its baseline hour
+        """
+
+        slot = self.hour % SLOTS
+        week = self.hour // _WEEK_HOURS
+        # A running mean over the weeks the channel was seen until there are enough for ALPHA
+        weight = max(ALPHA, 1.0 / (week - self.first_hour // _WEEK_HOURS + 1))
+        self.baseline[slot] = self._decayed(slot, week) * (1.0 - weight) + weight * self.hour_count
+        self.weeks[slot] = week
+
+    def _decayed(self, slot, week):
+        """The baseline of a slot after the weeks it was not seen, up to *week*
+        """
+
+        if self.weeks[slot] < 0:
+            return 0.0
+        return self.baseline[slot] * (1.0 - ALPHA) ** max(week - self.weeks[slot] - 1, 0)
+
+    def expected(self, hour):
+        """Receptions expected in an hour (since the epoch), at least :data:`FLOOR`
+        """
+
+        return max(self._decayed(hour % SLOTS, hour // _WEEK_HOURS), FLOOR)
+
+    def rate_at(self, utc_ms):
+        """Receptions per hour, decayed to a time
+        """
+
+        return self.rate * math.exp(-max(utc_ms - self.rate_ms, 0) / 1000.0 / RATE_TAU)
+
+    def percentile(self, fraction):
+        """Duration in ms under which *fraction* of the durations are, None if empty
+        """
+
+        total = sum(self.sketch)
+        if not total:
+            return None
+        wanted = fraction * total
+        seen = 0.0
+        for (index, count) in enumerate(self.sketch):
+            seen += count
+            if seen >= wanted and count:
+                return _bin_ms(index)
+        return _bin_ms(BINS - 1)
+
+    def to_blob(self):
+        """The state as little endian bytes
+        """
+
+        arrays = (self.sketch, self.baseline, array('q', self.weeks))
+        if sys.byteorder != 'little':
+            arrays = tuple(array(part.typecode, part) for part in arrays)
+            for part in arrays:
+                part.byteswap()
+        return _HEADER.pack(_VERSION, self.rate, self.rate_ms, self.count, self.first_hour,
+                            self.hour, self.hour_count, self.busy) \
+            + b''.join(part.tobytes() for part in arrays)
+
+    @classmethod
+    def from_blob(cls, blob):
+        """Rebuild the state saved by :meth:`to_blob`.
+
+        Raises:
+            ValueError: Not a state of this version
+        """
+
+        if len(blob) != _HEADER.size + 4 * BINS + 4 * SLOTS + 8 * SLOTS or blob[0] != _VERSION:
+            raise ValueError("Not a version {} channel state".format(_VERSION))
+
+        stats = cls()
+        (_, stats.rate, stats.rate_ms, stats.count, stats.first_hour, stats.hour,
+         stats.hour_count, stats.busy) = _HEADER.unpack_from(blob)
+        offset = _HEADER.size
+        parts = []
+        for (typecode, size, length) in (('f', 4, BINS), ('f', 4, SLOTS), ('q', 8, SLOTS)):
+            part = array(typecode)
+            part.frombytes(blob[offset:offset + size * length])
+            if sys.byteorder != 'little':
+                part.byteswap()
+            parts.append(part)
+            offset += size * length
+        (stats.sketch, stats.baseline, weeks) = parts
+        stats.weeks = array('l', weeks)
+        return stats
+
+class ActivityStats(object):
+    """The ChannelStats of every channel, checkpointed in the monitor database.
+
+    Args:
+        dbconn (sqlite3.Connection): The monitor database, None to keep nothing
+    """
+
+    def __init__(self, dbconn=None):
+        self.__logger = logging.getLogger(__name__).getChild(type(self).__name__)
+        self.channels = {}      # (system, group, channel) to ChannelStats
+        self.dirty = set()
+        self.anomalies = []     # Recent (utc ms, key, kind, description), newest last
+        self.dbconn = dbconn
+        if dbconn is not None:
+            self.load()
+
+    def load(self):
+        """Create the ChannelStats table and read the saved states.
+        """
+
+        self.dbconn.execute("""CREATE TABLE IF NOT EXISTS "ChannelStats"
+            ("System" text,
+             "Group" text,
+             "Channel" text,
+             "State" blob,
+             PRIMARY KEY ("System", "Group", "Channel"))""")
+        for row in self.dbconn.execute('SELECT "System", "Group", "Channel", "State" FROM "ChannelStats"'):
+            try:
+                self.channels[(row[0], row[1], row[2])] = ChannelStats.from_blob(row[3])
+            except (ValueError, struct.error) as err:
+                self.__logger.warning("Channel state %s-%s-%s dropped: %s", row[0], row[1], row[2], err)
+        self.__logger.info("%d channel states loaded", len(self.channels))
+
+    def checkpoint(self):
+        """Save the channels changed since the last checkpoint.
+        """
+
+        if self.dbconn is None or not self.dirty:
+            return
+        try:
+            self.dbconn.execute('BEGIN')
+            self.dbconn.executemany(
+                'INSERT OR REPLACE INTO "ChannelStats" ("System", "Group", "Channel", "State") '
+                'VALUES (?, ?, ?, ?)',
+                [key + (self.channels[key].to_blob(),) for key in self.dirty])
+            self.dbconn.execute('COMMIT')
+            self.dirty.clear()
+        except sqlite3.Error:
+            self.__logger.exception("Error saving channel statistics")
+            if self.dbconn.in_transaction:
+                self.dbconn.execute('ROLLBACK')
+
+    def add(self, reception):
+        """Add a completed Reception.
+
+        Args:
+            reception (Reception): Uses system, group, channel, start_utc_ms and duration_ms
+
+        Returns:
+            [(kind, description), ...] of the anomalies found
+        """
+
+        key = (reception.system, reception.group, reception.channel)
+        stats = self.channels.get(key)
+        if stats is None:
+            stats = self.channels[key] = ChannelStats()
+        self.dirty.add(key)
+        anomalies = stats.add(reception.start_utc_ms, reception.duration_ms)
+        for (kind, description) in anomalies:
+            self.anomalies.append((reception.start_utc_ms, key, kind, description))
+        if len(self.anomalies) > 2 * SLOTS:
+            del self.anomalies[:SLOTS]
+        return anomalies
+
+    def metrics(self, utc_ms):
+        """A snapshot of every channel.
+
+        Args:
+            utc_ms (int): Now, UTC ms since the epoch
+
+        Returns:
+            {(system, group, channel): {'count', 'rate', 'expected', 'p50_ms',
+            'p90_ms', 'p99_ms'}, ...}, the rate and expected in receptions per hour
+        """
+
+        hour = utc_ms // _HOUR_MS
+        return {key: {'count': stats.count,
+                      'rate': stats.rate_at(utc_ms),
+                      'expected': stats.expected(hour),
+                      'p50_ms': stats.percentile(0.5),
+                      'p90_ms': stats.percentile(0.9),
+                      'p99_ms': stats.percentile(0.99)}
+                for (key, stats) in self.channels.items()}
@@ -0,0 +1,130 @@
+"""
+Scanmon configuration - Merge config.ini with the command line and check it.
+
+`Source <src/scanmon.config.html>`__
+
+Only the standard library (and scanmon.alerts and scanmon.address, which also
+use only the standard library) is used here so that checking a configuration does not load
+the display, scanner or HTTP code.
+"""
+
+import configparser
+import datetime
+import os
+import stat
+
+from scanmon.alerts import AlertRules
+from scanmon.address import parse_address
+
+SECTIONS = ('scanmon', 'monitor', 'window', 'scanner')
+DBLEVELS = ('summary', 'detail', 'both')
+SIGNALPOLLS = ('off', 'pwr', 'sts')
+
+def merge_config(args, argmap):
+    """Merge an commandline arguments into the config.ini configuration.
+
+    Args:
+        args: An args object from argparser, args.config names the file
+        argmap (dict): Argument name to (section, option)
+
+    Returns:
+        configparser.ConfigParser
+    """
+
+    configfile_name = args.config
+    assert configfile_name is not None and configfile_name != '', 'Invalid config file'
+    config = configparser.ConfigParser()
+    for sname in SECTIONS:
+        config.add_section(sname)
+
+    with open(configfile_name, 'r') as configfile:
+        config.read_file(configfile)
+
+    for key, val in argmap.items():
+        if key in args:
+            config[val[0]][val[1]] = str(vars(args)[key])
+
+    return config
+
+def check_config(config):
+    """Check the values in a merged configuration.
+
+    Args:
+        config (configparser.ConfigParser): The merged configuration
+
+    Returns:
+        A list of problems, empty if the configuration is usable
+    """
+
+    problems = []
+
+    def check(section, option, convert):
+        """Convert one option if it is present, note a failure"""
+        value = config.get(section, option, fallback=None)
+        if value is not None:
+            try:
+                convert(section, option)
+            except ValueError as err:
+                problems.append('[{}] {}={}: {}'.format(section, option, value, err))
+
+    check('scanmon', 'debug', config.getboolean)
+    check('scanmon', 'logring', config.getint)
+    check('scanmon', 'proftop', config.getint)
+    check('monitor', 'start', config.getboolean)
+    check('monitor', 'titleupdate', config.getboolean)
+    check('monitor', 'timeout', config.getfloat)
+    check('monitor', 'history', config.getint)
+    check('monitor', 'statuspoll', config.getboolean)
+    check('monitor', 'chanstats', config.getboolean)
+    check('monitor', 'icecastport', config.getint)
+    check('monitor', 'preroll', config.getfloat)
+    check('monitor', 'postroll', config.getfloat)
+    check('monitor', 'cliplatency', config.getfloat)
+    check('monitor', 'clipbuffer', config.getint)
+    check('monitor', 'clipbyterate', config.getint)
+    check('monitor', 'squelchrefine', config.getboolean)
+    check('monitor', 'pcmrate', config.getint)
+    check('monitor', 'squelchdb', config.getfloat)
+    check('monitor', 'publish', lambda section, option: parse_address(config.get(section, option)))
+    check('aggregator', 'listen', lambda section, option: parse_address(config.get(section, option)))
+    check('aggregator', 'window', config.getfloat)
+    check('window', 'scrollback', config.getint)
+    check('window', 'fps', config.getfloat)
+    check('scanner', 'capturesize', config.getint)
+    check('scanner', 'captureid', config.getint)
+
+    dblevel = config.get('monitor', 'dblevel', fallback='summary').lower()
+    if dblevel not in DBLEVELS:
+        problems.append('[monitor] dblevel={}: not one of {}'.format(dblevel, ', '.join(DBLEVELS)))
+
+    signalpoll = config.get('monitor', 'signalpoll', fallback='off').lower()
+    if signalpoll not in SIGNALPOLLS:
+        problems.append('[monitor] signalpoll={}: not one of {}'.format(signalpoll, ', '.join(SIGNALPOLLS)))
+
+    automute = config.get('monitor', 'automute', fallback='off')
+    if automute != 'off':
+        try:
+            datetime.datetime.strptime(automute, '%H:%M')
+        except ValueError:
+            problems.append('[monitor] automute={}: not HH:MM or off'.format(automute))
+
+    captureformat = config.get('scanner', 'captureformat', fallback='raw')
+    if captureformat not in ('raw', 'rle'):
+        problems.append('[scanner] captureformat={}: not raw or rle'.format(captureformat))
+
+    try:
+        AlertRules.from_config(config)
+    except ValueError as err:
+        problems.append(str(err))
+
+    devices = config.get('scanner', 'device', fallback='/dev/ttyUSB0,/dev/ttyUSB1').split(',')
+    for dev in devices:
+        try:
+            if stat.S_ISCHR(os.stat(dev).st_mode) and os.access(dev, os.W_OK):
+                break
+        except OSError:
+            pass
+    else:
+        problems.append('[scanner] device={}: no usable device'.format(','.join(devices)))
+
+    return problems
@@ -0,0 +1,236 @@
+"""
+Enrich - Agency, service type and tags of a Reception from a reference CSV.
+
+`Source <src/scanmon.enrich.html>`__
+
+The reference is a CSV file with a header row and the columns::
+
+    frequency,high,tgid,system,agency,service,tags
+    154.1000,,,,Fairfield County Fire,Fire Dispatch,fire;dispatch
+    450.0000,470.0000,,,,Business,
+    ,,1054,Trunk 0,State Police,Law Tac,police;tac
+
+A row with ``tgid`` is a talkgroup, in ``system`` or in any system when that is
+empty. Otherwise ``frequency`` (MHz) is a frequency, or the start of a range that
+ends at ``high``. When ranges overlap the narrowest one wins, and of repeated
+rows the last.
+
+The frequencies are compiled into a sorted array of segment starts, each with the
+entry covering it, and the talkgroups into a sorted array of (system, TGID) keys,
+so a lookup is one bisect. Agencies, services and tag sets are identified by a
+CRC32 of their text so the ids stored with the Receptions stay the same when the
+reference is edited. The compiled index is kept next to the CSV (``.idx``) and
+used while the CSV is unchanged.
+"""
+
+import bisect
+import csv
+import heapq
+import logging
+import math
+import os
+import pickle
+import zlib
+from array import array
+
+FORMAT = 1      # Version of the compiled index
+_NOENTRY = -1
+_TGIDSHIFT = 32
+
+def parse_frq_tgid(frq_tgid):
+    """Split a GLG FRQ_TGID into integers.
+
+    Args:
+        frq_tgid (str): Frequency in MHz (with a decimal point) or a TGID
+
+    Returns:
+        (hertz, tgid) with the one that does not apply None, both None if garbled
+    """
+
+    text = frq_tgid.strip() if frq_tgid else ''
+    (whole, point, fraction) = text.partition('.')
+    try:
+        if point:
+            fraction = (fraction + '000000')[:6]
+            return (int(whole or '0') * 1000000 + int(fraction), None)
+        return (None, int(whole))
+    except ValueError:
+        return (None, None)
+
+def display_frequency(hertz, tgid):
+    """The Freq shown for a Reception: MHz, the TGID as a number or NaN
+    """
+
+    if hertz is not None:
+        return hertz / 1000000.0
+    return float(tgid) if tgid is not None else math.nan
+
+def text_id(text):
+    """The stable id of an agency, service or tag set, 0 for none
+    """
+
+    return zlib.crc32(text.encode('utf-8')) if text else 0
+
+class ReferenceIndex(object):
+    """Frequency and talkgroup lookup over a reference CSV.
+
+    Attributes:
+        names (dict): id to agency, service or tag set text
+        entries (int): Reference rows loaded
+    """
+
+    def __init__(self):
+        self.__logger = logging.getLogger(__name__).getChild(type(self).__name__)
+        self.names = {0: ''}
+        self.entries = 0
+        self.agency = array('L')        # Entry to agency id
+        self.service = array('L')       # Entry to service id
+        self.tagset = array('L')        # Entry to tag set id
+        self.seg_start = array('q')     # Segment start in Hz ...
+        self.seg_entry = array('l')     # ... and the entry covering it, up to the next start
+        self.tg_key = array('q')        # (system id << 32) + TGID, sorted ...
+        self.tg_entry = array('l')      # ... and its entry
+        self.systems = {}               # Lower case system name to id, 0 is any system
+
+    @classmethod
+    def load(cls, csvpath, cachepath=None):
+        """Load a reference, from the compiled index if it is up to date.
+
+        Args:
+            csvpath (str): The reference CSV
+            cachepath (str): Optional. The compiled index, default csvpath + '.idx'
+
+        Raises:
+            OSError: The CSV cannot be read
+        """
+
+        cachepath = cachepath or csvpath + '.idx'
+        source = os.stat(csvpath)
+        stamp = (FORMAT, source.st_size, source.st_mtime_ns)
+        index = cls()
+        try:
+            with open(cachepath, 'rb') as cachefile:
+                state = pickle.load(cachefile)
+            if state.pop('stamp') == stamp:
+                index.__dict__.update(state)
+                return index
+        except (OSError, EOFError, pickle.UnpicklingError, KeyError, AttributeError):
+            pass
+
+        index.compile(csvpath)
+        state = {name: value for (name, value) in index.__dict__.items() if not name.startswith('_')}
+        state['stamp'] = stamp
+        try:
+            with open(cachepath + '.tmp', 'wb') as cachefile:
+                pickle.dump(state, cachefile, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(cachepath + '.tmp', cachepath)
+        except OSError as err:
+            index.__logger.warning("Cannot write the compiled reference %s: %s", cachepath, err)
+        return index
+
+    def _name_id(self, text):
+        """Id of a text, remembering the text
+        """
+
+        ident = text_id(text)
+        self.names.setdefault(ident, text)
+        return ident
+
+    def compile(self, csvpath):
+        """Read the CSV and build the arrays.
+        """
+
+        intervals = []      # (low, high + 1, entry)
+        talkgroups = []     # (key, entry)
+        with open(csvpath, newline='', encoding='utf-8') as csvfile:
+            for (line, row) in enumerate(csv.DictReader(csvfile), start=2):
+                entry = self.entries
+                tags = ';'.join(sorted(tag.strip() for tag in (row.get('tags') or '').split(';')
+                                       if tag.strip()))
+                tgid = (row.get('tgid') or '').strip()
+                if tgid:
+                    try:
+                        tgid = int(tgid)
+                    except ValueError:
+                        self.__logger.warning("%s:%d: invalid tgid %r", csvpath, line, tgid)
+                        continue
+                    system = (row.get('system') or '').strip().lower()
+                    sysid = self.systems.setdefault(system, len(self.systems) + 1) if system else 0
+                    talkgroups.append(((sysid << _TGIDSHIFT) + tgid, entry))
+                else:
+                    (low, _) = parse_frq_tgid(row.get('frequency') or '')
+                    (high, _) = parse_frq_tgid(row.get('high') or '')
+                    if low is None:
+                        self.__logger.warning("%s:%d: no frequency or tgid", csvpath, line)
+                        continue
+                    high = low if high is None else high
+                    if high < low:
+                        (low, high) = (high, low)
+                    intervals.append((low, high + 1, entry))
+
+                self.agency.append(self._name_id((row.get('agency') or '').strip()))
+                self.service.append(self._name_id((row.get('service') or '').strip()))
+                self.tagset.append(self._name_id(tags))
+                self.entries += 1
+
+        self._build_segments(intervals)
+        talkgroups.sort()
+        self.tg_key = array('q', (key for (key, _) in talkgroups))
+        self.tg_entry = array('l', (entry for (_, entry) in talkgroups))
+
+    def _build_segments(self, intervals):
+        """Flatten the intervals into segments with the narrowest covering entry
+        """
+
+        starts = sorted(intervals)
+        bounds = sorted({low for (low, _, _) in intervals} | {end for (_, end, _) in intervals})
+        active = []         # (width, -entry, end)
+        pos = 0
+        for bound in bounds:
+            while pos < len(starts) and starts[pos][0] == bound:
+                (low, end, entry) = starts[pos]
+                heapq.heappush(active, (end - low, -entry, end))
+                pos += 1
+            # Wider intervals that ended under a narrower one are dropped when they surface
+            while active and active[0][2] <= bound:
+                heapq.heappop(active)
+            entry = -active[0][1] if active else _NOENTRY
+            if self.seg_entry and self.seg_entry[-1] == entry:
+                continue
+            self.seg_start.append(bound)
+            self.seg_entry.append(entry)
+
+    def frequency_entry(self, hertz):
+        """The entry covering a frequency, -1 if none
+        """
+
+        index = bisect.bisect_right(self.seg_start, hertz) - 1
+        return self.seg_entry[index] if index >= 0 else _NOENTRY
+
+    def talkgroup_entry(self, system, tgid):
+        """The entry of a talkgroup in a system, or in any system, -1 if none
+        """
+
+        sysid = self.systems.get(system.strip().lower(), -1) if system else -1
+        for key in ((sysid << _TGIDSHIFT) + tgid if sysid > 0 else None, tgid):
+            if key is None:
+                continue
+            index = bisect.bisect_right(self.tg_key, key) - 1     # The last row of a repeated key
+            if index >= 0 and self.tg_key[index] == key:
+                return self.tg_entry[index]
+        return _NOENTRY
+
+    def lookup(self, system, hertz, tgid):
+        """(agency id, service id, tag set id) of a frequency or talkgroup, zeros if not found
+        """
+
+        if hertz is not None:
+            entry = self.frequency_entry(hertz)
+        elif tgid is not None:
+            entry = self.talkgroup_entry(system, tgid)
+        else:
+            entry = _NOENTRY
+
+        if entry == _NOENTRY:
+            return (0, 0, 0)
+        return (self.agency[entry], self.service[entry], self.tagset[entry])
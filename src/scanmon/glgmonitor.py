@@ -3,18 +3,21 @@
 `Source <src/scanmon.glgmonitor.html>`__
 """
 
-from datetime import timedelta
+from datetime import datetime, timedelta
 
-import decimal
+import functools
 import logging
 import sqlite3
-import requests
 import threading
+import time
 import queue
 from urwid import WidgetPlaceholder, Text, Columns, Padding
 
-# Import our private modules
+# Import our private modules, the optional features import theirs when configured
+from scanmon.enrich import ReferenceIndex, parse_frq_tgid, display_frequency
+from scanmon.history import ReceptionHistory
 from scanmon.receivingstate import ReceivingState
+from scanmon.signalseries import SignalSeries, NO_SIGNAL
 from scanmon.scanner.formatter import Response
 from scanmon.scanner import Command
 
@@ -26,25 +29,38 @@ class Reception:
     """
 
     def __init__(self, glgresp):
+        # The wall clock anchors the start once, times within are monotonic ms
         self.starttime = glgresp.TIME
+        self.start_utc_ms = int(glgresp.TIME.timestamp() * 1000)
+        self.start_ms = glgresp.MONO_MS
         self.duration = 0
+        self.duration_ms = 0
         self.system = glgresp.NAME1
         self.group = glgresp.NAME2
         self.channel = glgresp.NAME3
         self.frequency_tgid = glgresp.FRQ_TGID
+        (self.frequency_hz, self.tgid) = parse_frq_tgid(glgresp.FRQ_TGID)
+        self.agency_id = None       # Reference ids, 0 when not in the reference
+        self.service_id = None
+        self.tagset_id = None
         self.ctcss_dcs = glgresp.CTCSS_DCS
         self.modulation = glgresp.MOD
         self.attenuation = glgresp.ATT
         self.system_tag = glgresp.SYS_TAG
         self.channel_tag = glgresp.CHAN_TAG
         self.p25nac = glgresp.P25NAC
-        self.last_active_time = self.starttime
+        self.last_active_ms = self.start_ms
         self.last_active_state = True
         self.lastseen = None
         self.info_widget = None
         self.duration_widget = None
         self.dur_widget = None
         self.infostring = ''
+        self.clip = None
+        self.rowid = None
+        self.history_row = None     # Row number in the ReceptionHistory
+        self.signal = None
+        self.alerts_pending = None  # Rules waiting for their minimum duration, longest first
 
     @property
     def sys_id(self):
@@ -53,6 +69,42 @@ class Reception:
 
         return '-'.join((self.system, self.group, self.channel,))
 
+    @property
+    def last_active_time(self):
+        """Wall clock time the reception was last active, from the start anchor
+        """
+
+        return self.starttime + timedelta(milliseconds=self.last_active_ms - self.start_ms)
+
+    def add_signal(self, kind, mono_ms, value):
+        """Add a signal strength sample.
+
+        Args:
+            kind (str): The poll, 'PWR' or 'STS'
+            mono_ms (int): Monotonic time of the response in ms
+            value (int): RSSI or signal level
+        """
+
+        if self.signal is None:
+            self.signal = SignalSeries(kind)
+        self.signal.append(mono_ms - self.start_ms, value)
+
+    def signal_columns(self):
+        """The signal columns of the Reception table as named parameters
+        """
+
+        return self.signal.columns() if self.signal else NO_SIGNAL
+
+    def enrich(self, reference):
+        """Set the agency, service and tag set ids from the reference.
+
+        Args:
+            reference (ReferenceIndex): The loaded reference
+        """
+
+        (self.agency_id, self.service_id, self.tagset_id) = reference.lookup(
+            self.system, self.frequency_hz, self.tgid)
+
     def __eq__(self, other):
         """Reception equality -- equal if System, Group, Channel, and Startime are equal
         """
@@ -86,15 +138,7 @@ class Titler(threading.Thread):
             self._updating = False
 
         self.__logger = logging.getLogger(__name__).getChild(type(self).__name__)
-        requests_log = logging.getLogger("urllib3")
-        requests_log.setLevel(logging.WARNING)
-        self._requests_session = requests.Session()
-        self._requests_session.auth = (
-            self.config.get('icecastid', fallback='admin'),
-            self.config.get('icecastpwd', fallback='hackme'))
-        titleparams = dict(Titler._TITLEPARAMS)
-        titleparams['mount'] = self.config.get('titlestream', fallback='/stream')
-        self._requests_session.params = titleparams
+        self._requests_session = None   # Set up by run, on the Titler thread
         self._title_queue = queue.Queue()
         self.daemon = True
         self.name = "**Titler**"
@@ -109,6 +153,19 @@ class Titler(threading.Thread):
         self._running = True
         self.__logger.info(type(self).__name__+': Running')
 
+        if self._updating:
+            # requests is slow to import, load it here rather than during startup
+            import requests
+            requests_log = logging.getLogger("urllib3")
+            requests_log.setLevel(logging.WARNING)
+            self._requests_session = requests.Session()
+            self._requests_session.auth = (
+                self.config.get('icecastid', fallback='admin'),
+                self.config.get('icecastpwd', fallback='hackme'))
+            titleparams = dict(Titler._TITLEPARAMS)
+            titleparams['mount'] = self.config.get('titlestream', fallback='/stream')
+            self._requests_session.params = titleparams
+
         while self._running:
             try:
                 new_title = self._title_queue.get(timeout=1)
@@ -134,7 +191,7 @@ class Titler(threading.Thread):
         """Put a new title into the input queue for pickup.
         """
 
-        self.__logger.debug("title: " + new_title)
+        self.__logger.debug("title: %s", new_title)
         self._title_queue.put(new_title)
 
     def check_error(self):
@@ -150,6 +207,7 @@ class Titler(threading.Thread):
         self.__logger.debug("update_title: %s", title)
 
         if self._updating:
+            import requests     # Already loaded by run
             try:
                 url = Titler._URL.format(host=self.config.get('icecasthost', fallback='localhost'),
                                        port=self.config.get('icecastport', fallback='8000'))
@@ -172,6 +230,7 @@ class GLGMonitor(ReceivingState):
     After initialization call process repeatedly to perform the monitoring."""
 
     IDLETIME = 11.0 # 11 seconds between transmissions is a new transmission
+    SIGNALPOLLS = ('off', 'pwr', 'sts')     # Signal strength poll while receiving
     TAGNONE = -1    # System and Channel tag NONE
     _TIMEFMT = '%H:%M:%S'
     _EPOCH = 3600 * 24 * 356    # A year of seconds (sort of ...)
@@ -208,6 +267,18 @@ class GLGMonitor(ReceivingState):
         self.reception = None
         self.state = GLGMonitor.IDLE
         self.idletime = GLGMonitor.IDLETIME
+        self.reception_count = 0
+        self.signal_cmd = None
+        self.statuspoll = False
+        self.reference = None
+        self._named_ids = {0}       # Reference ids already in the RefName table
+        self.alerts = None
+        self.alert_sink = None
+        self.stats = None
+        self.publisher = None
+        self.checkpoint_time = time.monotonic()
+        self.checkpoint_every = None
+        chanstats = False
 
         if config:
             if config.get('timeout', fallback=None) is not None:
@@ -222,7 +293,63 @@ class GLGMonitor(ReceivingState):
 
             dblevel = config.get('dblevel', fallback='summary').lower()
 
+            self.history = ReceptionHistory(config.getint('history', fallback=200000))
+
+            try:
+                self.statuspoll = config.getboolean('statuspoll', fallback=False)
+            except ValueError:
+                self.__logger.error("Invalid statuspoll: %s", config.get('statuspoll'))
+
+            if config.get('reference', fallback=None):
+                self.load_reference(config.get('reference'), config.get('referencecache', fallback=None))
+
+            if any(section.startswith('alert ') for section in config.parser.sections()):
+                from scanmon.alerts import AlertRules, AlertSink
+                try:
+                    alerts = AlertRules.from_config(config.parser)
+                    if alerts:
+                        self.alerts = alerts
+                        self.__logger.info("%d alert rules", len(alerts))
+                        if any('sink' in rule.actions for rule in alerts.rules):
+                            self.alert_sink = AlertSink()
+                            self.alert_sink.start()
+                except ValueError as err:
+                    self.__logger.error("Alert rules not loaded: %s", err)
+
+            try:
+                chanstats = config.getboolean('chanstats', fallback=False)
+            except ValueError:
+                self.__logger.error("Invalid chanstats: %s", config.get('chanstats'))
+
+            signalpoll = config.get('signalpoll', fallback='off').lower()
+            if signalpoll in GLGMonitor.SIGNALPOLLS:
+                self.signal_cmd = None if signalpoll == 'off' else signalpoll.upper()
+            else:
+                self.__logger.error("Invalid signalpoll: %s", signalpoll)
+
         self.__initdb__(dbname, dblevel)
+        if chanstats:
+            from scanmon.chanstats import ActivityStats, CHECKPOINT
+            self.stats = ActivityStats(self.dbconn)
+            self.checkpoint_every = CHECKPOINT
+
+        self.recorder = None
+        if config and config.get('clipsource', fallback=None):
+            from scanmon.recorder import ClipRecorder
+            self.recorder = ClipRecorder(config)
+            self.recorder.start()
+
+        if config and config.get('publish', fallback=None):
+            import socket
+            from scanmon.address import parse_address
+            from scanmon.publish import Publisher
+            try:
+                self.publisher = Publisher(config.get('node', fallback=socket.gethostname()),
+                                           parse_address(config.get('publish')),
+                                           config.get('publishspool', fallback='publish.db'))
+                self.publisher.start()
+            except ValueError as err:
+                self.__logger.error("Invalid publish address %s: %s", config.get('publish'), err)
 
         self.title_updater = Titler(config)
         self.title_updater.start()
@@ -239,11 +366,14 @@ class GLGMonitor(ReceivingState):
         self.ctcss_dcs = None
         self.frequency_tgid = None
         self.glgresp = None
+        self.glg_pending = None     # GLG waiting for its STS, with statuspoll
+        self.status = None          # Latest STS, with statuspoll
         self.group_name = None
         self.modulation = None
         self.mute = False
         self.p25nac = None
         self.receive_time = None
+        self.receive_ms = None
         self.system_name = None
         self.system_tag = None
 
@@ -274,13 +404,39 @@ class GLGMonitor(ReceivingState):
                  "Attenuation" boolean,
                  "SystemTag" integer,
                  "ChannelTag" integer,
-                 "P25NAC" text)"""
+                 "P25NAC" text,
+                 "Clip" text,
+                 "DurationMs" integer,
+                 "StartUtcMs" integer,
+                 "SignalKind" text,
+                 "Signal" blob,
+                 "SignalMin" integer,
+                 "SignalMean" real,
+                 "SignalMax" integer,
+                 "FrequencyHz" integer,
+                 "TGID" integer,
+                 "AgencyId" integer,
+                 "ServiceId" integer,
+                 "TagSetId" integer)"""
             self.dbconn.execute(create)
+            columns = [row['name'] for row in self.dbconn.execute('PRAGMA table_info("Reception")')]
+            for (column, ctype) in (('Clip', 'text'), ('DurationMs', 'integer'),
+                                    ('StartUtcMs', 'integer'), ('SignalKind', 'text'),
+                                    ('Signal', 'blob'), ('SignalMin', 'integer'),
+                                    ('SignalMean', 'real'), ('SignalMax', 'integer'),
+                                    ('FrequencyHz', 'integer'), ('TGID', 'integer'),
+                                    ('AgencyId', 'integer'), ('ServiceId', 'integer'),
+                                    ('TagSetId', 'integer')):
+                if column not in columns:
+                    self.dbconn.execute('ALTER TABLE "Reception" ADD COLUMN "{}" {}'.format(column, ctype))
             self.dbconn.execute("""CREATE TABLE IF NOT EXISTS "LastSeen"
                 ("System" TEXT,
                  "Group" TEXT,
                  "Channel" TEXT,
                  "LastTime" timestamp)""")
+            self.dbconn.execute("""CREATE TABLE IF NOT EXISTS "RefName"
+                ("Id" integer PRIMARY KEY,
+                 "Name" text)""")
         except sqlite3.Error:
             self.__logger.exception("Error initializing database")
             raise
@@ -294,6 +450,30 @@ class GLGMonitor(ReceivingState):
             self.__logger.exception("Error populating lastseen table")
             raise
 
+    def load_reference(self, csvpath, cachepath=None):
+        """Load the frequency and talkgroup reference, see :mod:`scanmon.enrich`.
+
+        Args:
+            csvpath (str): The reference CSV
+            cachepath (str): Optional. Its compiled index
+        """
+
+        try:
+            self.reference = ReferenceIndex.load(csvpath, cachepath)
+            self.__logger.info("Reference %s: %d entries", csvpath, self.reference.entries)
+        except (OSError, UnicodeDecodeError) as err:
+            self.__logger.error("Cannot load the reference %s: %s", csvpath, err)
+
+    def name_ids(self, *idents):
+        """Store the names of reference ids in RefName, once each.
+        """
+
+        new = [(ident, self.reference.names.get(ident, '')) for ident in idents
+               if ident not in self._named_ids]
+        if new:
+            self.dbconn.executemany('INSERT OR IGNORE INTO "RefName" ("Id", "Name") VALUES (?, ?)', new)
+            self._named_ids.update(ident for (ident, _) in new)
+
     def create_reception(self, glgresp):
         """Create a Reception instance
 
@@ -307,6 +487,9 @@ class GLGMonitor(ReceivingState):
         self.__logger.debug("new Reception-%s", self.sys_id)
         self.state = GLGMonitor.RECEIVING
         reception = Reception(glgresp)
+        if self.reference:
+            reception.enrich(self.reference)
+        self.reception_count += 1
         curs = self.dbconn.execute('SELECT "LastTime" FROM "LastSeen" '
                                    'WHERE "System" == :system '
                                    'AND "Group" == :group '
@@ -324,8 +507,84 @@ class GLGMonitor(ReceivingState):
 
         self.dbconn.execute(dbupdate, reception.__dict__)
         self.write_win(reception)
+        if self.alerts:
+            reception.alerts_pending = self.alerts.match(reception)[::-1]
+            self.check_alerts(reception)
         return reception
 
+    def check_alerts(self, reception):
+        """Fire the matched alert rules whose minimum duration has passed.
+        """
+
+        pending = reception.alerts_pending
+        while pending and pending[-1].minduration_ms <= reception.duration_ms:
+            self.fire_alert(pending.pop(), reception)
+
+    def add_stats(self, reception):
+        """Add a completed Reception to the channel statistics, report its anomalies.
+        """
+
+        for (kind, description) in self.stats.add(reception):
+            self.__logger.info("Anomaly %s %s: %s", kind, reception.sys_id, description)
+            self.monwin.message("Anomaly {} {}: {}".format(kind, reception.sys_id, description))
+            if self.alerts:
+                for rule in self.alerts.match_anomaly(kind, reception):
+                    self.fire_alert(rule, reception, '{}: {}'.format(kind, description))
+
+        now = time.monotonic()
+        if now - self.checkpoint_time >= self.checkpoint_every:
+            self.checkpoint_time = now
+            self.stats.checkpoint()
+
+    def fire_alert(self, rule, reception, anomaly=''):
+        """Take the actions of an alert rule.
+
+        Args:
+            rule (AlertRule): The rule that matched
+            reception (Reception): The Reception it matched
+            anomaly (str): The anomaly for an anomaly rule
+        """
+
+        rule.fired += 1
+        fields = {'rule': rule.name,
+                  'system': reception.system,
+                  'group': reception.group,
+                  'channel': reception.channel,
+                  'frequency': reception.frequency_tgid,
+                  'duration': reception.duration,
+                  'starttime': reception.starttime.isoformat(),
+                  'agency': self.reference.names.get(reception.agency_id, '') if self.reference else '',
+                  'anomaly': anomaly}
+        self.__logger.info("Alert %s: %s", rule.name, reception.sys_id)
+
+        if 'alert' in rule.actions:
+            try:
+                message = rule.message.format(**fields)
+            except (KeyError, IndexError, ValueError) as err:
+                self.__logger.error("Alert %s message %r: %s", rule.name, rule.message, err)
+                message = rule.name
+            self.monwin.alert(message)
+        if 'bell' in rule.actions:
+            self.monwin.bell()
+        if 'highlight' in rule.actions and reception.info_widget:
+            self.monwin.set_widget_text(reception.info_widget, ('ALERT', reception.infostring))
+        if 'sink' in rule.actions and self.alert_sink:
+            self.alert_sink.put(rule, fields)
+
+    def publish(self, params):
+        """Send a completed Reception to the aggregator, see :mod:`scanmon.publish`.
+
+        Args:
+            params (dict): The Reception column values
+        """
+
+        names = None
+        if self.reference:
+            names = {ident: self.reference.names.get(ident, '')
+                     for ident in (params['agency_id'], params['service_id'], params['tagset_id']) if ident}
+        from scanmon.publish import encode_record     # Already loaded with the publisher
+        self.publisher.put(encode_record(params, names))
+
     def accumulate_time(self):
         """Accumulate time in the current reception, set state.
 
@@ -340,50 +599,101 @@ class GLGMonitor(ReceivingState):
                             self.sys_id, samesystem, self.is_active)
 
         if self.reception.last_active_state or samesystem:
-            self.reception.duration = (self.receive_time - self.reception.starttime).seconds
+            self.reception.duration_ms = self.receive_ms - self.reception.start_ms
+            self.reception.duration = self.reception.duration_ms // 1000
             self.write_win(self.reception)
+            if self.reception.alerts_pending:
+                self.check_alerts(self.reception)
 
         self.reception.last_active_state = self.is_active
 
         if self.is_active:
             self.state = GLGMonitor.RECEIVING
             if samesystem:
-                self.reception.last_active_time = self.receive_time
+                self.reception.last_active_ms = self.receive_ms
             else:
                 self.write_database()
+                self.reception = self.create_reception(self.glgresp)
         else:
             self.state = GLGMonitor.TIMEOUT
 
+    def refined(self, reception, start, end):
+        """The recorder found the audio edges of a Reception, runs on the recorder thread.
+        """
+
+        self.monwin.call_soon(self.update_edges, reception, start, end)
+
+    def update_edges(self, reception, start, end):
+        """Store the refined start and duration of a written Reception.
+
+        The database row and the history row are refined. The channel statistics,
+        the alerts and the published record keep the GLG edges, they were taken
+        when the Reception ended.
+
+        Args:
+            reception (Reception): The Reception
+            start, end (float): Audio start and end, seconds since the epoch
+        """
+
+        reception.starttime = datetime.fromtimestamp(start)
+        reception.start_utc_ms = int(start * 1000)
+        reception.duration_ms = max(int(round((end - start) * 1000)), 0)
+        reception.duration = reception.duration_ms // 1000
+        if reception.rowid is not None:
+            try:
+                self.dbconn.execute('UPDATE "Reception" SET "Starttime" = :starttime, '
+                                    '"StartUtcMs" = :start_utc_ms, "Duration" = :duration, '
+                                    '"DurationMs" = :duration_ms WHERE rowid = :rowid',
+                                    reception.__dict__)
+            except sqlite3.Error:
+                self.__logger.exception("Error updating Reception edges")
+        if reception.history_row is not None:
+            self.history.refine(reception.history_row, start, reception.duration_ms)
+
     def write_database(self):
-        """Write database record, set state
+        """Write database record, set state to idle. The caller starts the next Reception.
         """
 
         self.__logger.debug("system: %s", self.reception.sys_id)
 
         if self.reception:
+            self.reception.history_row = self.history.add(self.reception)
+            if self.stats:
+                self.add_stats(self.reception)
+
+            if self.recorder:
+                self.reception.clip = self.recorder.clip(
+                    self.reception, functools.partial(self.refined, self.reception))
+
+            params = dict(self.reception.__dict__, **self.reception.signal_columns())
             if self.dblevel == 'detail':
                 try:
                     dbwrite = """INSERT INTO "Reception"
                         ("Starttime", "Duration", "System", "Group", "Channel", "Frequency_TGID", "CTCSS_DCS",
-                         "Modulation", "Attenuation", "SystemTag", "ChannelTag", "P25NAC") VALUES
+                         "Modulation", "Attenuation", "SystemTag", "ChannelTag", "P25NAC", "Clip",
+                         "DurationMs", "StartUtcMs", "SignalKind", "Signal", "SignalMin", "SignalMean",
+                         "SignalMax", "FrequencyHz", "TGID", "AgencyId", "ServiceId", "TagSetId") VALUES
                         (:starttime, :duration, :system, :group, :channel, :frequency_tgid, :ctcss_dcs,
-                         :modulation, :attenuation, :system_tag, :channel_tag, :p25nac)"""
-                    self.dbconn.execute(dbwrite, self.reception.__dict__)
+                         :modulation, :attenuation, :system_tag, :channel_tag, :p25nac, :clip,
+                         :duration_ms, :start_utc_ms, :signal_kind, :signal, :signal_min, :signal_mean,
+                         :signal_max, :frequency_hz, :tgid, :agency_id, :service_id, :tagset_id)"""
+                    if self.reference:
+                        self.name_ids(self.reception.agency_id, self.reception.service_id,
+                                      self.reception.tagset_id)
+                    self.reception.rowid = self.dbconn.execute(dbwrite, params).lastrowid
                 except sqlite3.Error:
                     self.__logger.exception("Error writing Reception to database")
                     raise
+            if self.publisher:
+                self.publish(params)
         else:
             self.__logger.error("Cannot write database if no Reception exists!")
 
         self.scroll_win()
         self.title_updater.put(GLGMonitor._DEFTITLE)     # Default idle title
 
-        if self.is_active:
-            self.reception = self.create_reception(self.glgresp)
-            self.state = GLGMonitor.RECEIVING
-        else:
-            self.reception = None
-            self.state = GLGMonitor.IDLE
+        self.reception = None
+        self.state = GLGMonitor.IDLE
 
     def scroll_win(self, widget=None):
         """Scroll the output window.
@@ -417,11 +727,6 @@ class GLGMonitor(ReceivingState):
             # Compute the static information string once and cache it
             reception.dur_widget = Text(str(reception.duration))
 
-            # Compute the frequency or 'NaN'
-            with decimal.localcontext() as lctx:
-                lctx.traps[decimal.InvalidOperation] = False
-                frq = decimal.Decimal(reception.frequency_tgid)
-
             # Compute the 'lastseen' display value (HH:MM:SS)
             if reception.lastseen:
                 delta = reception.starttime - reception.lastseen
@@ -434,6 +739,7 @@ class GLGMonitor(ReceivingState):
                 'Sys={sys:.<16s}|'
                 'Grp={grp:.<16s}|'
                 'Chan={chn:.<16s}|'
+                '{agency}'
                 'Freq={frq:#9.4f}|'
                 'C/D={ctc:>3s} '
                 'last={last:>8s}|'
@@ -441,7 +747,8 @@ class GLGMonitor(ReceivingState):
                                sys=reception.system,
                                grp=reception.group,
                                chn=reception.channel,
-                               frq=float(frq),
+                               agency=self.agency_text(reception),
+                               frq=display_frequency(reception.frequency_hz, reception.tgid),
                                ctc=reception.ctcss_dcs,
                                last=lastseen)
 
@@ -450,12 +757,24 @@ class GLGMonitor(ReceivingState):
                 grp=reception.group,
                 chan=reception.channel))
 
+            reception.info_widget = Text(reception.infostring)
             self.current_widget.original_widget = Columns(
-                [('pack', Text(reception.infostring)),
+                [('pack', reception.info_widget),
                  Padding(reception.dur_widget)])
+            self.monwin.mark_dirty()
 
-        else:   # Update the existing duration
-            reception.dur_widget.set_text(str(self.reception.duration))
+        else:   # Update the existing duration, only if it shows something new
+            duration = str(self.reception.duration)
+            if duration != reception.dur_widget.text:
+                self.monwin.set_widget_text(reception.dur_widget, duration)
+
+    def agency_text(self, reception):
+        """The Agcy= field of the window line, empty without a reference
+        """
+
+        if not self.reference:
+            return ''
+        return 'Agcy={:.<16s}|'.format(self.reference.names.get(reception.agency_id) or '-')
 
     def parse_response(self, glgresp):
         """Accept a scanner.formatter.Response object, decode it, set GLGMonitor values.
@@ -467,9 +786,11 @@ class GLGMonitor(ReceivingState):
         assert isinstance(glgresp, Response)
         assert glgresp.CMD == 'GLG'
 
-        self.__logger.debug('Parsing Response(%s)', glgresp.display(glgresp))
+        if self.__logger.isEnabledFor(logging.DEBUG):
+            self.__logger.debug('Parsing Response(%s)', glgresp.display(glgresp))
 
         self.receive_time = glgresp.TIME
+        self.receive_ms = glgresp.MONO_MS
         self.system_name = glgresp.NAME1
         self.group_name = glgresp.NAME2
         self.channel_name = glgresp.NAME3
@@ -478,20 +799,26 @@ class GLGMonitor(ReceivingState):
         self.modulation = glgresp.MOD
         self.attenuation = glgresp.ATT == '1'
 
-        if glgresp.SYS_TAG and glgresp.SYS_TAG != 'NONE':
-            self.system_tag = int(glgresp.SYS_TAG)
-        else:
-            self.system_tag = GLGMonitor.TAGNONE
-
-        if glgresp.CHAN_TAG and glgresp.CHAN_TAG != 'NONE':
-            self.channel_tag = int(glgresp.CHAN_TAG)
-        else:
-            self.channel_tag = GLGMonitor.TAGNONE
+        self.system_tag = self._tag(glgresp.SYS_TAG)
+        self.channel_tag = self._tag(glgresp.CHAN_TAG)
 
         self.p25nac = glgresp.P25NAC
         self.squelch = glgresp.SQL == '1'
         self.mute = glgresp.MUT == '1'
 
+    @staticmethod
+    def _tag(value):
+        """Convert a System or Channel tag, TAGNONE if absent or garbled (a cut off line)
+        """
+
+        if value and value != 'NONE':
+            try:
+                return int(value)
+            except ValueError:
+                pass
+
+        return GLGMonitor.TAGNONE
+
     def process(self, glgcmd, glgresp):
         """Process a GLG response
 
@@ -500,11 +827,66 @@ class GLGMonitor(ReceivingState):
             glgresp (Response): The scanner's response
 
         This is the main routine. It should be called repeatedly with a Scanner Response object.
+        With statuspoll the GLG is held until the STS polled with it arrives, see
+        :meth:`process_status`.
         """
 
         del glgcmd  # unused
 
-        self.__logger.debug("processing: %s, state: %s", glgresp, self.state)
+        if self.statuspoll:
+            if self.glg_pending is not None:
+                self.update(self.glg_pending)   # Its STS never came
+            self.glg_pending = glgresp
+        else:
+            self.update(glgresp)
+
+        self.send_count -= 1
+
+        if self.send_count < 0:
+            self.__logger.warning("GLG Monitor send count less than zero: %d", self.send_count)
+            self.send_count = 0
+
+        if self.send_count == 0 and self.running:
+            self.delay_glg()
+
+        # Always return False, we watch all GLG responses
+        return False
+
+    def process_status(self, stscmd, stsresp):
+        """Process the STS response polled with a GLG, the pair make one update.
+
+        Args:
+            stscmd (Command): The Command sent to the scanner (unused)
+            stsresp (Response): The scanner's response
+
+        Returns:
+            True, the watch is set again with each poll
+        """
+
+        del stscmd  # unused
+
+        if stsresp.status != Response.RESP:
+            stsresp = None      # NG or a cut off line, the GLG still counts
+        else:
+            self.status = stsresp
+
+        if self.glg_pending is not None:
+            glgresp = self.glg_pending
+            self.glg_pending = None
+            self.update(glgresp, stsresp)
+
+        return True
+
+    def update(self, glgresp, stsresp=None):
+        """Update the monitor state from a GLG response and the STS polled with it.
+
+        Args:
+            glgresp (Response): The GLG response
+            stsresp (Response): Optional. The STS response of the same poll
+        """
+
+        if self.__logger.isEnabledFor(logging.DEBUG):
+            self.__logger.debug("processing: %s, state: %s", glgresp, self.state)
         self.glgresp = glgresp
         self.parse_response(self.glgresp)
 
@@ -516,8 +898,8 @@ class GLGMonitor(ReceivingState):
             self.accumulate_time()
 
         elif self.is_timeout:
-            time_exceeded = (glgresp.TIME -
-                             self.reception.last_active_time).total_seconds() > self.idletime
+            time_exceeded = (glgresp.MONO_MS -
+                             self.reception.last_active_ms) > self.idletime * 1000
 
             if time_exceeded:
                 self.__logger.debug("Timeout: %s", self.reception.sys_id)
@@ -531,17 +913,12 @@ class GLGMonitor(ReceivingState):
         else:
             raise RuntimeError("Invalid GLG monitor state: {}".format(self.state))
 
-        self.send_count -= 1
-
-        if self.send_count < 0:
-            self.__logger.warning("GLG Monitor send count less than zero: %d", self.send_count)
-            self.send_count = 0
-
-        if self.send_count == 0 and self.running:
-            self.delay_glg()
-
-        # Always return False, we watch all GLG responses
-        return False
+        if self.signal_cmd and self.reception and self.is_active:
+            if self.signal_cmd == 'STS' and self.statuspoll:
+                if stsresp is not None:
+                    self.process_signal(None, stsresp)  # Polled with the GLG
+            elif self.running:
+                self.send_signal()
 
     def delay_glg(self, delay=0.5):
         """Set a delayed GLG command.
@@ -563,8 +940,39 @@ class GLGMonitor(ReceivingState):
         del mainloop, user_data
 
         self.monwin.scanner.send_command(Command('GLG', callback=self.process))
+        if self.statuspoll:
+            # Back to back, in batch mode both go out in one write
+            self.monwin.scanner.send_command(Command('STS', callback=self.process_status))
         self.send_count += 1
 
+    def send_signal(self):
+        """Send a signal strength poll, interleaved with GLG while receiving.
+        """
+
+        self.monwin.scanner.send_command(Command(self.signal_cmd, callback=self.process_signal))
+
+    def process_signal(self, cmd, resp):
+        """Add the RSSI or signal level of a PWR or STS response to the current Reception
+
+        Args:
+            cmd (Command): The Command sent to the scanner (unused)
+            resp (Response): The scanner's response
+
+        Returns:
+            True, the watch is set again with each poll
+        """
+
+        del cmd # unused
+
+        if self.reception is not None and resp.status == Response.RESP:
+            value = resp.RSSI if resp.CMD == 'PWR' else resp.SIG_LVL
+            try:
+                self.reception.add_signal(resp.CMD, resp.MONO_MS, int(value))
+            except (TypeError, ValueError):
+                self.__logger.warning("Invalid signal in %s response: %r", resp.CMD, value)
+
+        return True
+
     def start(self):
         """Start monitoring.
         """
@@ -579,3 +987,24 @@ class GLGMonitor(ReceivingState):
 
         self.running = False
 
+    def close(self):
+        """Write the Reception in progress, stop the clip recorder, the alert sink and the
+        publisher, save the channel statistics and close the database.
+        """
+
+        if self.glg_pending is not None:
+            self.update(self.glg_pending)   # Its STS never came
+            self.glg_pending = None
+        if self.reception:
+            self.write_database()
+        if self.stats:
+            self.stats.checkpoint()
+        if self.recorder:
+            self.recorder.stop()
+        if self.alert_sink:
+            self.alert_sink.stop()
+        if self.publisher:
+            self.publisher.stop()
+            self.publisher.join(self.publisher.LINGER + 1)
+        self.dbconn.close()
+
@@ -0,0 +1,378 @@
+"""History - Recent receptions kept in columns with filtered views.
+
+`Source <src/scanmon.history.html>`__
+
+Completed receptions are kept column wise: start time, duration and a channel id.
+Each distinct System/Group/Channel/Frequency gets a channel id once, and a list of
+its rows. A filtered view picks the matching channels and merges their row lists
+so building one costs O(matches), and new receptions are added to every view
+whose channels they match.
+"""
+
+import bisect
+import fnmatch
+import heapq
+import logging
+from array import array
+from datetime import datetime
+
+from urwid import AttrMap, ListWalker, Text
+
+class Channel(object):
+    """A System/Group/Channel/Frequency seen in the history.
+
+    Attributes:
+        chan_id (int): The channel id
+        system, group, channel (str): Names
+        frequency_tgid (str): Frequency or TGID as the scanner gave it
+        frequency (float): Frequency in MHz, NaN for a TGID
+    """
+
+    __slots__ = ('chan_id', 'system', 'group', 'channel', 'frequency_tgid', 'frequency', 'rows')
+
+    def __init__(self, chan_id, system, group, channel, frequency_tgid, frequency_hz):
+        self.chan_id = chan_id
+        self.system = system
+        self.group = group
+        self.channel = channel
+        self.frequency_tgid = frequency_tgid
+        self.frequency = frequency_hz / 1000000.0 if frequency_hz is not None else float('nan')
+        self.rows = array('Q')      # Row numbers of this channel's receptions
+
+class HistoryFilter(object):
+    """Selects channels by name globs and a frequency range.
+
+    Args:
+        system, group, channel (str): Optional globs, case is ignored
+        freq_low, freq_high (float): Optional frequency range in MHz, inclusive
+    """
+
+    def __init__(self, system=None, group=None, channel=None, freq_low=None, freq_high=None):
+        self.system = system
+        self.group = group
+        self.channel = channel
+        self.freq_low = freq_low
+        self.freq_high = freq_high
+
+    @staticmethod
+    def _match(value, pattern):
+        """Case insensitive glob match, a missing pattern matches all
+        """
+
+        return pattern is None or fnmatch.fnmatch(value.lower(), pattern.lower())
+
+    def matches(self, chan):
+        """True if the Channel passes the filter.
+        """
+
+        if self.freq_low is not None and not chan.frequency >= self.freq_low:
+            return False
+
+        if self.freq_high is not None and not chan.frequency <= self.freq_high:
+            return False
+
+        return (self._match(chan.system, self.system) and
+                self._match(chan.group, self.group) and
+                self._match(chan.channel, self.channel))
+
+    @classmethod
+    def parse(cls, text):
+        """Build a filter from ``sys=GLOB grp=GLOB chan=GLOB freq=LOW-HIGH`` terms.
+
+        Raises:
+            ValueError: Unknown or malformed term
+        """
+
+        terms = {}
+        for term in text.split():
+            (key, sep, value) = term.partition('=')
+            if not sep or not value:
+                raise ValueError("Invalid filter term: {}".format(term))
+            key = key.lower()
+            if key in ('sys', 'system'):
+                terms['system'] = value
+            elif key in ('grp', 'group'):
+                terms['group'] = value
+            elif key in ('chan', 'channel'):
+                terms['channel'] = value
+            elif key in ('freq', 'frequency'):
+                (low, _, high) = value.partition('-')
+                terms['freq_low'] = float(low) if low else None
+                terms['freq_high'] = float(high) if high else terms['freq_low']
+            else:
+                raise ValueError("Unknown filter term: {}".format(key))
+
+        return cls(**terms)
+
+    def __str__(self):
+        terms = []
+        for (name, value) in (('sys', self.system), ('grp', self.group), ('chan', self.channel)):
+            if value is not None:
+                terms.append('{}={}'.format(name, value))
+        if self.freq_low is not None or self.freq_high is not None:
+            terms.append('freq={}-{}'.format(self.freq_low or '', self.freq_high or ''))
+
+        return ' '.join(terms) or 'all'
+
+class HistoryView(object):
+    """The rows of the history passing a filter.
+
+    Positions are sequence numbers of the matching rows so they do not shift when
+    old rows are trimmed.
+
+    Args:
+        history (ReceptionHistory): The history
+        hfilter (HistoryFilter): The filter
+    """
+
+    def __init__(self, history, hfilter):
+        self.history = history
+        self.filter = hfilter
+        self.channels = set()
+        self.rows = array('Q')
+        self.dropped = 0        # Position of rows[0]
+        self.listeners = []
+
+        matching = []
+        for chan in history.channels:
+            if hfilter.matches(chan):
+                self.channels.add(chan.chan_id)
+                matching.append(chan.rows)
+
+        self.rows.extend(heapq.merge(*matching))
+
+    def added(self, row, chan):
+        """A row was added to the history.
+        """
+
+        if chan.chan_id in self.channels:
+            self.rows.append(row)
+            for listener in self.listeners:
+                listener()
+
+    def new_channel(self, chan):
+        """A channel was added to the history.
+        """
+
+        if self.filter.matches(chan):
+            self.channels.add(chan.chan_id)
+
+    def trimmed(self, base):
+        """Rows before *base* were dropped from the history.
+        """
+
+        cut = bisect.bisect_left(self.rows, base)
+        del self.rows[:cut]
+        self.dropped += cut
+
+    def __len__(self):
+        return len(self.rows)
+
+class ReceptionHistory(object):
+    """Column oriented history of completed receptions.
+
+    Args:
+        maxrows (int): The most rows kept. A third are dropped when it is reached.
+    """
+
+    def __init__(self, maxrows=200000):
+        self.__logger = logging.getLogger(__name__).getChild(type(self).__name__)
+        self.maxrows = max(int(maxrows), 3)
+        self.starttime = array('d')     # Seconds since the epoch
+        self.duration_ms = array('l')   # Milliseconds
+        self.chan_id = array('L')
+        self.base = 0                   # Row number of starttime[0]
+        self.channels = []
+        self._channel_ids = {}
+        self.views = []
+
+    def __len__(self):
+        return len(self.starttime)
+
+    def channel_for(self, reception):
+        """Get or create the Channel for a Reception.
+        """
+
+        key = (reception.system, reception.group, reception.channel, reception.frequency_tgid)
+        chan = self._channel_ids.get(key)
+        if chan is None:
+            chan = Channel(len(self.channels), *key, reception.frequency_hz)
+            self.channels.append(chan)
+            self._channel_ids[key] = chan
+            for view in self.views:
+                view.new_channel(chan)
+
+        return chan
+
+    def add(self, reception):
+        """Add a completed Reception.
+
+        Returns:
+            int: Its row number
+        """
+
+        if len(self.starttime) >= self.maxrows:
+            self.trim(self.maxrows // 3)
+
+        chan = self.channel_for(reception)
+        row = self.base + len(self.starttime)
+        self.starttime.append(reception.starttime.timestamp())
+        self.duration_ms.append(int(reception.duration_ms))
+        self.chan_id.append(chan.chan_id)
+        chan.rows.append(row)
+
+        for view in self.views:
+            view.added(row, chan)
+
+        return row
+
+    def refine(self, row, starttime, duration_ms):
+        """Set the refined start and duration of a row, if it is still held.
+
+        Args:
+            row (int): The row number from :meth:`add`
+            starttime (float): Seconds since the epoch
+            duration_ms (int): Milliseconds
+        """
+
+        index = row - self.base
+        if 0 <= index < len(self.starttime):
+            self.starttime[index] = starttime
+            self.duration_ms[index] = int(duration_ms)
+
+    def trim(self, count):
+        """Drop the oldest *count* rows.
+        """
+
+        self.__logger.info('Trimming %d rows', count)
+        del self.starttime[:count]
+        del self.duration_ms[:count]
+        del self.chan_id[:count]
+        self.base += count
+
+        for chan in self.channels:
+            del chan.rows[:bisect.bisect_left(chan.rows, self.base)]
+
+        for view in self.views:
+            view.trimmed(self.base)
+
+    def view(self, hfilter):
+        """Make a live filtered view. Call close_view when done with it.
+        """
+
+        view = HistoryView(self, hfilter)
+        self.views.append(view)
+        return view
+
+    def close_view(self, view):
+        """Stop updating a view.
+        """
+
+        if view in self.views:
+            self.views.remove(view)
+
+    def row_text(self, row):
+        """Format one row for display
+        """
+
+        index = row - self.base
+        chan = self.channels[self.chan_id[index]]
+        return ('{time:s}: '
+                'Sys={sys:.<16s}|'
+                'Grp={grp:.<16s}|'
+                'Chan={chn:.<16s}|'
+                'Freq={frq:>9s}|'
+                'dur={dur:.1f}').format(
+                    time=datetime.fromtimestamp(self.starttime[index]).strftime('%m-%d %H:%M:%S'),
+                    sys=chan.system,
+                    grp=chan.group,
+                    chn=chan.channel,
+                    frq=chan.frequency_tgid,
+                    dur=self.duration_ms[index] / 1000)
+
+class HistoryWalker(ListWalker):
+    """A ListWalker over a HistoryView, widgets are built only for the rows shown.
+
+    Follows new rows while the focus is on the last row.
+
+    Args:
+        view (HistoryView): The view to show
+        wrap (function): Optional. Builds the display widget for a row's text
+    """
+
+    def __init__(self, view, wrap=None):
+        self.view = view
+        self._wrap = wrap or (lambda text: AttrMap(Text(text), None, 'NORMF'))
+        self._focus = view.dropped + len(view) - 1
+        view.listeners.append(self._added)
+
+    def _added(self):
+        """The view grew, follow it if the focus was on the last row
+        """
+
+        if self._focus == self.last_position - 1:
+            self._focus = self.last_position
+        self._modified()
+
+    @property
+    def first_position(self):
+        """Position of the oldest row
+        """
+
+        return self.view.dropped
+
+    @property
+    def last_position(self):
+        """Position of the newest row
+        """
+
+        return self.view.dropped + len(self.view) - 1
+
+    def _widget(self, position):
+        """Build the widget for a position
+        """
+
+        return self._wrap(self.view.history.row_text(self.view.rows[position - self.view.dropped]))
+
+    def get_focus(self):
+        if len(self.view) == 0:
+            return (None, None)
+
+        self._focus = min(max(self._focus, self.view.dropped), self.last_position)
+        return (self._widget(self._focus), self._focus)
+
+    def set_focus(self, position):
+        if not self.view.dropped <= position <= self.last_position:
+            raise IndexError('Position {} not held'.format(position))
+
+        self._focus = position
+        self._modified()
+
+    def get_next(self, position):
+        if position >= self.last_position:
+            return (None, None)
+
+        return (self._widget(position + 1), position + 1)
+
+    def get_prev(self, position):
+        if position <= self.view.dropped or position > self.last_position + 1:
+            return (None, None)
+
+        return (self._widget(position - 1), position - 1)
+
+    def positions(self, reverse=False):
+        """The positions held, oldest first unless *reverse*
+        """
+
+        held = range(self.view.dropped, self.last_position + 1)
+        return reversed(held) if reverse else held
+
+    def __len__(self):
+        return len(self.view)
+
+    def close(self):
+        """Stop following the view
+        """
+
+        if self._added in self.view.listeners:
+            self.view.listeners.remove(self._added)
@@ -0,0 +1,135 @@
+"""
+Logring - Logging off the UI thread with a ring of recent records.
+
+`Source <src/scanmon.logring.html>`__
+
+Log calls only put the record on a queue. A listener thread writes the log file and
+keeps the most recent records, debug included, in a ring. The ring is written to the
+dump file when an error is logged or when asked with :meth:`LogPipeline.dump`, so
+debug detail around a problem is kept without writing every debug line to disk.
+"""
+
+import collections
+import logging
+import logging.handlers
+import queue
+import time
+
+FORMAT = "{asctime} {name}.{funcName} -{levelname}- *{threadName}* {message}"
+RINGSIZE = 10000
+
+class LogQueueHandler(logging.handlers.QueueHandler):
+    """Queue the record with its message merged, formatting is left to the listener.
+
+    The standard QueueHandler formats the whole record (time stamp included) on the
+    caller's thread, only the message and any traceback are needed here.
+    """
+
+    def prepare(self, record):
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+class RingHandler(logging.Handler):
+    """Keep the most recent records and write them out on error or request.
+
+    Args:
+        dumpfile (str): File the ring is appended to
+        size (int): Records kept
+        dumplevel (int): Records at this level or above dump the ring
+    """
+
+    def __init__(self, dumpfile, size=RINGSIZE, dumplevel=logging.ERROR):
+        super().__init__()
+        self.dumpfile = dumpfile
+        self.dumplevel = dumplevel
+        self.ring = collections.deque(maxlen=size)
+        self.dumps = 0
+
+    def emit(self, record):
+        if getattr(record, 'ringdump', False):
+            self.dump(record.getMessage())
+            return
+
+        self.ring.append(record)
+        if record.levelno >= self.dumplevel:
+            self.dump("{}: {}".format(record.levelname, record.getMessage()))
+
+    def dump(self, reason):
+        """Append the ring to the dump file and empty it.
+        """
+
+        try:
+            with open(self.dumpfile, 'a') as dumpfile:
+                dumpfile.write("=== {} {} records: {}\n".format(
+                    time.strftime('%Y-%m-%d %H:%M:%S'), len(self.ring), reason))
+                for record in self.ring:
+                    dumpfile.write(self.format(record) + '\n')
+        except OSError:
+            self.handleError(None)
+            return
+
+        self.ring.clear()
+        self.dumps += 1
+
+class LogPipeline(object):
+    """The root logger's queue, listener, log file and ring.
+
+    Args:
+        logfile (str): The log file, INFO and above (everything with *debug* and no ring)
+        debug (bool): Log debug records
+        ringsize (int): Records kept in the ring, 0 for no ring
+    """
+
+    def __init__(self, logfile, debug=False, ringsize=RINGSIZE):
+        formatter = logging.Formatter(fmt=FORMAT, style='{')
+
+        filehandler = logging.FileHandler(logfile)
+        filehandler.setFormatter(formatter)
+        handlers = [filehandler]
+
+        self.ring = None
+        if ringsize > 0:
+            filehandler.setLevel(logging.INFO)
+            self.ring = RingHandler(logfile + '.ring', size=ringsize)
+            self.ring.setFormatter(formatter)
+            handlers.append(self.ring)
+
+        self.handlers = handlers
+        self.queue = queue.SimpleQueue()
+        self.handler = LogQueueHandler(self.queue)
+        self.listener = logging.handlers.QueueListener(self.queue, *handlers,
+                                                       respect_handler_level=True)
+
+        root_logger = logging.getLogger()
+        root_logger.addHandler(self.handler)
+        root_logger.setLevel(logging.DEBUG if debug else logging.INFO)
+        self.listener.start()
+
+    def dump(self, reason='Ring dump requested'):
+        """Ask the listener to write out the ring. Nothing is written here.
+
+        Returns:
+            False if there is no ring
+        """
+
+        if self.ring is None:
+            return False
+
+        logging.getLogger(__name__).info(reason, extra={'ringdump': True})
+        return True
+
+    def stop(self):
+        """Write out the queued records and stop the listener.
+        """
+
+        if self.listener is not None:
+            logging.getLogger().removeHandler(self.handler)
+            self.listener.stop()
+            self.listener = None
+            for handler in self.handlers:
+                handler.close()
@@ -0,0 +1,100 @@
+"""
+Memtrace - Allocation tracing with tracemalloc, for the mem command and soak runs.
+
+`Source <src/scanmon.memtrace.html>`__
+
+Tracing slows every allocation so it is only on between :meth:`MemTracer.start`
+and :meth:`MemTracer.stop`. Snapshots are compared by allocation site (file and
+line) against the snapshot taken at start, so the sites that keep growing show up
+at the top.
+"""
+
+import gc
+import linecache
+import os
+import tracemalloc
+
+FRAMES = 1      # Frames kept for each allocation
+
+# Allocations made by the tracing itself and by imports are not ours
+_FILTERS = (tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, linecache.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+            tracemalloc.Filter(False, '<unknown>'))
+
+class MemTracer(object):
+    """Trace allocations and compare snapshots by site.
+    """
+
+    def __init__(self):
+        self.baseline = None
+        self.started_here = False
+
+    @property
+    def tracing(self):
+        """True while tracemalloc is on
+        """
+
+        return tracemalloc.is_tracing()
+
+    def start(self, frames=FRAMES):
+        """Start tracing and take the baseline snapshot.
+        """
+
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+            self.started_here = True
+        self.baseline = self.snapshot()
+
+    def stop(self):
+        """Stop tracing, if it was started here, and drop the snapshots.
+        """
+
+        self.baseline = None
+        if self.started_here:
+            tracemalloc.stop()
+            self.started_here = False
+
+    @staticmethod
+    def snapshot():
+        """A filtered snapshot taken after a garbage collection.
+        """
+
+        gc.collect()
+        return tracemalloc.take_snapshot().filter_traces(_FILTERS)
+
+    @staticmethod
+    def current():
+        """(current, peak) traced bytes
+        """
+
+        return tracemalloc.get_traced_memory()
+
+    def top(self, limit=10, snapshot=None, since=None):
+        """The allocation sites that grew the most.
+
+        Args:
+            limit (int): Sites returned
+            snapshot: Snapshot to look at, default a new one
+            since: Snapshot to compare with, default the baseline
+
+        Returns:
+            [tracemalloc.StatisticDiff, ...] largest growth first
+        """
+
+        snapshot = snapshot or self.snapshot()
+        stats = snapshot.compare_to(since or self.baseline or snapshot, 'lineno')
+
+        stats.sort(key=lambda stat: (stat.size_diff, stat.size), reverse=True)
+        return stats[:limit]
+
+def format_stat(stat):
+    """One line for a StatisticDiff: growth, size, count and site
+    """
+
+    frame = stat.traceback[0]
+    (path, name) = os.path.split(frame.filename)
+    return "{:+9.1f} KiB {:9.1f} KiB {:+7d} {}/{}:{}".format(
+        stat.size_diff / 1024, stat.size / 1024, stat.count_diff,
+        os.path.basename(path), name, frame.lineno)
@@ -13,34 +13,24 @@ from urwid import \
     Edit,\
     Frame,\
     ListBox,\
+    ListWalker,\
     Padding,\
     Pile,\
-    SimpleFocusListWalker,\
     Text
+import os
 import time
+from collections import deque, OrderedDict
 from datetime import datetime
 import threading
 
-def _do_nothing(main_loop, user_data):
-    """Does nothing useful except to waken the main loop to cause refreshes.
-
-    I believe this works around a bug in urwid. Rescedules itself ever 0.5 seconds to
-    keep things alive.
-
-    Args:
-        main_loop (urwid.main_loop): Standard args for set_alarm method
-        user_data (object): Standard args for set_alarm method
-    """
-
-    del user_data
-    main_loop.set_alarm_in(0.5, _do_nothing)
-
 class Monwin(urwid.MainLoop):
     """Main class for the window.
 
     Handles all display functions, command entry, monitors the scanner for input.
     """
 
+    _FPS = 10.0     # Default frame rate limit
+
     class CmdLine(urwid.WidgetWrap):
         """The command line input area.
 
@@ -79,6 +69,127 @@ class Monwin(urwid.MainLoop):
 
             return keyret
 
+    class RingWalker(ListWalker):
+        """A fixed capacity ListWalker holding line records.
+
+        Records are whatever was appended (markup or a Widget). Positions are the
+        sequence numbers of the appended lines so they never shift when the oldest
+        lines drop off; append and eviction are O(1). Widgets are only built for the
+        positions the ListBox asks for and a few hundred of them are cached.
+
+        Args:
+            capacity (int): The maximum number of lines held
+            wrap (function): Builds the display widget for a record
+        """
+
+        _CACHE = 256    # Built widgets kept
+
+        def __init__(self, capacity, wrap):
+            self._lines = deque(maxlen=capacity)
+            self._first = 0         # Position of _lines[0]
+            self._focus = 0
+            self._wrap = wrap
+            self._widgets = OrderedDict()
+
+        def __len__(self):
+            return len(self._lines)
+
+        @property
+        def first_position(self):
+            """Position of the oldest line held
+            """
+
+            return self._first
+
+        @property
+        def last_position(self):
+            """Position of the newest line held (first_position - 1 if empty)
+            """
+
+            return self._first + len(self._lines) - 1
+
+        @property
+        def focus(self):
+            """The focus position, does not build the widget
+            """
+
+            return self._focus
+
+        @property
+        def capacity(self):
+            """The maximum number of lines held
+            """
+
+            return self._lines.maxlen
+
+        @capacity.setter
+        def capacity(self, capacity):
+            last = self.last_position
+            self._lines = deque(self._lines, maxlen=capacity)
+            self._first = last + 1 - len(self._lines)
+            self._focus = max(self._focus, self._first)
+            self._widgets.clear()
+            self._modified()
+
+        def append(self, record):
+            """Add a line record at the end, dropping the oldest if full.
+            """
+
+            if len(self._lines) == self._lines.maxlen:
+                self._widgets.pop(self._first, None)
+                self._first += 1
+                self._focus = max(self._focus, self._first)
+
+            self._lines.append(record)
+            self._modified()
+
+        def _widget(self, position):
+            """Get (or build) the widget for a position
+            """
+
+            wid = self._widgets.get(position)
+            if wid is None:
+                wid = self._wrap(self._lines[position - self._first])
+                self._widgets[position] = wid
+                if len(self._widgets) > Monwin.RingWalker._CACHE:
+                    self._widgets.popitem(last=False)
+            else:
+                self._widgets.move_to_end(position)
+
+            return wid
+
+        def get_focus(self):
+            if not self._lines:
+                return (None, None)
+
+            return (self._widget(self._focus), self._focus)
+
+        def set_focus(self, position):
+            if not self._first <= position <= self.last_position:
+                raise IndexError('Position {} not held'.format(position))
+
+            self._focus = position
+            self._modified()
+
+        def get_next(self, position):
+            if position >= self.last_position:
+                return (None, None)
+
+            return (self._widget(position + 1), position + 1)
+
+        def get_prev(self, position):
+            if position <= self._first or position > self.last_position + 1:
+                return (None, None)
+
+            return (self._widget(position - 1), position - 1)
+
+        def positions(self, reverse=False):
+            """The positions held, oldest first unless *reverse*
+            """
+
+            held = range(self._first, self.last_position + 1)
+            return reversed(held) if reverse else held
+
     class ScrollWin(urwid.WidgetWrap):
         """
         Main scrolling windows within the program window.
@@ -90,6 +201,10 @@ class Monwin(urwid.MainLoop):
         """
 
         _MIN_MAX = 12   # scroll_max must be at least this ...
+        _FOCUS_MAP = {'NORM': 'NORMF',
+                      'WARN': 'WARNF',
+                      'ALERT': 'ALERTF',
+                      'default': 'NORMF'}
 
         def __init__(self, title=None, s_max=300):
             """Initialize the ScrollWin.
@@ -97,7 +212,8 @@ class Monwin(urwid.MainLoop):
 
             self.__logger = logging.getLogger(__name__).getChild(type(self).__name__)
 
-            self.scroller = ListBox(SimpleFocusListWalker([]))
+            self._scroll_max = 300      # Default
+            self.scroller = ListBox(Monwin.RingWalker(self._scroll_max, Monwin.ScrollWin._wrap))
 
             if title:
                 self.frame_title = Columns([('pack', Text('--')),
@@ -108,14 +224,23 @@ class Monwin(urwid.MainLoop):
 
             super().__init__(Frame(self.scroller, header=self.frame_title))
 
-            self._scroll_max = 300      # Default
             self.scroll_max = s_max
 
+        @staticmethod
+        def _wrap(record):
+            """Build the display widget for a line record.
+            """
+
+            if not isinstance(record, urwid.Widget):
+                record = Text(record)
+
+            return AttrMap(record, None, Monwin.ScrollWin._FOCUS_MAP)
+
         @property
         def scroll_max(self):
             """The maximum number of lines to hold in the scroller.
 
-            When this limit is reached 1/3 of the first lines will be deleted.
+            When this limit is reached the oldest line is dropped for each new line.
             """
 
             return self._scroll_max
@@ -124,6 +249,7 @@ class Monwin(urwid.MainLoop):
         def scroll_max(self, s_max):
             try:
                 self._scroll_max = max(int(s_max), Monwin.ScrollWin._MIN_MAX)
+                self.scroller.body.capacity = self._scroll_max
             except ValueError:
                 self.__logger.error('Invalid scroll_max setting: %r', s_max)
 
@@ -135,27 +261,16 @@ class Monwin(urwid.MainLoop):
                     May be a plain string, an urwid Widget, or a tuple with an attributed string.
             """
 
-            try:
-                focus_now = self.scroller.focus_position
-            except IndexError:
-                focus_now = -1
-
-            bottom = focus_now == len(self.scroller.body) - 1  # Bottom widget in focus?
+            body = self.scroller.body
+            bottom = body.focus >= body.last_position  # Bottom widget in focus (or empty)?
 
-            self.scroller.body.append(AttrMap(wid, None,        # pylint: disable=no-member
-                                              {'NORM': 'NORMF',
-                                               'WARN': 'WARNF',
-                                               'ALERT': 'ALERTF',
-                                               'default': 'NORMF'}))
-
-            if len(self.scroller.body) > self.scroll_max:
-                rlines = int(self.scroll_max / 3)
-                self.__logger.info('Removing %d lines', rlines)
-                del self.scroller.body[0:rlines]
+            body.append(wid)
 
             if bottom:
+                # Set the walker focus directly, ListBox.set_focus would build the old focus widget
                 self.__logger.debug('scrolling')
-                self.scroller.set_focus(len(self.scroller.body) - 1, coming_from='above')
+                body.set_focus(body.last_position)
+                self.scroller.set_focus_valign('bottom')
             else:
                 self.__logger.debug('skipping scrolling')
 
@@ -192,7 +307,8 @@ class Monwin(urwid.MainLoop):
                 handled = True
                 try:
                     newpos = self.scroller.focus_position + focus_dir
-                    if newpos >= 0 and newpos < len(self.scroller.body):
+                    body = self.scroller.body
+                    if body.first_position <= newpos <= body.last_position:
                         self.scroller.change_focus(size, newpos, coming_from=from_dir)
                         self.__logger.debug('newpos=%d', newpos)
                 except IndexError:
@@ -247,14 +363,20 @@ class Monwin(urwid.MainLoop):
 
         footer = Monwin.CmdLine(self.dispatch_command)
 
-        self.msg = Monwin.ScrollWin('Messages')
-        self.glg = Monwin.ScrollWin('Channel Monitor')
-        self.resp = Monwin.ScrollWin('Command Response')
+        if config is not None:
+            s_max = config.get('scrollback', fallback=300)
+        else:
+            s_max = 300
+
+        self.msg = Monwin.ScrollWin('Messages', s_max)
+        self.glg = Monwin.ScrollWin('Channel Monitor', s_max)
+        self.resp = Monwin.ScrollWin('Command Response', s_max)
         self.windows = {'msg': self.msg, 'glg': self.glg, 'resp': self.resp}
 
+        self.glg_pane = urwid.WidgetPlaceholder(self.glg)  # Live monitor or a history view
         body = Pile([
             ('weight', 5, self.msg),
-            ('weight', 33, self.glg),
+            ('weight', 33, self.glg_pane),
             ('weight', 11, self.resp)
             ])
         frame = Frame(body, header=header, footer=footer, focus_part='footer')
@@ -285,6 +407,25 @@ class Monwin(urwid.MainLoop):
             ('default', 'NORM'),
             ]
         super().__init__(frame, unhandled_input=self.show_or_exit, palette=palette)
+
+        # Render scheduling, the screen is only drawn when dirty and at most fps times a second
+        if config is not None:
+            fps = config.getfloat('fps', fallback=Monwin._FPS)
+        else:
+            fps = Monwin._FPS
+        self._frame_time = 1.0 / max(fps, 0.1)
+        self._dirty = True
+        self._canvas = None         # The last drawn canvas
+        self._last_draw = 0.0
+        self._draw_alarm = None
+        self.redraws = 0
+
+        # Calls from other threads, drained on the main loop through the wake pipe
+        self._outbound = deque()
+        self._wake_lock = threading.Lock()
+        self._wake_pending = False
+        self._wake_fd = self.watch_pipe(self._drain_outbound)
+        self.wakeups = 0
         (screen_cols, screen_rows) = self.screen.get_cols_rows()
         glg_rows = screen_rows - (2 + 5 + 11)
 
@@ -293,26 +434,121 @@ class Monwin(urwid.MainLoop):
         self.msg.append(
             Text(('NORM', 'glg has {:d} rows'.format(glg_rows))))
 
-    def _alarm_putline(self, main_loop, user_data):
-        """Called via set_alarm_in when putline is called outside the main thread
+    def mark_dirty(self):
+        """Note that the display changed and must be redrawn.
+        """
+
+        self._dirty = True
+
+    def stale(self):
+        """True when a widget changed without mark_dirty.
+
+        Changing a widget (set_text and the like) drops the cached canvas of the
+        widget and of every widget containing it, so the top widget's canvas from
+        the last draw is gone.
+        """
+
+        if self._canvas is None:
+            return True
+        top = self._topmost_widget
+        render_cls = next(cls for cls in type(top).__mro__ if 'render' in cls.__dict__)
+        return urwid.CanvasCache.fetch(top, render_cls, self.screen_size, True) is not self._canvas
+
+    def draw_screen(self):
+        """Render and paint the screen (see MainLoop.draw_screen), keeping the canvas.
+
+        The canvas cache only holds weak references, the drawn canvas is kept so
+        that :meth:`stale` can find it.
+        """
+
+        if not self.screen_size:
+            self.screen_size = self.screen.get_cols_rows()
+        self._canvas = self._topmost_widget.render(self.screen_size, focus=True)
+        self.screen.draw_screen(self.screen_size, self._canvas)
+
+    def entering_idle(self):
+        """Redraw the screen, only if it changed and no more than fps times a second.
+
+        Replaces MainLoop.entering_idle which redraws every time the loop goes idle.
+        The display changed if it was marked dirty or a widget was changed, see
+        :meth:`stale`. A redraw that is too soon is deferred with an alarm,
+        otherwise the loop sleeps until something happens.
+        """
+
+        if not (self._dirty or self.stale()) or not self.screen.started:
+            return
+
+        wait = self._last_draw + self._frame_time - time.monotonic()
+        if wait > 0:
+            if self._draw_alarm is None:
+                self._draw_alarm = self.set_alarm_in(wait, self._draw_due)
+            return
 
-        Receives the arguments from set_alarm and re-calls putline on the
-        main thread.
+        self._dirty = False
+        self._last_draw = time.monotonic()
+        self.redraws += 1
+        self.draw_screen()
+
+    def _draw_due(self, main_loop, user_data):
+        """Alarm for a deferred redraw. The loop goes idle after an alarm which redraws.
 
         Args:
             main_loop (urwid.main_loop): Standard args for set_alarm method
             user_data (object): Standard args for set_alarm method
         """
 
-        del main_loop    # unused
-        (window, message, *color) = user_data
+        del main_loop, user_data    # unused
+        self._draw_alarm = None
+
+    def process_input(self, keys):
+        """Pass input to the widgets (see MainLoop.process_input), the display is dirty.
+        """
+
+        self._dirty = True
+        return super().process_input(keys)
+
+    def call_soon(self, callback, *args):
+        """Run *callback(\*args)* on the main loop thread.
+
+        May be called from any thread. Calls are queued and the main loop is woken
+        through the wake pipe only if it is not already due to drain the queue, so a
+        burst of calls is applied in one batch.
+
+        Args:
+            callback (function): Function or method to call
+            args: Arguments for the callback
+        """
+
+        self._outbound.append((callback, args))
+        with self._wake_lock:
+            if self._wake_pending:
+                return
+            self._wake_pending = True
+
+        os.write(self._wake_fd, b'!')
+
+    def _drain_outbound(self, data):
+        """watch_pipe callback, runs every queued call on the main loop thread.
+
+        Args:
+            data (bytes): The wake bytes (unused)
+
+        Returns:
+            True to keep the pipe watched
+        """
+
+        del data    # unused
+        with self._wake_lock:
+            self._wake_pending = False
 
-        try:
-            color = color[0]
-        except IndexError:
-            color = 'NORM'
+        self.wakeups += 1
+        self._dirty = True
+        outbound = self._outbound
+        while outbound:
+            (callback, args) = outbound.popleft()
+            callback(*args)
 
-        self.putline(window, message, color)
+        return True
 
     def putline(self, window, message, color='NORM'):
         """Scroll the window and write the message on the bottom line.
@@ -329,31 +565,56 @@ class Monwin(urwid.MainLoop):
             if not window in ('msg', 'glg', 'resp'):
                 window = 'msg'
 
-            self.__logger.debug('window=%s, message=%s, color=%s', window, repr(message), color)
-            if isinstance(message, urwid.Widget): # a Widget?
-                wid = message
-            elif isinstance(message, str):        # a bare string gets color
-                wid = Text((color, message))
+            if self.__logger.isEnabledFor(logging.DEBUG):
+                self.__logger.debug('window=%s, message=%r, color=%s', window, message, color)
+            if isinstance(message, str):        # a bare string gets color
+                wid = (color, message)
             else:
-                wid = Text(message)               # probably a tuple
+                wid = message                   # a Widget or probably a tuple
 
             self.windows[window].append(wid)
+            self._dirty = True
+
+        else:
+            self.call_soon(self.putline, window, message, color)
+
+    def show_glg(self, walker=None, title=None):
+        """Show a ListWalker (a history view) in place of the Channel Monitor.
+
+        Args:
+            walker (urwid.ListWalker): What to show, None to return to the live monitor
+            title (str): Window title for the walker
+        """
 
+        if walker is None:
+            self.glg_pane.original_widget = self.glg
         else:
-            self.__logger.debug('redirect: "%s", "%s", "%s"', window, message, color)
-            self.set_alarm_in(0.0, self._alarm_putline, user_data=(window, message, color))
+            window = Monwin.ScrollWin(title)
+            window.scroller.body = walker
+            self.glg_pane.original_widget = window
+
+        self._dirty = True
 
     def alert(self, message):
         """Display an ALERT message in the message window.
 
         Args:
             message (str): Alert message to display.
-
-        .. TODO:: Sound an alarm??
         """
 
         self.message(message, color="ALERT")
 
+    def bell(self):
+        """Sound the terminal bell.
+        """
+
+        if self.thread_id == threading.get_ident():
+            if self.screen.started:
+                self.screen.write('\a')
+                self.screen.flush()
+        else:
+            self.call_soon(self.bell)
+
     def message(self, message, color="WARN"):
         """Put a message in the message window
 
@@ -365,21 +626,6 @@ class Monwin(urwid.MainLoop):
         it = datetime.now().strftime('%Y-%m-%dT%H:%M:%S')
         self.putline("msg", "{} {}".format(it, message), color)
 
-    def _alarm_set_widget_text(self, main_loop, user_data):
-        """set_alarm target methos for set_widget_text.
-
-        Receives the arguments from set_alarm and re-calls set_widget_text on the
-        main thread.
-
-        Args:
-            main_loop (urwid.main_loop): Standard args for set_alarm method
-            user_data (object): Standard args for set_alarm method
-        """
-
-        del main_loop    # unused
-        (wid, txt) = user_data
-        self.set_widget_text(wid, txt)
-
     def set_widget_text(self, wid, txt):
         """Performs set_widget_text for the supplied widget.
 
@@ -391,10 +637,12 @@ class Monwin(urwid.MainLoop):
         """
 
         if self.thread_id == threading.get_ident():
-            self.__logger.debug(txt)
-            wid.set_widget_text(txt)
+            if self.__logger.isEnabledFor(logging.DEBUG):
+                self.__logger.debug('%s', txt)
+            wid.set_text(txt)
+            self._dirty = True
         else:
-            self.set_alarm_in(0.0, self._alarm_set_widget_text, (wid, txt))
+            self.call_soon(wid.set_text, txt)
 
     def do_it(self, callback, data=None, delay_time=0.0):
         """Called by other threads, schedules a method call for execution by main_loop
@@ -405,7 +653,7 @@ class Monwin(urwid.MainLoop):
             delay_time (float): Delay time in seconds
         """
 
-        self.set_alarm_in(delay_time, callback, data)
+        self.call_soon(self.set_alarm_in, delay_time, callback, data)
 
     def do_quit(self, main_loop=None, user_data=None):
         """Raise urwid.ExitMainLoop to stop the system
@@ -422,7 +670,7 @@ class Monwin(urwid.MainLoop):
         if self.thread_id == threading.get_ident():
             raise urwid.ExitMainLoop
         else:
-            self.set_alarm_in(0.1, self.do_quit)
+            self.call_soon(self.do_quit)
 
     def dispatch_command(self, inputstr):
         """Dummy routine. Must be overridden by the subclass.
@@ -453,12 +701,33 @@ if __name__ == '__main__':
             now_start = time.time()
             time.sleep(5)
             now_stop = time.time()
-            loop_test_time = "loop test took {:5.3f} seconds".format(now_stop - now_start)
+            loop_test_time = "loop test took {:5.3f} seconds, {:d} redraws".format(
+                now_stop - now_start, monwin.redraws)
             monwin.alert(loop_test_time)
             monwin.set_widget_text(monwin.ver, 'Ver 2.3.4')
 
             dologger.info(loop_test_time)
 
+        def burst_test(count=10000):
+            """A burst of lines from a worker thread
+            """
+
+            dologger = logging.getLogger(__name__)
+            wakeups = monwin.wakeups
+            now_start = time.time()
+
+            def burst_done():
+                """Runs on the main loop after the last burst line"""
+                burst_time = "burst of {:d} lines took {:5.3f} seconds, {:d} wakeups".format(
+                    count, time.time() - now_start, monwin.wakeups - wakeups)
+                monwin.alert(burst_time)
+                dologger.info(burst_time)
+
+            for i in range(count):
+                monwin.putline('resp', 'burst line {:d}'.format(i))
+
+            monwin.call_soon(burst_done)
+
         fmt = '%(asctime)s -%(levelname)s- *%(threadName)s* %%%(funcName)s%% %(message)s'
         logging.basicConfig(filename='Monwin.log', filemode='w', level=logging.DEBUG, format=fmt)
         logger = logging.getLogger(__name__)
@@ -467,8 +736,9 @@ if __name__ == '__main__':
         monwin = Monwin(None)
 
         loop_test = threading.Thread(target=loop_test, name='LoopTest')
-        _do_nothing(monwin, None)
+        burst_test = threading.Thread(target=burst_test, name='BurstTest')
         loop_test.start()
+        burst_test.start()
         monwin.run()
 
         logger.info("That took %5.3f seconds", time.time() - now1)
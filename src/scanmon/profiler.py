@@ -0,0 +1,117 @@
+"""
+Profiler - A sampling profiler that can be started and stopped while running.
+
+`Source <src/scanmon.profiler.html>`__
+
+A background thread takes the stack of every other thread at a fixed interval
+(``sys._current_frames``). Nothing is hooked into the profiled code so the cost
+is the sampling thread alone and profiling can be turned on in production.
+
+The samples are written as collapsed stacks, one ``thread;frame;frame count``
+line per distinct stack, the input format of flamegraph.pl and speedscope.
+"""
+
+import collections
+import logging
+import os
+import sys
+import threading
+import time
+
+INTERVAL = 0.01     # Seconds between samples
+
+class SamplingProfiler(threading.Thread):
+    """Sample the stacks of all threads until stopped.
+
+    Args:
+        interval (float): Seconds between samples
+    """
+
+    def __init__(self, interval=INTERVAL):
+        super().__init__()
+        self.__logger = logging.getLogger(__name__).getChild(type(self).__name__)
+        self.daemon = True
+        self.name = "**Profiler**"
+        self.interval = interval
+        self.stacks = collections.Counter()     # (thread, frames...) to samples
+        self.samples = 0
+        self.started = None
+        self.elapsed = 0.0
+        self._stopping = threading.Event()
+        self._codes = {}    # Code object to frame label
+
+    def _label(self, code):
+        """The frame label for a code object, file:function
+        """
+
+        label = self._codes.get(code)
+        if label is None:
+            label = '{}:{}'.format(os.path.basename(code.co_filename), code.co_name)
+            self._codes[code] = label
+        return label
+
+    def sample(self):
+        """Add the current stack of every thread except this one.
+        """
+
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for (ident, frame) in sys._current_frames().items():   # pylint: disable=protected-access
+            if ident == self.ident:
+                continue
+
+            stack = []
+            while frame is not None:
+                stack.append(self._label(frame.f_code))
+                frame = frame.f_back
+            stack.append(names.get(ident, str(ident)))
+            stack.reverse()
+            self.stacks[tuple(stack)] += 1
+
+        self.samples += 1
+
+    def run(self):
+        self.__logger.info("Sampling every %.1f ms", self.interval * 1000)
+        self.started = time.monotonic()
+        next_sample = self.started
+        while not self._stopping.is_set():
+            self.sample()
+            next_sample += self.interval
+            delay = next_sample - time.monotonic()
+            if delay < 0:
+                next_sample = time.monotonic()     # Fell behind, do not catch up
+                delay = 0
+            self._stopping.wait(delay)
+
+        self.elapsed = time.monotonic() - self.started
+        self.__logger.info("Stopped: %d samples in %.1fs", self.samples, self.elapsed)
+
+    def stop(self):
+        """Stop sampling and wait for the thread.
+        """
+
+        self._stopping.set()
+        self.join()
+
+    def write_collapsed(self, filename):
+        """Write the samples as collapsed stacks.
+        """
+
+        with open(filename, 'w') as outfile:
+            for (stack, count) in sorted(self.stacks.items()):
+                outfile.write('{} {}\n'.format(';'.join(stack), count))
+
+    def top(self, count=10):
+        """The functions with the most samples.
+
+        Returns:
+            [(label, self samples, total samples), ...] by self samples
+        """
+
+        own = collections.Counter()
+        total = collections.Counter()
+        for (stack, samples) in self.stacks.items():
+            own[stack[-1]] += samples
+            for label in set(stack[1:]):
+                total[label] += samples
+
+        return [(label, samples, total[label]) for (label, samples) in own.most_common(count)]
@@ -0,0 +1,504 @@
+"""
+Progcache - Download the scanner's programming into a local SQLite cache.
+
+`Source <src/scanmon.progcache.html>`__
+
+Systems, groups and channels (conventional channels and talkgroups) are linked
+lists through memory indexes: SIH gives the first system, each record gives the
+next record of its list and the head of the list it owns. Only the next record of
+a list is known, so the lists are walked side by side: the Scanner is in batch
+mode, up to ``window`` commands are in flight (at most one per list) and the
+responses, which come back in order, are matched to them first in first out.
+Each record's backward index must point at the record before it, a response
+that does not fit makes the downloader wait for the line to go quiet and send
+the unanswered commands again.
+
+The cache keeps every record with its raw response and indexes the channels by
+frequency (integer Hz) and TGID. An incremental sync reads every system and group
+record again but only walks the channels of groups that are new or whose record
+changed (a channel added at the end or removed at either end changes the group's
+channel list head or tail). A channel edited in place leaves its group record as
+it was; a full sync picks that up. A sync is one transaction, an interrupted sync
+leaves the cache as it was.
+
+The scanner is put in program mode for the download, scanmon must not be running.
+Run with ``python3 -m scanmon.progcache``.
+"""
+
+import argparse
+import collections
+import configparser
+import logging
+import select
+import sqlite3
+import sys
+import time
+from datetime import datetime
+
+from scanmon.enrich import parse_frq_tgid
+from scanmon.scanner import Scanner, Command
+from scanmon.scanner.formatter import Response
+
+WINDOW = 16         # Commands in flight
+TIMEOUT = 2.0       # Seconds without a response before the commands in flight are sent again
+QUIET = 0.3         # Seconds without input before sending again after a mismatch
+MAXTRIES = 5        # Sends of one command before the sync fails
+PROGRESS = 1.0      # Seconds between progress reports
+NONE = -1           # No index
+
+_RECORDS = ('SIN', 'GIN', 'CIN', 'TIN')
+
+class SyncError(RuntimeError):
+    """The download could not be completed.
+    """
+
+def frequency_hz(frq_tgid):
+    """The frequency in Hz of a GLG FRQ_TGID in MHz, None if it is a TGID.
+    """
+
+    return parse_frq_tgid(frq_tgid)[0]
+
+class ProgramCache(object):
+    """The scanner's programming in SQLite.
+
+    Args:
+        database (str): The cache file
+    """
+
+    def __init__(self, database):
+        self.__logger = logging.getLogger(__name__).getChild(type(self).__name__)
+        self.database = database
+        self.dbconn = sqlite3.connect(database, detect_types=sqlite3.PARSE_DECLTYPES)
+        self.dbconn.row_factory = sqlite3.Row
+        with self.dbconn:
+            self.dbconn.execute("""CREATE TABLE IF NOT EXISTS "System"
+                ("Idx" integer PRIMARY KEY,
+                 "Type" text,
+                 "Name" text,
+                 "Lockout" integer,
+                 "Raw" text,
+                 "Sync" integer)""")
+            self.dbconn.execute("""CREATE TABLE IF NOT EXISTS "Grp"
+                ("Idx" integer PRIMARY KEY,
+                 "SysIdx" integer,
+                 "Type" text,
+                 "Name" text,
+                 "Lockout" integer,
+                 "Raw" text,
+                 "Sync" integer)""")
+            self.dbconn.execute("""CREATE TABLE IF NOT EXISTS "Channel"
+                ("Idx" integer PRIMARY KEY,
+                 "SysIdx" integer,
+                 "GrpIdx" integer,
+                 "Kind" text,
+                 "Name" text,
+                 "FrequencyHz" integer,
+                 "TGID" text,
+                 "Modulation" text,
+                 "CTCSS_DCS" text,
+                 "Lockout" integer,
+                 "Priority" integer,
+                 "NumberTag" text,
+                 "Raw" text,
+                 "Sync" integer)""")
+            self.dbconn.execute('CREATE INDEX IF NOT EXISTS "Channel_FrequencyHz" '
+                                'ON "Channel" ("FrequencyHz")')
+            self.dbconn.execute('CREATE INDEX IF NOT EXISTS "Channel_TGID" ON "Channel" ("TGID")')
+            self.dbconn.execute('CREATE INDEX IF NOT EXISTS "Channel_GrpIdx" ON "Channel" ("GrpIdx")')
+            self.dbconn.execute("""CREATE TABLE IF NOT EXISTS "Sync"
+                ("Id" integer PRIMARY KEY,
+                 "Started" timestamp,
+                 "Seconds" real,
+                 "Full" boolean,
+                 "Commands" integer,
+                 "Systems" integer,
+                 "Groups" integer,
+                 "Fetched" integer,
+                 "Kept" integer)""")
+
+    def begin(self, full):
+        """Start a sync, returns its id. Everything up to :meth:`finish` is one transaction.
+        """
+
+        return self.dbconn.execute('INSERT INTO "Sync" ("Started", "Full") VALUES (?, ?)',
+                                   (datetime.now(), full)).lastrowid
+
+    def group_raw(self, index):
+        """The cached GIN response of a group, None if not cached
+        """
+
+        row = self.dbconn.execute('SELECT "Raw" FROM "Grp" WHERE "Idx" = ?', (index,)).fetchone()
+        return row[0] if row else None
+
+    def store_system(self, index, resp, sync):
+        """Store a SIN response
+        """
+
+        self.dbconn.execute('INSERT OR REPLACE INTO "System" VALUES (?, ?, ?, ?, ?, ?)',
+                            (index, resp.SYS_TYPE, resp.NAME, _int(resp.LOUT), resp.response, sync))
+
+    def store_group(self, index, resp, sync):
+        """Store a GIN response
+        """
+
+        self.dbconn.execute('INSERT OR REPLACE INTO "Grp" VALUES (?, ?, ?, ?, ?, ?, ?)',
+                            (index, _int(resp.SYS_INDEX), resp.GRP_TYPE, resp.NAME,
+                             _int(resp.LOUT), resp.response, sync))
+
+    def store_channel(self, index, resp, sync):
+        """Store a CIN or TIN response
+        """
+
+        if resp.CMD == 'CIN':
+            (frequency, tgid) = (_int(resp.FRQ) * 100 if _int(resp.FRQ) is not None else None, None)
+        else:
+            (frequency, tgid) = (None, resp.TGID)
+
+        self.dbconn.execute('INSERT OR REPLACE INTO "Channel" VALUES '
+                            '(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                            (index, _int(resp.SYS_INDEX), _int(resp.GRP_INDEX), resp.CMD[0],
+                             resp.NAME, frequency, tgid, resp.MOD, resp.CTCSS_DCS,
+                             _int(resp.LOUT), _int(resp.PRI), resp.NUMBER_TAG,
+                             resp.response, sync))
+
+    def keep_group(self, index, sync):
+        """Keep the cached channels of an unchanged group, returns how many
+        """
+
+        return self.dbconn.execute('UPDATE "Channel" SET "Sync" = ? WHERE "GrpIdx" = ?',
+                                   (sync, index)).rowcount
+
+    def finish(self, sync, stats):
+        """Drop everything the sync did not see, record the statistics and commit.
+
+        Args:
+            sync (int): The sync id
+            stats (dict): Seconds, Commands, Systems, Groups, Fetched and Kept
+        """
+
+        for table in ('System', 'Grp', 'Channel'):
+            self.dbconn.execute('DELETE FROM "{}" WHERE "Sync" != ?'.format(table), (sync,))
+        self.dbconn.execute('UPDATE "Sync" SET "Seconds" = :Seconds, "Commands" = :Commands, '
+                            '"Systems" = :Systems, "Groups" = :Groups, "Fetched" = :Fetched, '
+                            '"Kept" = :Kept WHERE "Id" = :Id', dict(stats, Id=sync))
+        self.dbconn.commit()
+
+    def abort(self):
+        """Throw away an unfinished sync
+        """
+
+        self.dbconn.rollback()
+
+    def lookup(self, frq_tgid, system=None):
+        """The programmed channels for a GLG FRQ_TGID.
+
+        Args:
+            frq_tgid (str): Frequency in MHz or TGID as GLG gives it
+            system (str): Optional system name, talkgroups are only unique in a system
+
+        Returns:
+            [sqlite3.Row, ...] with the Channel columns, SystemName and GroupName
+        """
+
+        hertz = frequency_hz(frq_tgid)
+        (column, value) = ('"FrequencyHz"', hertz) if hertz is not None else ('"TGID"', frq_tgid.strip())
+        query = ('SELECT "Channel".*, "System"."Name" AS "SystemName", "Grp"."Name" AS "GroupName" '
+                 'FROM "Channel" JOIN "System" ON "System"."Idx" = "Channel"."SysIdx" '
+                 'JOIN "Grp" ON "Grp"."Idx" = "Channel"."GrpIdx" '
+                 'WHERE "Channel".{} = ?'.format(column))
+        params = [value]
+        if system is not None:
+            query += ' AND "System"."Name" = ?'
+            params.append(system)
+
+        return self.dbconn.execute(query, params).fetchall()
+
+    def counts(self):
+        """(systems, groups, channels) in the cache
+        """
+
+        return tuple(self.dbconn.execute('SELECT count(*) FROM "{}"'.format(table)).fetchone()[0]
+                     for table in ('System', 'Grp', 'Channel'))
+
+    def close(self):
+        """Close the cache
+        """
+
+        self.dbconn.close()
+
+def _int(value):
+    """An index or number field, None if empty or garbled
+    """
+
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+class Downloader(object):
+    """Walk the scanner's memory into a ProgramCache.
+
+    Args:
+        scanner (Scanner): The scanner, in batch mode
+        cache (ProgramCache): The cache
+        full (bool): Fetch every channel, not only those of changed groups
+        window (int): Commands in flight
+        progress (function): Optional. Called with the Downloader about every second
+    """
+
+    def __init__(self, scanner, cache, full=False, window=WINDOW, progress=None):
+        self.__logger = logging.getLogger(__name__).getChild(type(self).__name__)
+        self.scanner = scanner
+        self.cache = cache
+        self.full = full
+        self.window = max(int(window), 1)
+        self.progress = progress
+        self.sync = None
+        self.started = None
+        self.commands = 0
+        self.resends = 0
+        self.systems = 0
+        self.groups = 0
+        self.fetched = 0        # Channels read from the scanner
+        self.kept = 0           # Channels kept from the cache
+        self._ready = collections.deque()       # [cmd, index, prev, handler, tries]
+        self._inflight = collections.deque()
+        self._resync = False
+        self._failed = None
+
+        for cmd in ('PRG', 'EPG', 'SIH') + _RECORDS:
+            scanner.watch_command(Command(cmd, callback=self._response))
+
+    @property
+    def elapsed(self):
+        """Seconds since the download started
+        """
+
+        return time.monotonic() - self.started if self.started else 0.0
+
+    def _request(self, cmd, index=None, prev=NONE, handler=None):
+        """Queue a command, *handler* gets (index, response)
+        """
+
+        self._ready.append([cmd, index, prev, handler, 0])
+
+    def _pump(self):
+        """Send queued commands while the window has room
+        """
+
+        while self._ready and len(self._inflight) < self.window and not self._resync:
+            request = self._ready.popleft()
+            request[4] += 1
+            if request[4] > MAXTRIES:
+                self._failed = "No valid response to {} {}".format(request[0], request[1])
+                return
+            (cmd, index) = request[:2]
+            self.scanner.send_command(Command(cmd if index is None else '{},{}'.format(cmd, index)))
+            self._inflight.append(request)
+            self.commands += 1
+
+    def _response(self, command, response):
+        """Match a response to the oldest command in flight
+        """
+
+        del command
+        if self._resync:
+            return False        # Draining, everything in flight is sent again
+
+        if not self._inflight:
+            self.__logger.warning("Unexpected response: %s", response.response)
+            return False
+
+        request = self._inflight[0]
+        (cmd, index, prev, handler, _) = request
+        if response.CMD != cmd or (cmd in _RECORDS and (
+                response.status != Response.RESP or _int(response.REV_INDEX) != prev)):
+            self.__logger.info("Response %r does not fit %s %s, sending again",
+                               response.response, cmd, index)
+            self._resync = True
+            return False
+
+        self._inflight.popleft()
+        if cmd == 'PRG' and response.status != Response.OK:
+            self._failed = "The scanner refused program mode: {}".format(response.response)
+        elif handler:
+            handler(index, response)
+        return False
+
+    def _send_again(self):
+        """Put the commands in flight back at the front of the queue
+        """
+
+        self.resends += len(self._inflight)
+        self._ready.extendleft(reversed(self._inflight))
+        self._inflight.clear()
+        self._resync = False
+
+    def _on_head(self, _, resp):
+        head = _int(resp.SYS_INDEX)
+        if head is not None and head != NONE:
+            self._request('SIN', head, NONE, self._on_system)
+
+    def _on_system(self, index, resp):
+        self.systems += 1
+        self.cache.store_system(index, resp, self.sync)
+        chncmd = 'CIN' if resp.SYS_TYPE == 'CNV' else 'TIN'
+        for (nxt, cmd, handler) in ((_int(resp.FWD_INDEX), 'SIN', self._on_system),
+                                    (_int(resp.CHN_GRP_HEAD), 'GIN',
+                                     lambda idx, grp: self._on_group(idx, grp, chncmd))):
+            if nxt is not None and nxt != NONE:
+                self._request(cmd, nxt, index if cmd == 'SIN' else NONE, handler)
+
+    def _on_group(self, index, resp, chncmd):
+        self.groups += 1
+        unchanged = not self.full and self.cache.group_raw(index) == resp.response
+        self.cache.store_group(index, resp, self.sync)
+        nxt = _int(resp.FWD_INDEX)
+        if nxt is not None and nxt != NONE:
+            self._request('GIN', nxt, index, lambda idx, grp: self._on_group(idx, grp, chncmd))
+
+        if unchanged:
+            self.kept += self.cache.keep_group(index, self.sync)
+        else:
+            head = _int(resp.CHN_HEAD)
+            if head is not None and head != NONE:
+                self._request(chncmd, head, NONE, self._on_channel)
+
+    def _on_channel(self, index, resp):
+        self.fetched += 1
+        self.cache.store_channel(index, resp, self.sync)
+        nxt = _int(resp.FWD_INDEX)
+        if nxt is not None and nxt != NONE:
+            self._request(resp.CMD, nxt, index, self._on_channel)
+
+    def _drive(self):
+        """Send, read and match until nothing is queued or in flight
+        """
+
+        last_input = time.monotonic()
+        last_report = last_input
+        while (self._ready or self._inflight) and not self._failed:
+            self._pump()
+            self.scanner.flush_commands()
+            (readable, _, _) = select.select([self.scanner.fileno], [], [], 0.05)
+            now = time.monotonic()
+            if readable:
+                self.scanner.read_scanner()
+                last_input = now
+            elif self._inflight and now - last_input > (QUIET if self._resync else TIMEOUT):
+                if not self._resync:
+                    self.__logger.warning("No response in %.1fs, sending again", TIMEOUT)
+                self._send_again()
+                last_input = now
+
+            if self.progress and now - last_report >= PROGRESS:
+                self.progress(self)
+                last_report = now
+
+        if self._failed:
+            raise SyncError(self._failed)
+
+    def run(self):
+        """Download the programming, leave program mode and commit the cache.
+
+        Raises:
+            SyncError: The scanner refused program mode or stopped answering
+        """
+
+        self.started = time.monotonic()
+        self.sync = self.cache.begin(self.full)
+        try:
+            self._request('PRG')
+            self._request('SIH', handler=self._on_head)
+            try:
+                self._drive()
+            finally:
+                self._failed = None
+                self._ready.clear()
+                self._inflight.clear()
+                self._request('EPG')
+                self._drive()
+        except BaseException:
+            self.cache.abort()
+            raise
+
+        self.cache.finish(self.sync, self.stats())
+
+    def stats(self):
+        """The statistics stored with the sync
+        """
+
+        return {'Seconds': self.elapsed, 'Commands': self.commands, 'Systems': self.systems,
+                'Groups': self.groups, 'Fetched': self.fetched, 'Kept': self.kept}
+
+    def report(self):
+        """One line of progress and throughput
+        """
+
+        elapsed = max(self.elapsed, 1e-9)
+        return ("{} systems, {} groups, {} channels fetched, {} kept, {} commands "
+                "({} sent again) in {:.1f}s, {:.0f} commands/s").format(
+                    self.systems, self.groups, self.fetched, self.kept, self.commands,
+                    self.resends, elapsed, self.commands / elapsed)
+
+def main():
+    """Parse the arguments and sync the cache.
+    """
+
+    parser = argparse.ArgumentParser(description="Download the scanner's programming",
+                                     prog="scanmon-progcache")
+    parser.add_argument("--config", "-C",
+                        default="config.ini",
+                        help="Configuration file for the device and cache, default config.ini")
+    parser.add_argument("--scanner", "-s",
+                        dest='device',
+                        default=None,
+                        help="Scanner device, default from the configuration")
+    parser.add_argument("--cache",
+                        default=None,
+                        help="Cache file, default from the configuration or progcache.db")
+    parser.add_argument("--full",
+                        action='store_true',
+                        help="Fetch every channel, not only those of changed groups")
+    parser.add_argument("--window",
+                        type=int,
+                        default=WINDOW,
+                        help="Commands in flight, default {}".format(WINDOW))
+    parser.add_argument("--lookup",
+                        metavar="FRQ_TGID",
+                        default=None,
+                        help="Show the cached channels for a frequency (MHz) or TGID, no sync")
+    parser.add_argument("--debug", "-d",
+                        action='store_true',
+                        help="Debugging flag")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.DEBUG if args.debug else logging.WARNING)
+    config = configparser.ConfigParser()
+    config.read(args.config)
+    device = args.device or config.get('scanner', 'device', fallback=None)
+    cache = ProgramCache(args.cache or config.get('scanner', 'progcache', fallback='progcache.db'))
+
+    if args.lookup:
+        for row in cache.lookup(args.lookup):
+            print("{SystemName} | {GroupName} | {Name} | {FrequencyHz} | {TGID} | {Modulation}".format(
+                **dict(zip(row.keys(), row))))
+        return 0
+
+    scanner = Scanner(device, batch=True)
+    downloader = Downloader(scanner, cache, full=args.full, window=args.window,
+                            progress=lambda dl: print('\r' + dl.report(), end='', flush=True))
+    try:
+        downloader.run()
+    except SyncError as err:
+        print("\nSync failed:", err)
+        return 1
+    finally:
+        scanner.close()
+
+    print('\r' + downloader.report())
+    print("Cache {}: {} systems, {} groups, {} channels".format(cache.database, *cache.counts()))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
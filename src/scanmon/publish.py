@@ -0,0 +1,315 @@
+"""Publish - Send completed Receptions to a central aggregator
+
+Each completed Reception is written to a local SQLite spool with a sequence
+number, then streamed to the aggregator (:mod:`scanmon.aggregator`) over TCP as
+one JSON object per line. The aggregator acknowledges the highest sequence
+number it has committed and acknowledged rows leave the spool, so delivery is
+at least once: anything unacknowledged is sent again after a reconnect, and
+the spool keeps receptions across a lost network or a restart.
+
+The protocol, one JSON object per line in each direction::
+
+    node:        {"hello": NODE, "epoch": EPOCH}
+    aggregator:  {"ack": SEQ}                   the last committed sequence
+    node:        {"seq": SEQ, "reception": {...}}
+    aggregator:  {"ack": SEQ}                   after each commit
+
+The epoch is a random id made with the spool, a new spool starts its sequence
+numbers again under a new epoch.
+
+`Source <src/scanmon.publish.html>`__
+"""
+
+import base64
+import json
+import logging
+import queue
+import select
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+
+FIELDS = ('starttime', 'duration', 'system', 'group', 'channel', 'frequency_tgid', 'ctcss_dcs',
+          'modulation', 'attenuation', 'system_tag', 'channel_tag', 'p25nac', 'clip',
+          'duration_ms', 'start_utc_ms', 'signal_kind', 'signal', 'signal_min', 'signal_mean',
+          'signal_max', 'frequency_hz', 'tgid', 'agency_id', 'service_id', 'tagset_id')
+
+def encode_record(params, names=None):
+    """The Reception column values as a JSON-able dict.
+
+    Args:
+        params (dict): The named parameters of the Reception insert
+        names (dict): Optional. Names of the reference ids in the record
+
+    Returns:
+        dict
+    """
+
+    record = {name: params.get(name) for name in FIELDS}
+    record['starttime'] = params['starttime'].isoformat()
+    if record['signal'] is not None:
+        record['signal'] = base64.b64encode(record['signal']).decode('ascii')
+    if names:
+        record['names'] = [[ident, name] for (ident, name) in names.items()]
+    return record
+
+def decode_record(record):
+    """The named parameters of a Reception insert from a published record.
+
+    Raises:
+        KeyError, TypeError, ValueError: Not a Reception record
+    """
+
+    params = {name: record.get(name) for name in FIELDS}
+    params['starttime'] = datetime.fromisoformat(record['starttime'])
+    params['start_utc_ms'] = int(record['start_utc_ms'])
+    params['duration_ms'] = int(record['duration_ms'])
+    if params['signal'] is not None:
+        params['signal'] = base64.b64decode(params['signal'])
+    return params
+
+class LineReader(object):
+    """Splits the lines of a socket stream into JSON objects.
+
+    Args:
+        sock (socket.socket): The connected socket
+    """
+
+    LIMIT = 1 << 20     # Longest line
+
+    def __init__(self, sock):
+        self.sock = sock
+        self._buffer = b''
+
+    def read(self):
+        """Receive once and return the complete objects, blocks with the socket timeout.
+
+        Raises:
+            ConnectionError: The peer closed the connection or sent a line too long
+            ValueError: A line is not JSON
+        """
+
+        data = self.sock.recv(65536)
+        if not data:
+            raise ConnectionError("connection closed")
+        lines = (self._buffer + data).split(b'\n')
+        self._buffer = lines.pop()
+        if len(self._buffer) > LineReader.LIMIT:
+            raise ConnectionError("line longer than {} bytes".format(LineReader.LIMIT))
+        return [json.loads(line) for line in lines if line.strip()]
+
+class Publisher(threading.Thread):
+    """Spools Receptions and streams them to the aggregator, on its own thread.
+
+    Args:
+        node (str): This node's name
+        address ((str, int)): Aggregator host and port
+        spoolpath (str): The spool database
+    """
+
+    WINDOW = 2000       # Receptions sent and not acknowledged
+    BATCH = 200         # Receptions per send
+    WAIT = 0.05         # Seconds waiting for acknowledgements
+    IDLE = 1.0          # Seconds between stop checks with nothing to do
+    TIMEOUT = 10.0      # Seconds to connect, for the hello and for a send
+    RETRY = (1.0, 60.0) # Reconnect delay, doubles from the first to the second
+    LINGER = 2.0        # Seconds waiting for the last acknowledgements when stopping
+
+    def __init__(self, node, address, spoolpath):
+        super().__init__()
+        self.__logger = logging.getLogger(__name__).getChild(type(self).__name__)
+        self.node = node
+        self.address = address
+        self.spoolpath = spoolpath
+        self.daemon = True
+        self.name = "**Publisher**"
+        self._queue = queue.Queue()
+        self._stopping = False
+        self._sock = None
+        self._reader = None
+        self._spool = None
+        self.epoch = None
+        self.sent = 0           # Highest sequence number sent on this connection
+        self.acked = 0          # Highest acknowledged
+        self.spooled = 0        # Rows in the spool
+        self._unsent = True     # The spool may have rows after sent
+        self.connected = False
+        self._retry_at = 0.0
+        self._delay = Publisher.RETRY[0]
+
+    @property
+    def backlog(self):
+        """Receptions queued or spooled and not yet acknowledged
+        """
+
+        return self._queue.qsize() + self.spooled
+
+    def put(self, record):
+        """Queue a Reception record, see :func:`encode_record`.
+        """
+
+        self._queue.put(record)
+
+    def stop(self):
+        """Stop after spooling the queued records, the unsent ones stay in the spool.
+        """
+
+        self._queue.put(None)
+
+    def run(self):
+        """Spool, connect and send until stopped.
+        """
+
+        try:
+            self.open_spool()
+        except sqlite3.Error as err:
+            self.__logger.error("Cannot open the spool %s: %s", self.spoolpath, err)
+            return
+        self.__logger.info("Publishing as %s to %s:%d, %d spooled", self.node, *self.address, self.spooled)
+
+        while not self._stopping:
+            records = self.take(self.timeout())
+            if records:
+                self.spool(records)
+            if self._sock is None and time.monotonic() >= self._retry_at:
+                self.connect()
+            if self._sock is not None:
+                self.exchange()
+
+        linger = time.monotonic() + Publisher.LINGER
+        while self._sock is not None and self.acked < self.sent and time.monotonic() < linger:
+            self.exchange()
+        self.disconnect()
+        self._spool.close()
+        self.__logger.info("Stopped, %d spooled", self.spooled)
+
+    def timeout(self):
+        """Seconds to wait for the next record
+        """
+
+        if self._sock is None:
+            return max(min(self._retry_at - time.monotonic(), Publisher.IDLE), 0)
+        if self._unsent and self.sent - self.acked < Publisher.WINDOW:
+            return 0
+        return Publisher.WAIT if self.sent > self.acked else Publisher.IDLE
+
+    def take(self, timeout):
+        """The queued records, waiting up to *timeout* for the first
+        """
+
+        records = []
+        try:
+            item = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+            while True:
+                if item is None:
+                    self._stopping = True
+                else:
+                    records.append(item)
+                item = self._queue.get_nowait()
+        except queue.Empty:
+            pass
+        return records
+
+    def open_spool(self):
+        """Open (or create) the spool and its epoch.
+        """
+
+        self._spool = sqlite3.connect(self.spoolpath)
+        self._spool.execute("""CREATE TABLE IF NOT EXISTS "Spool"
+            ("Seq" integer PRIMARY KEY AUTOINCREMENT,
+             "Record" text)""")
+        self._spool.execute("""CREATE TABLE IF NOT EXISTS "SpoolEpoch" ("Epoch" text)""")
+        row = self._spool.execute('SELECT "Epoch" FROM "SpoolEpoch"').fetchone()
+        if row is None:
+            self.epoch = uuid.uuid4().hex
+            self._spool.execute('INSERT INTO "SpoolEpoch" VALUES (?)', (self.epoch,))
+        else:
+            self.epoch = row[0]
+        self._spool.commit()
+        self.spooled = self._spool.execute('SELECT COUNT(*) FROM "Spool"').fetchone()[0]
+
+    def spool(self, records):
+        """Store records in the spool, they get their sequence numbers
+        """
+
+        try:
+            self._spool.executemany('INSERT INTO "Spool" ("Record") VALUES (?)',
+                                    ((json.dumps(record, separators=(',', ':')),) for record in records))
+            self._spool.commit()
+            self.spooled += len(records)
+            self._unsent = True
+        except (sqlite3.Error, TypeError, ValueError) as err:
+            self.__logger.error("Cannot spool %d receptions: %s", len(records), err)
+
+    def connect(self):
+        """Connect and say hello, the acknowledged rows leave the spool.
+        """
+
+        try:
+            self._sock = socket.create_connection(self.address, timeout=Publisher.TIMEOUT)
+            self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+            self._reader = LineReader(self._sock)
+            self._sock.sendall(json.dumps({'hello': self.node, 'epoch': self.epoch}).encode() + b'\n')
+            replies = []
+            while not replies:
+                replies = self._reader.read()
+            self.sent = self.acked = int(replies[0]['ack'])
+            self.acknowledge(replies)
+            self._unsent = True
+        except (OSError, ValueError, KeyError, TypeError) as err:
+            self.disconnect(err)
+            return
+        self.connected = True
+        self._delay = Publisher.RETRY[0]
+        self.__logger.info("Connected to %s:%d, %d acknowledged, %d spooled",
+                           *self.address, self.acked, self.spooled)
+
+    def disconnect(self, err=None):
+        """Close the connection, reconnect after a delay when *err* is given.
+        """
+
+        if err is not None:
+            log = self.__logger.warning if self.connected or self._delay == Publisher.RETRY[0] \
+                else self.__logger.debug
+            log("Aggregator %s:%d: %s, retry in %.0f s", *self.address, err, self._delay)
+            self._retry_at = time.monotonic() + self._delay
+            self._delay = min(self._delay * 2, Publisher.RETRY[1])
+        if self._sock is not None:
+            self._sock.close()
+        self._sock = None
+        self.connected = False
+
+    def exchange(self):
+        """Send the next spooled rows in the window, read the acknowledgements.
+        """
+
+        try:
+            room = min(Publisher.WINDOW - (self.sent - self.acked), Publisher.BATCH)
+            if room > 0 and self._unsent:
+                rows = self._spool.execute('SELECT "Seq", "Record" FROM "Spool" WHERE "Seq" > ? '
+                                           'ORDER BY "Seq" LIMIT ?', (self.sent, room)).fetchall()
+                self._unsent = len(rows) == room
+                if rows:
+                    self._sock.sendall(''.join('{{"seq":{},"reception":{}}}\n'.format(seq, record)
+                                               for (seq, record) in rows).encode())
+                    self.sent = rows[-1][0]
+            if self.sent > self.acked and select.select([self._sock], [], [], Publisher.WAIT)[0]:
+                self.acknowledge(self._reader.read())
+        except (OSError, ValueError, KeyError, TypeError) as err:
+            self.disconnect(err)
+
+    def acknowledge(self, replies):
+        """Remove the acknowledged rows from the spool
+        """
+
+        if not replies:
+            return
+        ack = max(int(reply['ack']) for reply in replies)
+        if ack >= self.acked:
+            self.acked = ack
+            deleted = self._spool.execute('DELETE FROM "Spool" WHERE "Seq" <= ?', (ack,)).rowcount
+            self._spool.commit()
+            self.spooled -= deleted
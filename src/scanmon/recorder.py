@@ -0,0 +1,313 @@
+"""
+Recorder - Cut an audio clip of each Reception from the scanner audio stream.
+
+`Source <src/scanmon.recorder.html>`__
+
+The stream (the icecast mount fed by darkice, a raw PCM or MP3 file or a pipe) is
+read by a thread straight into a fixed size ring buffer, with the arrival time of
+each chunk kept in an index. When a Reception ends the monitor asks for its clip,
+which only queues the request. Once the post-roll has arrived the thread writes the
+clip from memoryviews of the ring, the audio is never copied in memory.
+
+Clips are cut at byte positions interpolated from arrival times. MP3 players skip
+the partial frame at either end.
+
+With ``squelchrefine`` on and a PCM source, the stream also feeds an
+:class:`~scanmon.squelch.EnergySquelch` and the audio edges of each Reception are
+passed back with its clip.
+"""
+
+import bisect
+import collections
+import logging
+import os
+import queue
+import re
+import threading
+import time
+
+BUFFERSIZE = 8 * 1024 * 1024    # Bytes, about 8 minutes of 128 kbit/s audio
+CHUNK = 4096                    # Bytes read at a time
+BYTERATE = 16000                # Bytes/s to pace a plain file, 128 kbit/s
+PREROLL = 1.0                   # Seconds before the reception
+POSTROLL = 1.0                  # Seconds after the reception
+RETRY = 5.0                     # Seconds to wait before reopening the source
+STOPWAIT = 2.0                  # Seconds stop waits for the pending clips
+
+class AudioRing(object):
+    """A fixed size byte ring with the arrival time of the data.
+
+    Positions are absolute byte counts since the ring was made, the ring holds
+    ``[start, end)``.
+
+    Args:
+        size (int): Bytes held
+    """
+
+    def __init__(self, size=BUFFERSIZE):
+        self.size = int(size)
+        self.buffer = bytearray(self.size)
+        self.view = memoryview(self.buffer)
+        self.end = 0
+        self._times = collections.deque()       # Arrival times ...
+        self._offsets = collections.deque()     # ... and end positions of the chunks
+
+    @property
+    def start(self):
+        """Oldest position held
+        """
+
+        return max(0, self.end - self.size)
+
+    def writable(self, limit=CHUNK):
+        """The free space to read into at the end, without wrapping.
+        """
+
+        pos = self.end % self.size
+        return self.view[pos:min(pos + limit, self.size)]
+
+    def commit(self, count, arrival=None):
+        """Account for *count* bytes read into :meth:`writable`.
+        """
+
+        if count <= 0:
+            return
+
+        self.end += count
+        self._times.append(time.time() if arrival is None else arrival)
+        self._offsets.append(self.end)
+        while len(self._offsets) > 1 and self._offsets[1] <= self.start:
+            self._times.popleft()
+            self._offsets.popleft()
+
+    def write(self, data, arrival=None):
+        """Copy *data* in, for sources that cannot read into the ring.
+        """
+
+        data = memoryview(data)
+        while data:
+            space = self.writable(len(data))
+            space[:] = data[:len(space)]
+            self.commit(len(space), arrival)
+            data = data[len(space):]
+
+    @property
+    def newest(self):
+        """Arrival time of the newest data, 0 if empty
+        """
+
+        return self._times[-1] if self._times else 0.0
+
+    def position(self, when):
+        """The position of the audio that arrived at *when*, inside the ring.
+        """
+
+        if not self._times:
+            return self.end
+
+        index = bisect.bisect_left(self._times, when)
+        if index == 0:
+            pos = self.start
+        elif index == len(self._times):
+            pos = self.end
+        else:
+            (time0, time1) = (self._times[index - 1], self._times[index])
+            (pos0, pos1) = (self._offsets[index - 1], self._offsets[index])
+            pos = pos0 + int((pos1 - pos0) * (when - time0) / max(time1 - time0, 1e-9))
+
+        return min(max(pos, self.start), self.end)
+
+    def slices(self, first, last):
+        """Memoryviews of ``[first, last)``, two if it wraps.
+        """
+
+        first = max(first, self.start, last - self.size)
+        if last <= first:
+            return []
+
+        (low, high) = (first % self.size, last % self.size or self.size)
+        if low < high:
+            return [self.view[low:high]]
+
+        return [self.view[low:], self.view[:high]]
+
+class ClipRecorder(threading.Thread):
+    """Read the audio stream and write a clip of each Reception.
+
+    Args:
+        config (configparser.SectionProxy): The [monitor] configuration
+    """
+
+    def __init__(self, config):
+        super().__init__()
+        self.__logger = logging.getLogger(__name__).getChild(type(self).__name__)
+        self.daemon = True
+        self.name = "**ClipRecorder**"
+        self.source = config.get('clipsource')
+        self.clipdir = config.get('clipdir', fallback='clips')
+        self.clipext = config.get('clipext', fallback='mp3')
+        self.preroll = config.getfloat('preroll', fallback=PREROLL)
+        self.postroll = config.getfloat('postroll', fallback=POSTROLL)
+        self.latency = config.getfloat('cliplatency', fallback=0.0)
+        self.byterate = config.getint('clipbyterate', fallback=BYTERATE)
+        self.ring = AudioRing(config.getint('clipbuffer', fallback=BUFFERSIZE))
+        self.squelch = None
+        if config.getboolean('squelchrefine', fallback=False):
+            from scanmon import squelch     # NumPy, only with squelchrefine
+            if squelch.AVAILABLE:
+                self.squelch = squelch.EnergySquelch(
+                    rate=config.getint('pcmrate', fallback=squelch.RATE),
+                    threshold=config.getfloat('squelchdb', fallback=squelch.THRESHOLD))
+            else:
+                self.__logger.warning("squelchrefine needs NumPy, edges are not refined")
+        self.clips = 0
+        self._requests = queue.SimpleQueue()
+        self._pending = []
+        self._running = False
+        self._stopping = threading.Event()
+        os.makedirs(self.clipdir, exist_ok=True)
+
+    def clip(self, reception, refined=None):
+        """Ask for the clip of a finished Reception. Only queues the request.
+
+        Args:
+            reception (Reception): The finished Reception
+            refined (function): Optional. Called on the recorder thread with the
+                audio start and end times (seconds since the epoch) when the clip
+                is cut, if the edges are being refined
+
+        Returns:
+            The path the clip will be written to, when its post-roll has arrived or
+            at the latest when the source drops or the recorder stops
+        """
+
+        start = reception.starttime.timestamp()
+        end = max(reception.last_active_time.timestamp(), start + reception.duration)
+        name = '{}-{}.{}'.format(reception.starttime.strftime('%Y%m%d-%H%M%S'),
+                                 re.sub(r'[^\w.-]+', '_', reception.sys_id), self.clipext)
+        path = os.path.join(self.clipdir, name)
+        self._requests.put((start - self.preroll + self.latency,
+                            end + self.postroll + self.latency, path,
+                            start, reception.last_active_time.timestamp(), refined))
+        return path
+
+    def _open(self):
+        """Open the source, returns (stream, paced)
+        """
+
+        if re.match(r'https?://', self.source):
+            from urllib.request import urlopen
+            return (urlopen(self.source, timeout=10), False)
+
+        # A pipe delivers in real time, a plain file is paced
+        return (open(self.source, 'rb', buffering=0), os.path.isfile(self.source))
+
+    def run(self):
+        self._running = True
+        while self._running:
+            try:
+                (stream, paced) = self._open()
+            except OSError as err:
+                self.__logger.error("Cannot open %s: %s", self.source, err)
+                self._stopping.wait(RETRY)
+                continue
+
+            self.__logger.info("Recording from %s", self.source)
+            with stream:
+                self._record(stream, paced)
+
+            # No more audio is coming for the clips already asked for
+            self._cut_due(final=True)
+            if self._running:
+                self._stopping.wait(RETRY)
+
+        self._cut_due(final=True)
+
+    def _record(self, stream, paced):
+        """Read the open stream into the ring and cut the clips that are due
+        """
+
+        started = time.monotonic()
+        count = 0
+        while self._running:
+            space = self.ring.writable()
+            try:
+                size = stream.readinto(space)
+            except OSError as err:
+                self.__logger.error("Reading %s: %s", self.source, err)
+                return
+
+            if not size:
+                self.__logger.warning("End of %s", self.source)
+                return
+
+            if paced:
+                count += size
+                delay = started + count / self.byterate - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+
+            self.ring.commit(size)
+            if self.squelch:
+                self.squelch.feed(space[:size], self.ring.newest)
+            self._cut_due()
+
+    def _cut_due(self, final=False):
+        """Write every clip whose post-roll has arrived, or with *final* every
+        pending clip from the audio there is
+        """
+
+        while True:
+            try:
+                self._pending.append(self._requests.get_nowait())
+            except queue.Empty:
+                break
+
+        newest = self.ring.newest
+        for request in [req for req in self._pending if final or req[1] <= newest]:
+            self._pending.remove(request)
+            (clip_start, clip_end, path, start, end, refined) = request
+            self._write(clip_start, clip_end, path)
+            if self.squelch and refined:
+                (start, end) = self.squelch.edges(start + self.latency, end + self.latency)
+                refined(start - self.latency, end - self.latency)
+
+    def _write(self, start, end, path):
+        """Write one clip from the ring
+        """
+
+        first = self.ring.position(start)
+        last = self.ring.position(end)
+        if last <= first:
+            self.__logger.warning("No audio for clip %s", path)
+            return
+        if first == self.ring.start:
+            self.__logger.warning("Clip %s starts before the buffer", path)
+
+        try:
+            with open(path, 'wb') as clipfile:
+                for part in self.ring.slices(first, last):
+                    clipfile.write(part)
+        except OSError:
+            self.__logger.exception("Writing clip %s", path)
+            return
+
+        self.clips += 1
+        self.__logger.debug("Clip %s: %d bytes", path, last - first)
+
+    def stop(self, wait=STOPWAIT):
+        """Stop after the current read and write the pending clips from the audio
+        already in the ring.
+
+        Args:
+            wait (float): Seconds to wait for the recorder thread, a source that
+                has stopped sending can hold it in a read longer
+        """
+
+        self._running = False
+        self._stopping.set()
+        if self.is_alive() and threading.current_thread() is not self:
+            self.join(wait)
+            if self.is_alive():
+                self.__logger.warning("Stopped while reading %s, %d clips not written",
+                                      self.source, len(self._pending) + self._requests.qsize())
@@ -0,0 +1,348 @@
+"""
+Scanmon replay - Feed captured scanner traffic through the decoders and the GLG monitor.
+
+`Source <src/scanmon.replay.html>`__
+
+The received lines of a capture are decoded by Response and dispatched exactly as
+Scanner.read_scanner would, to a real GLGMonitor. Virtual time replaces the clock:
+each response is stamped with its captured time and the monitor's alarms fire in
+virtual time. Replay can run in real time, at N times speed or as fast as possible.
+
+Run with ``scanmon-replay`` (src/scanmon-replay) or ``python3 -m scanmon.replay``.
+"""
+
+import argparse
+import configparser
+import heapq
+import itertools
+import logging
+import time
+from datetime import datetime
+
+from scanmon.glgmonitor import GLGMonitor
+from scanmon.scanner import Command, ResponseQueue, rle
+from scanmon.scanner.capture import RX, read_capture
+from scanmon.scanner.formatter import Response, ScannerDecodeError
+
+REBASE = 60 * 1000000000    # Monotonic and wall clock apart by more is a new boot
+
+class ReplayScanner(object):
+    """Stands in for Scanner. Commands are only watched, nothing is sent.
+    """
+
+    def __init__(self):
+        self._response_queue = ResponseQueue()
+        self.send_count = 0
+
+    def watch_command(self, command):
+        """Same as Scanner.watch_command
+        """
+
+        if command.callback is not None:
+            clist = self._response_queue[command.cmd]
+            clist.add(command)
+            self._response_queue[command.cmd] = clist
+
+    def send_command(self, cmdline):
+        """Watch the response, count the command.
+        """
+
+        self.watch_command(cmdline)
+        self.send_count += 1
+
+    def dispatch(self, response):
+        """Dispatch a response to the watchers.
+        """
+
+        self._response_queue.dispatch(response)
+
+class ReplayWin(object):
+    """Stands in for Monwin. Alarms run in virtual time, window output is counted.
+
+    Args:
+        scanner (ReplayScanner): The scanner stand-in
+    """
+
+    def __init__(self, scanner):
+        self.scanner = scanner
+        self.now = 0.0
+        self.lines = 0
+        self._alarms = []
+        self._sequence = itertools.count()
+
+    def set_alarm_in(self, sec, callback, user_data=None):
+        """Same as MainLoop.set_alarm_in but in virtual time.
+        """
+
+        return self.set_alarm_at(self.now + sec, callback, user_data)
+
+    def set_alarm_at(self, tm, callback, user_data=None):
+        """Same as MainLoop.set_alarm_at but in virtual time.
+        """
+
+        handle = (tm, next(self._sequence), callback, user_data)
+        heapq.heappush(self._alarms, handle)
+        return handle
+
+    def remove_alarm(self, handle):
+        """Same as MainLoop.remove_alarm.
+        """
+
+        try:
+            self._alarms.remove(handle)
+        except ValueError:
+            return False
+
+        heapq.heapify(self._alarms)
+        return True
+
+    def advance(self, newtime):
+        """Move virtual time forward, running every alarm due on the way.
+        """
+
+        while self._alarms and self._alarms[0][0] <= newtime:
+            (self.now, _, callback, user_data) = heapq.heappop(self._alarms)
+            callback(self, user_data)
+
+        self.now = max(self.now, newtime)
+
+    def putline(self, window, message, color='NORM'):
+        """Count the output lines
+        """
+
+        del window, message, color
+        self.lines += 1
+
+    def set_widget_text(self, wid, txt):
+        """Same as Monwin.set_widget_text
+        """
+
+        wid.set_text(txt)
+
+    def mark_dirty(self):
+        """Nothing is drawn
+        """
+
+    def message(self, message, color="WARN"):
+        """Log messages
+        """
+
+        del color
+        logging.getLogger(__name__).info(message)
+
+    alert = message
+
+    def bell(self):
+        """Nothing is sounded
+        """
+
+class Replay(object):
+    """Replay received lines into a GLGMonitor.
+
+    Args:
+        config (configparser.SectionProxy): The [monitor] configuration
+        speed (float): 1.0 is real time, N is N times real time, 0 is as fast as possible
+    """
+
+    def __init__(self, config, speed=0.0):
+        self.__logger = logging.getLogger(__name__).getChild(type(self).__name__)
+        self.speed = speed
+        self.scanner = ReplayScanner()
+        self.monwin = ReplayWin(self.scanner)
+        self.monitor = GLGMonitor(self.monwin, config=config)
+        self.scanner.watch_command(Command('GLG', callback=self.monitor.process))
+        self.scanner.watch_command(Command('*', callback=self.count_other))
+        self.lines = 0
+        self.errors = 0
+        self.other = 0
+        self.elapsed = 0.0
+        self._last_line = None
+        self._last_response = None
+
+    def count_other(self, command, response):
+        """Catch all for responses other than GLG.
+        """
+
+        del command, response
+        self.other += 1
+        return False
+
+    def feed(self, line, timestamp, mono_ns=None):
+        """Decode and dispatch one received line.
+
+        Args:
+            line (str): The line without the '\\\\r' terminator
+            timestamp (float): Receive time, seconds since the epoch
+            mono_ns (int): Optional. Captured monotonic time, without it (synthetic
+                traffic) the virtual time is the monotonic clock as well
+        """
+
+        self.monwin.advance(timestamp)
+        self.lines += 1
+        rtime = datetime.fromtimestamp(timestamp)
+        mono_ms = int(timestamp * 1000) if mono_ns is None else mono_ns // 1000000
+
+        if line == self._last_line:
+            # Repeats (most of an idle stream) reuse the previous decode
+            response = self._last_response.retime(rtime, mono_ms)
+        else:
+            try:
+                response = Response(line, timestamp=rtime, mono_ms=mono_ms)
+            except ScannerDecodeError:
+                self.__logger.warning("Undecodable line: %r", line)
+                self.errors += 1
+                return
+
+            self._last_line = line
+            self._last_response = response
+
+        self.scanner.dispatch(response)
+
+    def run(self, lines):
+        """Replay an iterable of (timestamp, line) pairs or (timestamp, line, mono_ns)
+        triples, then close the monitor.
+        """
+
+        start = time.perf_counter()
+        first = None
+        started = False
+
+        for (timestamp, line, *mono_ns) in lines:
+            if not started:
+                # Begin monitoring at the first line, just as a live start would
+                self.monwin.now = timestamp
+                self.monitor.start()
+                started = True
+                first = timestamp
+
+            if self.speed > 0:
+                wait = (timestamp - first) / self.speed - (time.perf_counter() - start)
+                if wait > 0:
+                    time.sleep(wait)
+
+            self.feed(line, timestamp, *mono_ns)
+
+        self.monitor.stop()
+        self.monitor.close()
+        self.elapsed = time.perf_counter() - start
+
+    def report(self):
+        """Format the throughput summary.
+        """
+
+        elapsed = self.elapsed or float('nan')
+        return ("{lines} lines ({errors} errors, {other} other) {receptions} receptions "
+                "in {elapsed:.3f}s: {lps:.1f} lines/s, {rps:.1f} receptions/s").format(
+                    lines=self.lines,
+                    errors=self.errors,
+                    other=self.other,
+                    receptions=self.monitor.reception_count,
+                    elapsed=self.elapsed,
+                    lps=self.lines / elapsed,
+                    rps=self.monitor.reception_count / elapsed)
+
+def capture_lines(capture, since=None):
+    """The received lines of a capture as (timestamp, line, mono_ns) triples.
+
+    The monotonic times are the captured ones. Segments from another boot have an
+    unrelated monotonic clock, where it goes back or strays from the wall clock by
+    more than :data:`REBASE` ns it is continued from the last record by the wall
+    clock gap, as :func:`rle.compress_capture` does for a whole capture.
+
+    Args:
+        capture (str): Raw capture path prefix or a run file name
+        since (float): Optional start time (seconds since the epoch)
+    """
+
+    if capture.endswith(rle.SUFFIX):
+        records = rle.expand(capture)
+        since_ns = None if since is None else int(since * 1e9)
+    else:
+        records = read_capture(capture, since=since)
+        since_ns = None
+
+    last = None
+    offset = 0
+    previous = None     # (wall_ns, mono_ns) of the last record
+    for record in records:
+        if previous is not None:
+            mono_ns = record.mono_ns + offset
+            wall_gap = record.wall_ns - previous[0]
+            if mono_ns < previous[1] or abs(mono_ns - previous[1] - wall_gap) > REBASE:
+                offset += previous[1] + max(wall_gap, 0) - mono_ns
+        previous = (record.wall_ns, record.mono_ns + offset)
+
+        if record.direction == RX and (since_ns is None or record.wall_ns >= since_ns):
+            if record.data is not last:
+                # Run records share one bytes object, decode it once
+                last = record.data
+                line = bytes(last).decode('utf-8', 'ignore')
+            yield (record.wall_ns / 1e9, line, previous[1])
+
+def main():
+    """Parse the arguments and run the replay.
+    """
+
+    parser = argparse.ArgumentParser(description="Replay captured scanner traffic",
+                                     prog="scanmon-replay")
+    parser.add_argument("capture",
+                        help="Capture path prefix or run file (.srle)")
+    parser.add_argument("--speed",
+                        type=float,
+                        default=0.0,
+                        help="Replay speed, 1 is real time, 0 (default) is as fast as possible")
+    parser.add_argument("--realtime",
+                        dest='speed',
+                        action='store_const',
+                        const=1.0,
+                        help="Replay in real time")
+    parser.add_argument("--compress",
+                        metavar="RUNFILE",
+                        default=None,
+                        help="Convert the raw capture to a run file (.srle) instead of replaying")
+    parser.add_argument("--jitter",
+                        type=int,
+                        default=rle.JITTER,
+                        help="Run timing tolerance in ns for --compress, 0 for an exact round trip")
+    parser.add_argument("--since",
+                        type=float,
+                        default=None,
+                        help="Start at this time (seconds since the epoch)")
+    parser.add_argument("--database", "--db",
+                        default="replay.db",
+                        help="File name for the database, default replay.db")
+    parser.add_argument("--dblevel",
+                        default="detail",
+                        help="Recording level for the database, default detail")
+    parser.add_argument("--timeout",
+                        default=None,
+                        help="Idle timeout for receptions")
+    parser.add_argument("--logfile",
+                        default=None,
+                        help="Log file name")
+    parser.add_argument("--debug", "-d",
+                        action='store_true',
+                        help="Debugging flag")
+
+    args = parser.parse_args()
+
+    logging.basicConfig(filename=args.logfile,
+                        level=logging.DEBUG if args.debug else logging.WARNING)
+
+    if args.compress:
+        rle.compress_capture(args.capture, args.compress, jitter=args.jitter)
+        return
+
+    config = configparser.ConfigParser()
+    config['monitor'] = {'database': args.database,
+                         'dblevel': args.dblevel,
+                         'titleupdate': 'false'}
+    if args.timeout is not None:
+        config['monitor']['timeout'] = args.timeout
+
+    replay = Replay(config['monitor'], speed=args.speed)
+    replay.run(capture_lines(args.capture, since=args.since))
+    print(replay.report())
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,404 @@
+"""
+Report - Historical analytics over the Reception table, with NumPy.
+
+`Source <src/scanmon.report.html>`__
+
+The detail Reception rows (dblevel=detail) are read in start order through a
+cursor, :data:`CHUNK` rows at a time, into compact arrays: start in local ms
+(int64), duration in ms (int32) and a channel id (int32) that SQLite assigns by
+joining a temporary table of the distinct System-Group-Channels. Each chunk is
+folded into fixed size accumulators with vectorized operations, so memory does
+not grow with the years of rows:
+
+* busy hour heatmap: receptions and airtime in each hour of the week
+* airtime, receptions and duty cycle of each channel
+* inter-arrival distribution of each channel and of all receptions, in log
+  spaced bins from 0.1 s to about 36 days
+* transition matrix: how often a reception on one channel starts within
+  ``--gap`` seconds of the end of one on another, "who talks after whom".
+  Dense up to :data:`DENSE` channels, otherwise only the pairs seen are kept.
+
+The last start of each channel and the last reception are carried from one
+chunk to the next so the results are the same as for one big array.
+
+Run with ``python3 -m scanmon.report`` (or the ``scanmon-report`` script);
+``--npz`` saves the arrays for further analysis.
+"""
+
+import argparse
+import configparser
+import logging
+import sqlite3
+import sys
+import time
+from datetime import datetime, timedelta
+
+try:
+    import numpy as np
+    AVAILABLE = True
+except ImportError:     # The report needs NumPy
+    np = None
+    AVAILABLE = False
+
+CHUNK = 65536       # Rows read at a time
+GAP = 60.0          # Seconds from the end of a reception for the next to follow it
+DENSE = 2048        # Most channels for a dense transition matrix (16 MiB)
+IA_BINS = 75        # Inter-arrival bins ...
+IA_LOW = -1.0       # ... from 10**IA_LOW ...
+IA_HIGH = 6.5       # ... to 10**IA_HIGH seconds
+
+_HOUR_MS = 3600 * 1000
+_DAY_MS = 24 * _HOUR_MS
+_DAYS = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+_SHADES = ' .:-=+*#%@'
+_EPOCH = datetime(1970, 1, 1)   # Of the local ms
+
+# Local time in ms since the epoch, the Starttime as stored is naive local time
+_START_MS = 'CAST(round((julianday(r."Starttime") - 2440587.5) * 86400000.0) AS INTEGER)'
+
+class Report(object):
+    """Analytics accumulated over chunks of Receptions.
+
+    Args:
+        channels ([(system, group, channel), ...]): The channels by id
+        gap (float): Seconds from the end of a reception for the next to follow it
+    """
+
+    def __init__(self, channels, gap=GAP):
+        if not AVAILABLE:
+            raise RuntimeError("NumPy is needed for the report")
+
+        count = len(channels)
+        self.channels = channels
+        self.gap_ms = int(gap * 1000)
+        self.rows = 0
+        self.first_ms = None
+        self.last_ms = None
+        self.receptions = np.zeros(count, dtype=np.int64)
+        self.airtime = np.zeros(count, dtype=np.int64)         # ms
+        self.slot_receptions = np.zeros(7 * 24, dtype=np.int64)
+        self.slot_airtime = np.zeros(7 * 24, dtype=np.int64)
+        self.ia_edges = np.logspace(IA_LOW, IA_HIGH, IA_BINS + 1) * 1000.0     # ms
+        self.ia_channel = np.zeros((count, IA_BINS), dtype=np.int32)
+        self.ia_all = np.zeros(IA_BINS, dtype=np.int64)
+        self.last_start = np.full(count, -1, dtype=np.int64)   # Carried between chunks
+        self.previous = None        # (start, end, channel) of the last reception
+        if count <= DENSE:
+            self.transitions = np.zeros((count, count), dtype=np.int32)
+        else:
+            self.transitions = {}   # (from, to) to count
+
+    def add(self, start, duration, channel):
+        """Fold a chunk in.
+
+        Args:
+            start (ndarray int64): Local start ms, in order, continuing the last chunk
+            duration (ndarray int32): Duration ms
+            channel (ndarray int32): Channel ids
+        """
+
+        if not len(start):
+            return
+        self.rows += len(start)
+        if self.first_ms is None:
+            self.first_ms = int(start[0])
+        self.last_ms = int(start[-1] + duration[-1])
+
+        self.receptions += np.bincount(channel, minlength=len(self.receptions))
+        self.airtime += np.bincount(channel, weights=duration, minlength=len(self.airtime)).astype(np.int64)
+
+        # 1970-01-01 was a Thursday, day 3 of a Monday based week
+        slot = ((start // _DAY_MS + 3) % 7) * 24 + (start // _HOUR_MS) % 24
+        self.slot_receptions += np.bincount(slot, minlength=7 * 24)
+        self.slot_airtime += np.bincount(slot, weights=duration, minlength=7 * 24).astype(np.int64)
+
+        self._interarrival(start, channel)
+        self._transitions(start, duration, channel)
+
+    def _bins(self, intervals):
+        """Inter-arrival bin of each interval (ms), clipped to the bins
+        """
+
+        return np.clip(np.searchsorted(self.ia_edges, intervals, side='right') - 1, 0, IA_BINS - 1)
+
+    def _interarrival(self, start, channel):
+        """Intervals between receptions, of each channel and of all
+        """
+
+        if self.previous is not None:
+            overall = np.diff(start, prepend=self.previous[0])
+        else:
+            overall = np.diff(start)
+        self.ia_all += np.bincount(self._bins(overall), minlength=IA_BINS)
+
+        order = np.lexsort((start, channel))        # By channel, then start
+        chans = channel[order]
+        starts = start[order]
+        first = np.flatnonzero(np.diff(chans, prepend=-1))     # First of each channel in the chunk
+        last = np.append(first[1:] - 1, len(chans) - 1)
+
+        intervals = np.diff(starts)
+        same = chans[1:] == chans[:-1]
+        ids = [chans[1:][same]]
+        gaps = [intervals[same]]
+        carried = self.last_start[chans[first]]
+        known = carried >= 0
+        ids.append(chans[first][known])
+        gaps.append(starts[first][known] - carried[known])
+        self.last_start[chans[last]] = starts[last]
+
+        ids = np.concatenate(ids).astype(np.int64)
+        bins = self._bins(np.concatenate(gaps))
+        self.ia_channel += np.bincount(ids * IA_BINS + bins, minlength=self.ia_channel.size).reshape(
+            self.ia_channel.shape).astype(np.int32)
+
+    def _transitions(self, start, duration, channel):
+        """Count each reception starting within the gap after the previous one ended
+        """
+
+        end = start + duration
+        if self.previous is not None:
+            (prev_start, prev_end, prev_chan) = self.previous
+            start_all = np.append(prev_start, start)
+            end_all = np.append(prev_end, end)
+            chan_all = np.append(prev_chan, channel)
+        else:
+            (start_all, end_all, chan_all) = (start, end, channel)
+        self.previous = (int(start[-1]), int(end[-1]), int(channel[-1]))
+
+        follows = start_all[1:] - end_all[:-1] <= self.gap_ms
+        codes = chan_all[:-1][follows].astype(np.int64) * len(self.channels) + chan_all[1:][follows]
+        (codes, counts) = np.unique(codes, return_counts=True)
+        if isinstance(self.transitions, dict):
+            for (code, number) in zip(codes.tolist(), counts.tolist()):
+                key = divmod(code, len(self.channels))
+                self.transitions[key] = self.transitions.get(key, 0) + number
+        else:
+            self.transitions.flat[codes] += counts.astype(np.int32)
+
+    def span_ms(self):
+        """Milliseconds from the first start to the last end
+        """
+
+        return (self.last_ms - self.first_ms) if self.rows else 0
+
+    def slot_hours(self):
+        """Hours of the span falling in each hour of the week
+        """
+
+        hours = np.arange(self.first_ms // _HOUR_MS, self.last_ms // _HOUR_MS + 1, dtype=np.int64)
+        return np.bincount(((hours // 24 + 3) % 7) * 24 + hours % 24, minlength=7 * 24)
+
+    def percentile(self, histogram, fraction):
+        """Interval in seconds under which *fraction* of a histogram is, the bin's geometric middle
+        """
+
+        total = histogram.sum()
+        if not total:
+            return None
+        index = int(np.searchsorted(np.cumsum(histogram), fraction * total))
+        return float(np.sqrt(self.ia_edges[index] * self.ia_edges[index + 1])) / 1000.0
+
+    def top_transitions(self, count):
+        """The most frequent (from, to, number) between different channels, ties by id
+        """
+
+        if isinstance(self.transitions, dict):
+            pairs = ((source, target, number) for ((source, target), number) in self.transitions.items())
+        else:
+            (sources, targets) = np.nonzero(self.transitions)
+            pairs = zip(sources.tolist(), targets.tolist(), self.transitions[sources, targets].tolist())
+        return sorted((pair for pair in pairs if pair[0] != pair[1]),
+                      key=lambda pair: (-pair[2], pair[0], pair[1]))[:count]
+
+    def save(self, path):
+        """Save the arrays with numpy.savez_compressed.
+        """
+
+        arrays = {'channels': np.array(['-'.join(key) for key in self.channels]),
+                  'receptions': self.receptions,
+                  'airtime_ms': self.airtime,
+                  'slot_receptions': self.slot_receptions.reshape(7, 24),
+                  'slot_airtime_ms': self.slot_airtime.reshape(7, 24),
+                  'slot_hours': self.slot_hours().reshape(7, 24),
+                  'ia_edges_ms': self.ia_edges,
+                  'ia_channel': self.ia_channel,
+                  'ia_all': self.ia_all,
+                  'span_ms': np.array(self.span_ms())}
+        if isinstance(self.transitions, dict):
+            pairs = np.array(sorted(self.transitions), dtype=np.int32).reshape(-1, 2)
+            arrays['transition_pairs'] = pairs
+            arrays['transition_counts'] = np.array([self.transitions[tuple(pair)] for pair in pairs.tolist()],
+                                                   dtype=np.int64)
+        else:
+            arrays['transitions'] = self.transitions
+        np.savez_compressed(path, **arrays)
+
+    def lines(self, top=15):
+        """The report as text lines.
+        """
+
+        if not self.rows:
+            return ["No detail receptions in the range, they need dblevel=detail"]
+
+        span = self.span_ms()
+        out = ["{} receptions on {} channels, {:%Y-%m-%d %H:%M} to {:%Y-%m-%d %H:%M} ({:.1f} days)".format(
+            self.rows, int(np.count_nonzero(self.receptions)),
+            _EPOCH + timedelta(milliseconds=self.first_ms), _EPOCH + timedelta(milliseconds=self.last_ms),
+            span / _DAY_MS)]
+        out.append("Airtime {:.1f} h, duty cycle {:.2%}".format(
+            self.airtime.sum() / _HOUR_MS, self.airtime.sum() / max(span, 1)))
+
+        out.append('')
+        hours = self.slot_hours()
+        duty = self.slot_airtime / np.maximum(hours * _HOUR_MS, 1)
+        peak = duty.max()
+        out.append("Busy hours (duty cycle, '@' is {:.1%})".format(peak))
+        out.append("    " + ''.join('{:>2d} '.format(hour) for hour in range(0, 24)))
+        shades = np.minimum((duty / (peak or 1.0) * (len(_SHADES) - 1)).round().astype(int), len(_SHADES) - 1)
+        for (day, name) in enumerate(_DAYS):
+            out.append("{}  ".format(name) + ''.join(' {} '.format(_SHADES[shade])
+                                                      for shade in shades[day * 24:(day + 1) * 24]))
+        busiest = np.argsort(self.slot_receptions / np.maximum(hours, 1))[::-1][:3]
+        out.append("Busiest: " + ', '.join("{} {:02d}:00 {:.1f}/h".format(
+            _DAYS[slot // 24], slot % 24, self.slot_receptions[slot] / max(hours[slot], 1)) for slot in busiest))
+
+        out.append('')
+        out.append("{:<48s} {:>8s} {:>9s} {:>7s} {:>9s} {:>9s}".format(
+            'Channel (by airtime)', 'Recept', 'Airtime h', 'Duty', 'IA med s', 'IA p90 s'))
+        for chan in np.argsort(self.airtime)[::-1][:top]:
+            if not self.receptions[chan]:
+                break
+            median = self.percentile(self.ia_channel[chan], 0.5)
+            p90 = self.percentile(self.ia_channel[chan], 0.9)
+            out.append("{:<48.48s} {:>8d} {:>9.2f} {:>7.2%} {:>9s} {:>9s}".format(
+                '-'.join(self.channels[chan]), int(self.receptions[chan]), self.airtime[chan] / _HOUR_MS,
+                self.airtime[chan] / max(span, 1),
+                '{:.0f}'.format(median) if median is not None else '-',
+                '{:.0f}'.format(p90) if p90 is not None else '-'))
+
+        out.append('')
+        out.append("Inter-arrival, all channels: median {:.1f} s, p90 {:.1f} s, p99 {:.1f} s".format(
+            *(self.percentile(self.ia_all, fraction) or 0.0 for fraction in (0.5, 0.9, 0.99))))
+
+        out.append('')
+        out.append("Follows within {:.0f} s (from -> to)".format(self.gap_ms / 1000.0))
+        for (source, target, number) in self.top_transitions(top):
+            out.append("{:>8d}  {} -> {}".format(number, '-'.join(self.channels[source]),
+                                                '-'.join(self.channels[target])))
+        return out
+
+def _where(since, until, system):
+    """WHERE clause and parameters of the report queries
+    """
+
+    terms = ['1']
+    params = {}
+    if since is not None:
+        terms.append('r."Starttime" >= :since')
+        params['since'] = since
+    if until is not None:
+        terms.append('r."Starttime" < :until')
+        params['until'] = until
+    if system is not None:
+        terms.append('r."System" = :system')
+        params['system'] = system
+    return (' AND '.join(terms), params)
+
+def build(dbconn, since=None, until=None, system=None, gap=GAP, chunk=CHUNK):
+    """Read the Receptions in chunks and build the Report.
+
+    Args:
+        dbconn (sqlite3.Connection): The monitor database
+        since, until (datetime): Optional start time range
+        system (str): Optional exact System name
+        gap (float): Seconds for a transition
+        chunk (int): Rows read at a time
+
+    Returns:
+        Report
+    """
+
+    (where, params) = _where(since, until, system)
+    dbconn.execute('DROP TABLE IF EXISTS temp."ReportChannel"')
+    dbconn.execute('CREATE TEMP TABLE "ReportChannel" AS SELECT DISTINCT r."System", r."Group", r."Channel" '
+                   'FROM "Reception" r WHERE {}'.format(where), params)
+    dbconn.execute('CREATE UNIQUE INDEX temp."ReportChannelKey" ON "ReportChannel" ("System", "Group", "Channel")')
+    channels = [(str(row[0]), str(row[1]), str(row[2])) for row in dbconn.execute(
+        'SELECT "System", "Group", "Channel" FROM temp."ReportChannel" ORDER BY rowid')]
+
+    report = Report(channels, gap)
+    dtype = np.dtype([('start', np.int64), ('duration', np.int32), ('channel', np.int32)])
+    cursor = dbconn.execute(
+        'SELECT {start}, COALESCE(r."DurationMs", r."Duration" * 1000, 0), c.rowid - 1 '
+        'FROM "Reception" r JOIN temp."ReportChannel" c USING ("System", "Group", "Channel") '
+        'WHERE {where} ORDER BY r."Starttime"'.format(start=_START_MS, where=where), params)
+    while True:
+        rows = cursor.fetchmany(chunk)
+        if not rows:
+            break
+        block = np.array(rows, dtype=dtype)
+        del rows
+        report.add(block['start'], block['duration'], block['channel'])
+
+    dbconn.execute('DROP TABLE temp."ReportChannel"')
+    return report
+
+def _when(text):
+    """A --since/--until argument, YYYY-MM-DD[ HH:MM]
+    """
+
+    for fmt in ('%Y-%m-%d %H:%M', '%Y-%m-%d'):
+        try:
+            return datetime.strptime(text, fmt)
+        except ValueError:
+            pass
+    raise argparse.ArgumentTypeError("not YYYY-MM-DD[ HH:MM]: {}".format(text))
+
+def main():
+    """Parse the arguments and print the report.
+    """
+
+    parser = argparse.ArgumentParser(description="Reception history report", prog="scanmon-report")
+    parser.add_argument("--config", "-C",
+                        default="config.ini",
+                        help="Configuration file for the database, default config.ini")
+    parser.add_argument("--database", "--db",
+                        default=None,
+                        help="Monitor database, default from the configuration or scanmon.db")
+    parser.add_argument("--since", type=_when, default=None, help="First start, YYYY-MM-DD[ HH:MM]")
+    parser.add_argument("--until", type=_when, default=None, help="Start before, YYYY-MM-DD[ HH:MM]")
+    parser.add_argument("--system", default=None, help="Only this System")
+    parser.add_argument("--top", type=int, default=15, help="Channels and transitions listed, default 15")
+    parser.add_argument("--gap", type=float, default=GAP,
+                        help="Seconds after a reception for the next to follow it, default {:.0f}".format(GAP))
+    parser.add_argument("--chunk", type=int, default=CHUNK, help="Rows read at a time, default {}".format(CHUNK))
+    parser.add_argument("--npz", default=None, help="Also save the arrays to this .npz file")
+    parser.add_argument("--debug", "-d", action='store_true', help="Debugging flag")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.DEBUG if args.debug else logging.WARNING)
+    if not AVAILABLE:
+        print("scanmon-report needs NumPy")
+        return 1
+
+    config = configparser.ConfigParser()
+    config.read(args.config)
+    database = args.database or config.get('monitor', 'database', fallback='scanmon.db')
+    try:
+        dbconn = sqlite3.connect('file:{}?mode=ro'.format(database), uri=True)
+        began = time.perf_counter()
+        report = build(dbconn, args.since, args.until, args.system, args.gap, args.chunk)
+    except sqlite3.Error as err:
+        print("{}: {}".format(database, err))
+        return 1
+
+    for line in report.lines(args.top):
+        print(line)
+    logging.getLogger(__name__).info("%d rows in %.2f s", report.rows, time.perf_counter() - began)
+    if args.npz:
+        report.save(args.npz)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
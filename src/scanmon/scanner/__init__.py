@@ -9,12 +9,15 @@ Scanner -- Defines data and control structures to control
 import serial
 import io
 import os
+import select
 import sys
 import stat
 import termios
 import copy
 import codecs
 import logging
+import time
+from datetime import datetime
 from logging import DEBUG as LDEBUG, \
                     INFO as LINFO, \
                     WARNING as LWARNING, \
@@ -24,6 +27,7 @@ from threading import RLock
 from collections import UserDict
 
 from .formatter import Response
+from .capture import RX, TX
 
 # Internal constants
 _ENCERRORS = 'ques'
@@ -32,6 +36,7 @@ _NEWLINE = b'\r'
 _TIMEOUT = 0.1
 _BAUDRATE = 115200
 _DEVS = ("/dev/ttyUSB0", "/dev/ttyUSB1")
+_LOGGER = logging.getLogger(__name__)
 
 def _decodeerror(decodeerror):
     """Simple static decoder error routine to simply replace errors with a '?'."""
@@ -114,6 +119,30 @@ class ResponseQueue(UserDict):
         del key # Unused
         return set()
 
+    def dispatch(self, response):
+        """Call the callbacks watching this response.
+
+        The '*' watchers are called if nobody watches the response command.
+        Callbacks returning True are removed.
+
+        Args:
+            response (Response): The decoded scanner response
+        """
+
+        clist = self[response.CMD]
+
+        if len(clist) == 0:
+            clist = self['*']       # Use default if there is one registered
+
+        debug = _LOGGER.isEnabledFor(logging.DEBUG)
+        for entry in clist.copy():
+            if debug:
+                _LOGGER.debug("Callback: %r", entry)
+            if entry.callback(entry, response):
+                if debug:
+                    _LOGGER.debug("Removing callback: %r", entry)
+                clist.remove(entry)
+
 class Command(object):
     """
     Comand -- A command send request with an option callback
@@ -188,9 +217,13 @@ class Scanner(object):
             This is usually ``/dev/ttyUSB0`` or ``/dev/ttyUSB1``.
             The class will attempt to use one or the other
             if the device is not indicated.
+        batch: Optional. If True commands are queued by send_command and only
+            written by flush_commands. Default False, write each command immediately.
+        wake: Optional. In batch mode, called by the sending thread when a command
+            is queued and nothing was waiting, so the owner can arrange a flush.
     """
 
-    def __init__(self, device=None):
+    def __init__(self, device=None, batch=False, wake=None):
         """Initialize the class instance.
 
         Arguments:
@@ -232,6 +265,10 @@ class Scanner(object):
 
         self._response_queue = ResponseQueue()
         self._read_buffer = b''
+        self._write_buffer = bytearray()
+        self.batch = batch
+        self._wake = wake
+        self.capture = None     # Optional CaptureWriter, tees all traffic
 
     @property
     def fileno(self):
@@ -266,61 +303,102 @@ class Scanner(object):
         if self._serscanner:
             self._serscanner.close()
 
+        if self.capture:
+            self.capture.close()
+
     def read_scanner(self):
         """Read available input from the scanner.
 
         If a complete line is found then perform any callbacks if found.
         """
 
-        self.__logger.debug('Reading')
+        debug = self.__logger.isEnabledFor(logging.DEBUG)
+        if debug:
+            self.__logger.debug('Reading')
 
         while self._serscanner.inWaiting() > 0:
             self._read_buffer += self._serscanner.read(self._serscanner.inWaiting())
-            self.__logger.debug('Scanner sent: %r', self._read_buffer)
+            if debug:
+                self.__logger.debug('Scanner sent: %r', self._read_buffer)
+
+        # Every line of this read gets the same times, taken once
+        mono_ns = time.monotonic_ns()
+        wall = datetime.now()
 
         while _NEWLINE in self._read_buffer:
             (read_line, _, self._read_buffer) = self._read_buffer.partition(b'\r')
+            if self.capture:
+                self.capture.write(RX, read_line, mono_ns)
             read_line = read_line.decode(encoding='utf-8', errors='ignore')
-            self.__logger.debug('Read scanner: %r', read_line)
-            response = Response(read_line)
-            clist = self._response_queue[response.CMD]
-
-            if len(clist) == 0:
-                clist = self._response_queue['*']       # Use default if there is one registered
+            if debug:
+                self.__logger.debug('Read scanner: %r', read_line)
+            response = Response(read_line, timestamp=wall, mono_ms=mono_ns // 1000000)
+            self._response_queue.dispatch(response)
 
-            for entry in clist.copy():
-                self.__logger.debug("Callback: %r", entry)
-                if entry.callback(entry, response):
-                    self.__logger.debug("Removing callback: %r", entry)
-                    clist.remove(entry)
+    def _queueline(self, line):
+        """Queue a line for the scanner.
 
-    def _writeline(self, line):
-        """Write a line to the scanner.
-
-        Note that this is a blocking write but there should be no reason for it to block.
+        The line is added to the output buffer with its '\\r' terminator. Nothing is
+        written until :meth:`flush_commands` is called.
 
         Args:
             line (str): line to write to the scanner
+
+        Returns:
+            bool: True if nothing was waiting to be written
+        """
+
+        if self.__logger.isEnabledFor(logging.DEBUG):
+            self.__logger.debug("Sending to scanner: %s", line)
+        raw_line = bytes(line, 'UTF-8', 'ignore')
+        with self.iolock:
+            if self.capture:
+                self.capture.write(TX, raw_line)
+            first = not self._write_buffer
+            self._write_buffer += raw_line
+            self._write_buffer += _NEWLINE
+        return first
+
+    def flush_commands(self):
+        """Write all queued commands to the scanner.
+
+        Everything queued since the last flush is sent with a single ``os.write``.
+        Anything the device would not accept remains queued for the next flush.
+
+        Returns:
+            int: The number of bytes still waiting to be sent
         """
 
-        self.__logger.debug("Sending to scanner: %s", line)
         with self.iolock:
-            self._serscanner.write(bytes(line, 'UTF-8', 'ignore'))
-            # Send the '\r' newline
-            self._serscanner.write(_NEWLINE)
-            # And flush all output completely
-            self._serscanner.flushOutput()
+            if self._write_buffer:
+                try:
+                    sent = os.write(self.fileno, self._write_buffer)
+                except BlockingIOError:
+                    sent = 0
+                del self._write_buffer[:sent]
+
+            return len(self._write_buffer)
 
     def send_command(self, cmdline):
         """Send one command, queue the callback if supplied to the response queue
 
+        Without batch mode the command is written before this returns. In batch
+        mode the command is only queued, the owner of the Scanner
+        must call :meth:`flush_commands` (usually once per main loop iteration)
+        and is told through *wake* when a command is waiting.
+
         Args:
             cmdline (Command): instance of Command containing command and callback
         """
 
         if isinstance(cmdline, Command):
             self.watch_command(cmdline)
-            with self.iolock:
-                self._writeline(cmdline.cmdstring)
+            first = self._queueline(cmdline.cmdstring)
+            if not self.batch:
+                # Blocking, as a write to the port was before batching
+                while self.flush_commands():
+                    select.select([], [self.fileno], [])
+            elif first and self._wake:
+                self._wake()
         else:
             raise ValueError('command takes a Command argument')
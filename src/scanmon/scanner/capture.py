@@ -0,0 +1,277 @@
+"""Raw serial capture files.
+
+`Source <src/scanmon.scanner.capture.html>`__
+
+A capture is a series of segment files, ``<prefix>.<seq>.scap``, each with a
+companion time index ``<prefix>.<seq>.sidx``. Segments are append only and a new
+one is started when the current segment reaches the size limit.
+
+Segment layout (all little endian):
+
+* Header: magic ``SCAP``, version (H), reserved (H), wall clock anchor ns (q),
+  monotonic anchor ns (q)
+* Records: length (I), monotonic ns (q), direction (B), scanner id (H), then
+  *length* raw bytes
+
+The index holds one fixed size entry (minute number (q), offset (Q)) for the first
+record of every wall clock minute present in the segment so a reader can bisect to
+any minute without scanning.
+"""
+
+import bisect
+import glob
+import logging
+import mmap
+import os
+import re
+import struct
+import time
+
+# Record directions
+RX = 0      # From the scanner
+TX = 1      # To the scanner
+
+MAGIC = b'SCAP'
+VERSION = 1
+SUFFIX = '.scap'
+INDEXSUFFIX = '.sidx'
+MAXSIZE = 64 * 1024 * 1024    # Default segment size
+
+_HEADER = struct.Struct('<4sHHqq')
+_RECORD = struct.Struct('<IqBH')
+_INDEX = struct.Struct('<qQ')
+_NS_MINUTE = 60 * 1000000000
+
+class CaptureError(ValueError):
+    """A capture file is invalid or damaged.
+    """
+
+def segments(prefix, suffix=SUFFIX):
+    """List the segment file names for *prefix* in sequence order.
+    """
+
+    pattern = re.compile(re.escape(prefix) + r'\.(\d+)' + re.escape(suffix) + '$')
+    found = []
+    for name in glob.glob(glob.escape(prefix) + '.*' + suffix):
+        match = pattern.match(name)
+        if match:
+            found.append((int(match.group(1)), name))
+
+    return [name for (_, name) in sorted(found)]
+
+class CaptureWriter(object):
+    """Append records to a capture, rotating segments by size.
+
+    Args:
+        prefix (str): Path prefix for the segment files
+        scanner_id (int): Identifies the scanner in every record, default 0
+        maxsize (int): Segment size limit in bytes
+    """
+
+    def __init__(self, prefix, scanner_id=0, maxsize=MAXSIZE):
+        self.__logger = logging.getLogger(__name__).getChild(type(self).__name__)
+        self.prefix = prefix
+        self.scanner_id = int(scanner_id)
+        self.maxsize = int(maxsize)
+        self._file = None
+        self._index = None
+        self._size = 0
+        self._mono_anchor = 0
+        self._wall_anchor = 0
+        self._last_minute = None
+
+        os.makedirs(os.path.dirname(prefix) or os.curdir, exist_ok=True)
+        existing = segments(prefix)
+        if existing:
+            self._seq = int(existing[-1][len(prefix) + 1:-len(SUFFIX)])
+        else:
+            self._seq = 0
+
+        self._open_segment()
+
+    @property
+    def filename(self):
+        """The current segment file name
+        """
+
+        return '{}.{:06d}{}'.format(self.prefix, self._seq, SUFFIX)
+
+    def _open_segment(self):
+        """Start a new segment file and index.
+        """
+
+        self._seq += 1
+        name = self.filename
+        self.__logger.info("Capturing to: %s", name)
+        self._mono_anchor = time.monotonic_ns()
+        self._wall_anchor = time.time_ns()
+        self._file = open(name, 'xb')
+        self._index = open(name[:-len(SUFFIX)] + INDEXSUFFIX, 'xb')
+        self._file.write(_HEADER.pack(MAGIC, VERSION, 0, self._wall_anchor, self._mono_anchor))
+        self._size = _HEADER.size
+        self._last_minute = None
+
+    def write(self, direction, data, mono_ns=None):
+        """Append one record.
+
+        Args:
+            direction (int): RX or TX
+            data (bytes): The raw line
+            mono_ns (int): Optional monotonic timestamp, default now
+        """
+
+        if self._file is None:
+            return
+
+        if mono_ns is None:
+            mono_ns = time.monotonic_ns()
+
+        if self._size >= self.maxsize:
+            self.close()
+            self._open_segment()
+
+        minute = (self._wall_anchor + mono_ns - self._mono_anchor) // _NS_MINUTE
+        if minute != self._last_minute:
+            self._index.write(_INDEX.pack(minute, self._size))
+            self._last_minute = minute
+
+        self._file.write(_RECORD.pack(len(data), mono_ns, direction, self.scanner_id))
+        self._file.write(data)
+        self._size += _RECORD.size + len(data)
+
+    def flush(self):
+        """Flush buffered records to the segment files.
+        """
+
+        if self._file is not None:
+            self._file.flush()
+            self._index.flush()
+
+    def close(self):
+        """Close the current segment.
+        """
+
+        if self._file is not None:
+            self._file.close()
+            self._index.close()
+            self._file = None
+            self._index = None
+
+class CaptureRecord(object):
+    """One captured record.
+
+    Attributes:
+        mono_ns (int): Monotonic timestamp in ns
+        wall_ns (int): Wall clock time in ns since the epoch
+        direction (int): RX or TX
+        scanner_id (int): Scanner identifier
+        data (memoryview): The raw bytes, a view into the mapped segment, copy
+            it to keep it after the segment is read
+    """
+
+    __slots__ = ('mono_ns', 'wall_ns', 'direction', 'scanner_id', 'data')
+
+    def __init__(self, mono_ns, wall_ns, direction, scanner_id, data):
+        self.mono_ns = mono_ns
+        self.wall_ns = wall_ns
+        self.direction = direction
+        self.scanner_id = scanner_id
+        self.data = data
+
+    def __repr__(self):
+        return "CaptureRecord(mono_ns={}, direction={}, scanner_id={}, data={!r})". \
+            format(self.mono_ns, self.direction, self.scanner_id, bytes(self.data))
+
+class CaptureSegment(object):
+    """Read one segment file through mmap.
+
+    Args:
+        filename (str): The segment file name
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, 'rb') as segfile:
+            # A crash just after rotating leaves an empty segment, which mmap refuses
+            if os.fstat(segfile.fileno()).st_size < _HEADER.size:
+                raise CaptureError("Capture segment too short: {}".format(filename))
+            self._map = mmap.mmap(segfile.fileno(), 0, access=mmap.ACCESS_READ)
+
+        (magic, version, _, self.wall_anchor, self.mono_anchor) = _HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise CaptureError("Not a capture segment: {}".format(filename))
+
+        self._minutes = []
+        self._offsets = []
+        indexname = filename[:-len(SUFFIX)] + INDEXSUFFIX
+        if os.path.exists(indexname):
+            with open(indexname, 'rb') as indexfile:
+                raw = indexfile.read()
+            for (minute, offset) in _INDEX.iter_unpack(raw[:len(raw) - len(raw) % _INDEX.size]):
+                self._minutes.append(minute)
+                self._offsets.append(offset)
+
+    def offset_for(self, wall_ns):
+        """File offset of the first indexed record at or after the minute holding *wall_ns*.
+        """
+
+        pos = bisect.bisect_left(self._minutes, wall_ns // _NS_MINUTE)
+        if pos < len(self._offsets):
+            return self._offsets[pos]
+
+        return len(self._map)
+
+    def records(self, offset=None):
+        """Iterate the records from *offset* (default the first record).
+
+        A truncated record at the end (a segment still being written) ends the iteration.
+        """
+
+        buf = memoryview(self._map)
+        offset = _HEADER.size if offset is None else offset
+        end = len(buf)
+
+        while offset + _RECORD.size <= end:
+            (length, mono_ns, direction, scanner_id) = _RECORD.unpack_from(buf, offset)
+            start = offset + _RECORD.size
+            if start + length > end:
+                break
+            yield CaptureRecord(mono_ns, self.wall_anchor + mono_ns - self.mono_anchor,
+                                direction, scanner_id, buf[start:start + length])
+            offset = start + length
+
+    def close(self):
+        """Release the mapping. If record views are still held it is released
+        when the last one goes.
+        """
+
+        try:
+            self._map.close()
+        except BufferError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def read_capture(prefix, since=None):
+    """Iterate all records of a capture in order.
+
+    Args:
+        prefix (str): Path prefix for the segment files
+        since (float): Optional wall clock time (seconds since the epoch).
+            Reading starts at the indexed minute holding this time.
+    """
+
+    since_ns = None if since is None else int(since * 1000000000)
+
+    for name in segments(prefix):
+        if os.path.getsize(name) == 0:
+            logging.getLogger(__name__).warning("Skipping empty capture segment: %s", name)
+            continue
+        with CaptureSegment(name) as segment:
+            offset = None if since_ns is None else segment.offset_for(since_ns)
+            yield from segment.records(offset)
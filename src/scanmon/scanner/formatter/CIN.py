@@ -0,0 +1,21 @@
+"""CIN command response, one conventional channel of the scanner's programming
+
+`Source <src/scanmon.scanner.formatter.CIN.html>`__
+"""
+
+# This list is the names of the response values. Usually taken from the Complete Reference manual
+# FRQ is in units of 100 Hz, -1 is no index.
+
+VARLIST = ('CMD', 'NAME', 'FRQ', 'MOD', 'CTCSS_DCS', 'TLOCK', 'LOUT', 'PRI', 'ATT',
+           'ALT', 'ALTL', 'REV_INDEX', 'FWD_INDEX', 'SYS_INDEX', 'GRP_INDEX', 'RSV',
+           'AUDIO_TYPE', 'P25NAC', 'NUMBER_TAG', 'ALT_COLOR', 'ALT_PATTERN', 'VOL_OFFSET')
+
+def display(response):
+    """Format a string to use as a generic display for the response."""
+    try:
+        return ('Chan={NAME}, '
+                'Freq={FRQ}, '
+                'Mod={MOD}, '
+                'C/D={CTCSS_DCS}').format_map(response.__dict__)
+    except KeyError:
+        return '*[' + response.response + ']*'
@@ -0,0 +1,20 @@
+"""GIN command response, one group of the scanner's programming
+
+`Source <src/scanmon.scanner.formatter.GIN.html>`__
+"""
+
+# This list is the names of the response values. Usually taken from the Complete Reference manual
+# GRP_TYPE is C for a channel group and T for a talkgroup (TGID) group, -1 is no index.
+
+VARLIST = ('CMD', 'GRP_TYPE', 'NAME', 'QUICK_KEY', 'LOUT',
+           'REV_INDEX', 'FWD_INDEX', 'SYS_INDEX', 'CHN_HEAD', 'CHN_TAIL', 'SEQ_NO',
+           'LATITUDE', 'LONGITUDE', 'RANGE', 'GPS_ENABLE')
+
+def display(response):
+    """Format a string to use as a generic display for the response."""
+    try:
+        return ('Group={NAME}, '
+                'Type={GRP_TYPE}, '
+                'Lockout={LOUT}').format_map(response.__dict__)
+    except KeyError:
+        return '*[' + response.response + ']*'
@@ -0,0 +1,18 @@
+"""Handle the PWR response
+
+`Source <src/scanmon.scanner.formatter.PWR.html>`__
+"""
+
+# RSSI is 0 to 1023, FRQ is the frequency in units of 100 Hz
+
+VARLIST = ('CMD', 'RSSI', 'FRQ')
+
+def display(response):
+    """Formats the response for generic display.
+    """
+
+    try:
+        return ('RSSI={RSSI}, '
+                'Freq={FRQ}').format_map(response.__dict__)
+    except KeyError:
+        return '*[' + response.response + ']*'
@@ -0,0 +1,12 @@
+"""SIH command response, the first system in the scanner's memory
+
+`Source <src/scanmon.scanner.formatter.SIH.html>`__
+"""
+
+# SYS_INDEX is -1 when no system is programmed
+
+VARLIST = ('CMD', 'SYS_INDEX')
+
+def display(response):
+    """Format a string to use as a generic display for the response."""
+    return 'First system {}'.format(response.SYS_INDEX)
@@ -0,0 +1,22 @@
+"""SIN command response, one system of the scanner's programming
+
+`Source <src/scanmon.scanner.formatter.SIN.html>`__
+"""
+
+# This list is the names of the response values. Usually taken from the Complete Reference manual
+# The indexes link the systems into a list and point to the system's groups, -1 is none.
+
+VARLIST = ('CMD', 'SYS_TYPE', 'NAME', 'QUICK_KEY', 'HLD', 'LOUT', 'DLY',
+           'RSV', 'RSV', 'RSV', 'RSV', 'RSV',
+           'REV_INDEX', 'FWD_INDEX', 'CHN_GRP_HEAD', 'CHN_GRP_TAIL', 'SEQ_NO', 'START_KEY',
+           'RSV', 'RSV', 'RSV', 'RSV', 'RSV',
+           'NUMBER_TAG', 'AGC_ANALOG', 'AGC_DIGITAL', 'P25WAITING', 'PROTECT', 'RSV')
+
+def display(response):
+    """Format a string to use as a generic display for the response."""
+    try:
+        return ('System={NAME}, '
+                'Type={SYS_TYPE}, '
+                'Lockout={LOUT}').format_map(response.__dict__)
+    except KeyError:
+        return '*[' + response.response + ']*'
@@ -13,29 +13,45 @@ _VARLIST = ('CMD',
             'L6_CHAR', 'L6_MODE',
             'L7_CHAR', 'L7_MODE',
             'L8_CHAR', 'L8_MODE',
-            'SQL', 'MUT', 'RSV', 'BAT', 'WAT', 'SIG_LVL', 'BK_COLOR', 'BK_DIMMER')
+            'SQL', 'MUT', 'BAT', 'RSV', 'RSV1', 'WAT', 'SIG_LVL', 'BK_COLOR', 'BK_DIMMER')
 
 # Note: L1 through L8 exist to the extent of len(DSP_FORM)
 _DSP_FORM_INDEX = _VARLIST.index('DSP_FORM')
 _SQL_INDX = _VARLIST.index('SQL')
 
+# The varlist for each DSP_FORM length, a scanner only uses a few
+_LAYOUTS = {}
+
+def _layout(lines):
+    """The varlist for a display of *lines* lines
+    """
+
+    varlist = _LAYOUTS.get(lines)
+    if varlist is None:
+        varlist = list(_VARLIST[:])   # Make a mutable copy
+        del varlist[1 +
+                    _DSP_FORM_INDEX +
+                    lines * 2:
+                    _SQL_INDX]  # Remove the unused Lines
+        varlist = _LAYOUTS[lines] = tuple(varlist)
+
+    return varlist
+
 def decode(response):
     """Decode the STS response
 
     Note that the DSP_FORM has one character for each line of the display. The L\\ *n* CHAR
     and MODE lines correspond. Unused CHAR and MODE lines do not exist in the response and
     must be removed from VARLIST in order to properly associate the data.
+    The varlist is worked out once for each DSP_FORM length.
     """
 
-    varlist = list(_VARLIST[:])   # Make a mutable copy
-    del varlist[1 +
-                _DSP_FORM_INDEX +
-                len(response.parts[_DSP_FORM_INDEX]) * 2:
-                _SQL_INDX]  # Remove the unused Lines
     # Note that we can't use response.DSP_FORM because we haven't created it yet! We do that next.
-    for i, val in enumerate(response.parts):
-        var = varlist[i] if i < len(varlist) else 'VAR'
-        setattr(response, var, val)
+    varlist = _layout(len(response.parts[_DSP_FORM_INDEX]))
+    parts = response.parts
+    response.__dict__.update(zip(varlist, parts))
+    if len(parts) > len(varlist):
+        response.VAR = parts[-1]
 
 # This seems overly complicated but it works.
 def display(response):
@@ -0,0 +1,19 @@
+"""TIN command response, one talkgroup of the scanner's programming
+
+`Source <src/scanmon.scanner.formatter.TIN.html>`__
+"""
+
+# This list is the names of the response values. Usually taken from the Complete Reference manual
+# -1 is no index.
+
+VARLIST = ('CMD', 'NAME', 'TGID', 'LOUT', 'PRI', 'ALT', 'ALTL',
+           'REV_INDEX', 'FWD_INDEX', 'SYS_INDEX', 'GRP_INDEX', 'RSV',
+           'AUDIO_TYPE', 'NUMBER_TAG', 'ALT_COLOR', 'ALT_PATTERN', 'VOL_OFFSET')
+
+def display(response):
+    """Format a string to use as a generic display for the response."""
+    try:
+        return ('Chan={NAME}, '
+                'TGID={TGID}').format_map(response.__dict__)
+    except KeyError:
+        return '*[' + response.response + ']*'
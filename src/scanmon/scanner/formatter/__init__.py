@@ -5,6 +5,8 @@
 
 import sys
 import logging
+import time
+from collections import OrderedDict
 from datetime import datetime as DateTime
 from importlib import import_module
 
@@ -12,6 +14,43 @@ class ScannerDecodeError(TypeError):
     """A generic error for decoders to use.
     """
 
+# Names assigned by gendecode for (VARLIST, number of parts)
+_LAYOUTS = {}
+
+# Decoder module of each command that has one
+_HANDLERS = {}
+# Commands without a decoder, least recently seen first. Garbled lines make up
+# many, so only the last _MAXMISSING are remembered.
+_MISSING = OrderedDict()
+_MAXMISSING = 64
+
+def _layout(response):
+    """The names gendecode gives the parts of the response.
+
+    The names only depend on the VARLIST and the number of parts, so they are
+    worked out once, exactly as assigning them one at a time would.
+    """
+
+    key = (response.VARLIST, len(response.parts))
+    names = _LAYOUTS.get(key)
+    if names is None:
+        taken = {name for name in dir(response)
+                 if name == name.upper() and getattr(response, name) is not None}
+        names = []
+        for i in range(len(response.parts)):
+            var = response.VARLIST[i] if i < len(response.VARLIST) else 'VAR'
+            if var in taken:
+                incr = 1
+                while var + str(incr) in taken:
+                    incr += 1
+                var = var + str(incr)
+            taken.add(var)
+            names.append(var)
+
+        names = _LAYOUTS[key] = tuple(names)
+
+    return names
+
 def gendecode(response):
     """Generalized decoder. Disassemble using the supplied or default VARLIST.
 
@@ -20,15 +59,35 @@ def gendecode(response):
         to make them unique.
     """
 
-    for i, val in enumerate(response.parts):
-        var = response.VARLIST[i] if i < len(response.VARLIST) else 'VAR'
-        if hasattr(response, var) and getattr(response, var) is not None:
-            incr = 1
-            while getattr(response, var + str(incr)) is not None:
-                incr += 1
-            var = var + str(incr)
+    response.__dict__.update(zip(_layout(response), response.parts))
+
+def _handler(cmd):
+    """The decoder module for a command, None if there is none.
+    """
 
-        setattr(response, var, val)
+    try:
+        return _HANDLERS[cmd]
+    except KeyError:
+        pass
+
+    if cmd in _MISSING:
+        _MISSING.move_to_end(cmd)
+        return None
+
+    try:
+        if not cmd.isidentifier():
+            raise ImportError(cmd)
+        handler = import_module('.' + cmd, package=__name__)
+    except ImportError:            # In case there is no handler my that name ...
+        # Note: we do not have an instance logger because we are short lived
+        logging.warning('Missing decoder for %r', cmd)
+        _MISSING[cmd] = None
+        if len(_MISSING) > _MAXMISSING:
+            _MISSING.popitem(last=False)
+        return None
+
+    _HANDLERS[cmd] = handler
+    return handler
 
 def gendisplay(response):
     """Generalized display. Just assemble the parts.
@@ -86,11 +145,13 @@ class Response(object):
     DECODEERROR = 'DECODEERROR'
     RESP = 'RESP'
 
-    def __init__(self, response):
+    def __init__(self, response, timestamp=None, mono_ms=None):
         """Initialize the instance, load a specific format if available.
 
         Arguments:
             response: The returned string from the scanner
+            timestamp: Optional datetime of the response, default now
+            mono_ms: Optional monotonic time of the response in ms, default now
 
         """
 
@@ -99,7 +160,8 @@ class Response(object):
         self.CMD = '?'
         self.response = response
         self.parts = tuple()
-        self.TIME = DateTime.now()
+        self.TIME = DateTime.now() if timestamp is None else timestamp
+        self.MONO_MS = time.monotonic_ns() // 1000000 if mono_ms is None else mono_ms
         self.display = gendisplay
         self.VARLIST = ('CMD',)     # Default variable list
 
@@ -122,8 +184,8 @@ class Response(object):
                 self.status = Response.RESP
                 decode = gendecode      # Set a generic decode as fallback
 
-                try:
-                    handler = import_module('.' + self.CMD, package=__name__)
+                handler = _handler(self.CMD)
+                if handler is not None:
                     if hasattr(handler, 'decode'):
                         decode = handler.decode         # Use a specific decoder
                     elif hasattr(handler, 'VARLIST'):
@@ -131,9 +193,6 @@ class Response(object):
 
                     if hasattr(handler, 'display'):
                         self.display = handler.display
-                except ImportError:            # In case there is no handler my that name ...
-                    # Note: we do not have an instance logger because we are short lived
-                    logging.warning('Missing decoder for %s', self.CMD)
 
                 decode(self)
                 # We are done ...
@@ -146,7 +205,24 @@ class Response(object):
             self.CMD = ''
             self.status = Response.DECODEERROR
 
-        self.__logger.debug("New Response: %r", self)
+        if self.__logger.isEnabledFor(logging.DEBUG):
+            self.__logger.debug("New Response: %r", self)
+
+    def retime(self, timestamp, mono_ms=None):
+        """Make a copy of this response with a new TIME and MONO_MS.
+
+        Much cheaper than decoding the same line again.
+
+        Args:
+            timestamp: datetime of the copy
+            mono_ms: monotonic time of the copy in ms, default now
+        """
+
+        copy = object.__new__(type(self))
+        copy.__dict__.update(self.__dict__)
+        copy.TIME = timestamp
+        copy.MONO_MS = time.monotonic_ns() // 1000000 if mono_ms is None else mono_ms
+        return copy
 
     def __str__(self):
         """Return whatever was set during initialization."""
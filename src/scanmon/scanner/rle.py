@@ -0,0 +1,290 @@
+"""Run length encoded capture files.
+
+`Source <src/scanmon.scanner.rle.html>`__
+
+Most of the GLG poll stream is the same idle response over and over. A run file keeps
+each stream of consecutive identical lines as one run: line, first time, last time and
+count. The streams are kept per scanner id, direction and command, so a poll of GLG and
+STS in turn is two streams that each repeat, not one that alternates.
+
+Expansion spaces the records of a run evenly between the first and last time. A record
+only joins a run if it lands within *jitter* ns of that spacing, so with ``jitter=0``
+the round trip is exact and with the default it is exact for every line, count and run
+boundary and within a few ms for the times inside a run.
+
+File layout (all little endian):
+
+* Header: magic ``SRLE``, version (H), reserved (H), wall clock anchor ns (q),
+  monotonic anchor ns (q)
+* Runs: length (I), first monotonic ns (q), last monotonic ns (q), count (I),
+  direction (B), scanner id (H), then *length* raw bytes
+
+Runs are written as they close so they are ordered by their last record.
+"""
+
+import heapq
+import itertools
+import logging
+import os
+import struct
+import time
+
+from .capture import CaptureError, CaptureRecord, read_capture, segments
+
+MAGIC = b'SRLE'
+VERSION = 1
+SUFFIX = '.srle'
+JITTER = 20000000               # 20 ms
+MAXSPAN = 3600 * 1000000000     # Close runs after an hour so little is lost on a crash
+MAXRUNS = 64                    # Open runs, garbled lines can make up new commands
+
+_HEADER = struct.Struct('<4sHHqq')
+_RUN = struct.Struct('<IqqIBH')
+
+class Run(object):
+    """One run of identical records.
+
+    Attributes:
+        data (bytes): The raw line
+        first_ns (int): Monotonic time of the first record
+        last_ns (int): Monotonic time of the last record
+        count (int): Number of records
+        direction (int): RX or TX
+        scanner_id (int): Scanner identifier
+    """
+
+    __slots__ = ('data', 'first_ns', 'last_ns', 'count', 'direction', 'scanner_id')
+
+    def __init__(self, data, first_ns, last_ns, count, direction, scanner_id):
+        self.data = data
+        self.first_ns = first_ns
+        self.last_ns = last_ns
+        self.count = count
+        self.direction = direction
+        self.scanner_id = scanner_id
+
+    def times(self):
+        """The monotonic time of every record in the run.
+        """
+
+        if self.count == 1:
+            return [self.first_ns]
+
+        span = self.last_ns - self.first_ns
+        last = self.count - 1
+        return [self.first_ns + span * i // last for i in range(self.count)]
+
+    def accepts(self, data, mono_ns, jitter):
+        """True if a record with *data* at *mono_ns* extends this run.
+        """
+
+        if data != self.data:
+            return False
+
+        if self.count == 1:
+            return True
+
+        interval = (self.last_ns - self.first_ns) // (self.count - 1)
+        return abs(mono_ns - (self.last_ns + interval)) <= jitter
+
+    def __repr__(self):
+        return "Run({!r}, first_ns={}, last_ns={}, count={})". \
+            format(self.data, self.first_ns, self.last_ns, self.count)
+
+class RunWriter(object):
+    """Write a run length encoded capture. Drop in replacement for CaptureWriter.
+
+    Every writer starts a new file, ``<prefix>.<seq>.srle``.
+
+    Args:
+        prefix (str): Path prefix for the run files
+        scanner_id (int): Identifies the scanner in every run, default 0
+        jitter (int): Timing tolerance in ns for a record to join a run
+        maxspan (int): Longest run in ns before it is written out
+    """
+
+    def __init__(self, prefix, scanner_id=0, jitter=JITTER, maxspan=MAXSPAN):
+        self.__logger = logging.getLogger(__name__).getChild(type(self).__name__)
+        self.scanner_id = int(scanner_id)
+        self.jitter = int(jitter)
+        self.maxspan = int(maxspan)
+        self._runs = {}     # Open run for each direction and command
+
+        os.makedirs(os.path.dirname(prefix) or os.curdir, exist_ok=True)
+        existing = segments(prefix, SUFFIX)
+        seq = int(existing[-1][len(prefix) + 1:-len(SUFFIX)]) if existing else 0
+        self.filename = '{}.{:06d}{}'.format(prefix, seq + 1, SUFFIX)
+        self.__logger.info("Capturing runs to: %s", self.filename)
+        self._file = open(self.filename, 'xb')
+        self._file.write(_HEADER.pack(MAGIC, VERSION, 0, time.time_ns(), time.monotonic_ns()))
+
+    def write(self, direction, data, mono_ns=None):
+        """Add one record.
+
+        Args:
+            direction (int): RX or TX
+            data (bytes): The raw line
+            mono_ns (int): Optional monotonic timestamp, default now
+        """
+
+        if self._file is None:
+            return
+
+        if mono_ns is None:
+            mono_ns = time.monotonic_ns()
+
+        key = _key(direction, data)
+        run = self._runs.get(key)
+        if run is not None:
+            if run.accepts(data, mono_ns, self.jitter) and mono_ns - run.first_ns <= self.maxspan:
+                run.last_ns = mono_ns
+                run.count += 1
+                return
+
+            _write(self._file, run)
+
+        self._runs[key] = Run(bytes(data), mono_ns, mono_ns, 1, direction, self.scanner_id)
+        _limit(self._file, self._runs)
+
+    def flush(self):
+        """Flush the closed runs to the file.
+        """
+
+        if self._file is not None:
+            self._file.flush()
+
+    def close(self):
+        """Write the open runs and close the file.
+        """
+
+        if self._file is not None:
+            for run in sorted(self._runs.values(), key=lambda r: r.last_ns):
+                _write(self._file, run)
+            self._runs = {}
+            self._file.close()
+            self._file = None
+
+def _key(direction, data):
+    """The stream a record belongs to, its direction and command
+    """
+
+    return (direction, bytes(data[:8]).split(b',', 1)[0].strip())
+
+def _limit(runfile, runs):
+    """Write out the least recent open run when there are too many
+    """
+
+    if len(runs) > MAXRUNS:
+        key = min(runs, key=lambda k: runs[k].last_ns)
+        _write(runfile, runs.pop(key))
+
+def _write(runfile, run):
+    """Write one closed run to an open file
+    """
+
+    runfile.write(_RUN.pack(len(run.data), run.first_ns, run.last_ns,
+                            run.count, run.direction, run.scanner_id))
+    runfile.write(run.data)
+
+def _read_header(runfile, filename):
+    """Read and check the file header.
+    """
+
+    header = runfile.read(_HEADER.size)
+    if len(header) < _HEADER.size:
+        raise CaptureError("Run file too short: {}".format(filename))
+
+    fields = _HEADER.unpack(header)
+    if fields[0] != MAGIC or fields[1] != VERSION:
+        raise CaptureError("Not a run file: {}".format(filename))
+
+    return fields
+
+def read_runs(filename):
+    """Read the runs in a run file, ordered by their first record.
+
+    Returns:
+        (wall_anchor, mono_anchor, [Run, ...])
+    """
+
+    runs = []
+    with open(filename, 'rb') as runfile:
+        (_, _, _, wall_anchor, mono_anchor) = _read_header(runfile, filename)
+        while True:
+            head = runfile.read(_RUN.size)
+            if len(head) < _RUN.size:
+                break
+            (length, first_ns, last_ns, count, direction, scanner_id) = _RUN.unpack(head)
+            data = runfile.read(length)
+            if len(data) < length:
+                break
+            runs.append(Run(data, first_ns, last_ns, count, direction, scanner_id))
+
+    runs.sort(key=lambda r: r.first_ns)
+    return (wall_anchor, mono_anchor, runs)
+
+def expand(filename):
+    """Iterate the records of a run file as CaptureRecords in time order.
+
+    Runs are expanded as their first record comes due so only the overlapping runs
+    (one per scanner, direction and command) are held at once.
+    """
+
+    (wall_anchor, mono_anchor, runs) = read_runs(filename)
+    offset = wall_anchor - mono_anchor
+    order = itertools.count()
+    active = []     # (next time, order, times, index, run)
+
+    for run in itertools.chain(runs, (None,)):
+        while active and (run is None or active[0][0] <= run.first_ns):
+            (mono_ns, key, times, index, current) = active[0]
+            yield CaptureRecord(mono_ns, mono_ns + offset,
+                                current.direction, current.scanner_id, current.data)
+            index += 1
+            if index < len(times):
+                heapq.heapreplace(active, (times[index], key, times, index, current))
+            else:
+                heapq.heappop(active)
+
+        if run is not None:
+            times = run.times()
+            heapq.heappush(active, (times[0], next(order), times, 0, run))
+
+def compress_capture(prefix, filename, jitter=JITTER):
+    """Convert a raw capture into a run file.
+
+    Segments from different boots have unrelated monotonic clocks so every record
+    is placed on the time line of the first segment using its wall clock time.
+
+    Args:
+        prefix (str): Raw capture path prefix
+        filename (str): The new run file
+        jitter (int): Timing tolerance in ns, 0 for an exact round trip
+    """
+
+    runs = {}
+    offset = None
+
+    with open(filename, 'xb') as runfile:
+        for record in read_capture(prefix):
+            if offset is None:
+                offset = record.wall_ns - record.mono_ns
+                runfile.write(_HEADER.pack(MAGIC, VERSION, 0, record.wall_ns, record.mono_ns))
+
+            mono_ns = record.wall_ns - offset
+            data = bytes(record.data)
+            key = (record.scanner_id,) + _key(record.direction, data)
+            run = runs.get(key)
+            if run is not None:
+                if run.accepts(data, mono_ns, jitter):
+                    run.last_ns = mono_ns
+                    run.count += 1
+                    continue
+
+                _write(runfile, run)
+
+            runs[key] = Run(data, mono_ns, mono_ns, 1, record.direction, record.scanner_id)
+            _limit(runfile, runs)
+
+        for run in sorted(runs.values(), key=lambda r: r.last_ns):
+            _write(runfile, run)
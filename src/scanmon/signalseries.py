@@ -0,0 +1,206 @@
+"""
+Signalseries - Signal strength samples of a Reception, stored as one packed blob.
+
+`Source <src/scanmon.signalseries.html>`__
+
+While a Reception is active the monitor follows each GLG with a PWR (RSSI, 0 to
+1023) or STS (signal level, 0 to 5) poll. The samples are kept in a single
+``array('H')`` of (milliseconds since the previous sample, value) pairs, four
+bytes a sample, and written to the Reception row as a blob with its minimum,
+mean and maximum so the summaries can be queried without unpacking.
+
+The query functions here read those rows back.
+"""
+
+import sys
+from array import array
+from itertools import accumulate
+
+_MAXVALUE = 0xFFFF
+
+class SignalSeries(object):
+    """Signal strength samples of one Reception.
+
+    Args:
+        kind (str): The poll the samples came from, 'PWR' or 'STS'
+        samples (array): Optional. Packed (delta ms, value) pairs
+
+    Attributes:
+        kind (str): 'PWR' for RSSI or 'STS' for the signal level
+        samples (array('H')): (milliseconds since the previous sample, value) pairs,
+            the first delta is from the start of the Reception
+    """
+
+    __slots__ = ('kind', 'samples', '_last_ms')
+
+    def __init__(self, kind, samples=None):
+        self.kind = kind
+        self.samples = array('H') if samples is None else samples
+        self._last_ms = sum(self.samples[0::2])
+
+    def __len__(self):
+        return len(self.samples) // 2
+
+    def append(self, offset_ms, value):
+        """Add a sample.
+
+        Args:
+            offset_ms (int): Milliseconds since the start of the Reception
+            value (int): RSSI or signal level
+        """
+
+        delta = min(max(offset_ms - self._last_ms, 0), _MAXVALUE)
+        self._last_ms += delta
+        self.samples.append(delta)
+        self.samples.append(min(max(value, 0), _MAXVALUE))
+
+    @property
+    def values(self):
+        """The sample values
+        """
+
+        return self.samples[1::2]
+
+    @property
+    def offsets(self):
+        """Milliseconds from the start of the Reception of each sample
+        """
+
+        return list(accumulate(self.samples[0::2]))
+
+    @property
+    def min(self):
+        """Lowest value, None without samples
+        """
+
+        return min(self.values) if self.samples else None
+
+    @property
+    def max(self):
+        """Highest value, None without samples
+        """
+
+        return max(self.values) if self.samples else None
+
+    @property
+    def mean(self):
+        """Mean value, None without samples
+        """
+
+        return sum(self.values) / len(self) if self.samples else None
+
+    def columns(self):
+        """The Reception table columns for this series as named parameters
+        """
+
+        return {'signal_kind': self.kind,
+                'signal': self.to_blob(),
+                'signal_min': self.min,
+                'signal_mean': self.mean,
+                'signal_max': self.max}
+
+    def to_blob(self):
+        """The samples as little endian bytes
+        """
+
+        if sys.byteorder == 'little':
+            return self.samples.tobytes()
+
+        samples = array('H', self.samples)
+        samples.byteswap()
+        return samples.tobytes()
+
+    @classmethod
+    def from_blob(cls, kind, blob):
+        """Rebuild a series from :meth:`to_blob` bytes.
+        """
+
+        samples = array('H')
+        samples.frombytes(blob)
+        if sys.byteorder != 'little':
+            samples.byteswap()
+        return cls(kind, samples)
+
+NO_SIGNAL = {'signal_kind': None, 'signal': None,
+             'signal_min': None, 'signal_mean': None, 'signal_max': None}
+
+def _where(system, group, channel, since, until, kind):
+    """WHERE clause and parameters for the query functions
+    """
+
+    terms = ['"Signal" IS NOT NULL']
+    params = {}
+    for (column, name, value) in (('"System"', 'system', system),
+                                  ('"Group"', 'group', group),
+                                  ('"Channel"', 'channel', channel),
+                                  ('"SignalKind"', 'kind', kind)):
+        if value is not None:
+            terms.append('{} = :{}'.format(column, name))
+            params[name] = value
+    if since is not None:
+        terms.append('"Starttime" >= :since')
+        params['since'] = since
+    if until is not None:
+        terms.append('"Starttime" < :until')
+        params['until'] = until
+
+    return (' AND '.join(terms), params)
+
+def receptions(dbconn, system=None, group=None, channel=None, since=None, until=None,
+               kind=None, limit=100):
+    """Signal summaries of the stored Receptions, newest first.
+
+    Args:
+        dbconn (sqlite3.Connection): The monitor database
+        system, group, channel (str): Optional exact names
+        since, until (datetime): Optional start time range
+        kind (str): Optional 'PWR' or 'STS'
+        limit (int): Most rows returned
+
+    Returns:
+        [sqlite3.Row, ...] with rowid, Starttime, DurationMs, System, Group, Channel,
+        Frequency_TGID, SignalKind, Samples, SignalMin, SignalMean and SignalMax
+    """
+
+    (where, params) = _where(system, group, channel, since, until, kind)
+    params['limit'] = limit
+    return dbconn.execute(
+        'SELECT rowid, "Starttime", "DurationMs", "System", "Group", "Channel", '
+        '"Frequency_TGID", "SignalKind", length("Signal") / 4 AS "Samples", '
+        '"SignalMin", "SignalMean", "SignalMax" FROM "Reception" '
+        'WHERE {} ORDER BY "Starttime" DESC LIMIT :limit'.format(where), params).fetchall()
+
+def channels(dbconn, since=None, until=None, kind=None, limit=100):
+    """Signal summaries by channel, weakest mean first.
+
+    Args:
+        dbconn (sqlite3.Connection): The monitor database
+        since, until (datetime): Optional start time range
+        kind (str): Optional 'PWR' or 'STS', levels of both kinds do not compare
+        limit (int): Most rows returned
+
+    Returns:
+        [sqlite3.Row, ...] with System, Group, Channel, Frequency_TGID, SignalKind,
+        Receptions, SignalMin, SignalMean (of the Reception means) and SignalMax
+    """
+
+    (where, params) = _where(None, None, None, since, until, kind)
+    params['limit'] = limit
+    return dbconn.execute(
+        'SELECT "System", "Group", "Channel", "Frequency_TGID", "SignalKind", '
+        'count(*) AS "Receptions", min("SignalMin") AS "SignalMin", '
+        'avg("SignalMean") AS "SignalMean", max("SignalMax") AS "SignalMax" '
+        'FROM "Reception" WHERE {} '
+        'GROUP BY "System", "Group", "Channel", "Frequency_TGID", "SignalKind" '
+        'ORDER BY "SignalMean" LIMIT :limit'.format(where), params).fetchall()
+
+def series(dbconn, rowid):
+    """The SignalSeries of one stored Reception, None if it has none.
+    """
+
+    row = dbconn.execute('SELECT "SignalKind", "Signal" FROM "Reception" WHERE rowid = ?',
+                         (rowid,)).fetchone()
+    if row is None or row[1] is None:
+        return None
+
+    return SignalSeries.from_blob(row[0], row[1])
@@ -0,0 +1,144 @@
+"""
+Squelch - Voice activity from the audio energy, to refine reception edges.
+
+`Source <src/scanmon.squelch.html>`__
+
+GLG polls every half second so a Reception starts up to a poll late and ends up
+to a poll early. The audio tells exactly when the transmission was there: the
+stream (16 bit signed mono PCM) is cut into 20 ms frames and a frame is active
+when its energy is well above the noise floor. Each block from the stream is
+handled with a few NumPy operations, the per frame results are kept in a ring of
+arrays.
+
+:meth:`EnergySquelch.edges` finds the audio edges next to the GLG squelch
+transitions of a Reception.
+
+NumPy is optional, :data:`AVAILABLE` is False without it.
+"""
+
+import math
+
+try:
+    import numpy as np
+    AVAILABLE = True
+except ImportError:     # Refinement is off without NumPy
+    np = None
+    AVAILABLE = False
+
+RATE = 8000         # Samples/s
+FRAME = 0.02        # Seconds per frame
+THRESHOLD = 12.0    # dB above the noise floor for an active frame
+HISTORY = 600.0     # Seconds of frames kept
+FLOOR_FALL = 0.5    # Seconds for the noise floor to follow a quieter stream
+FLOOR_RISE = 60.0   # Seconds for the noise floor to follow a louder stream
+
+class EnergySquelch(object):
+    """Frame energy and activity of a PCM stream.
+
+    Args:
+        rate (int): Samples per second of the 16 bit mono stream
+        frame (float): Seconds per frame
+        threshold (float): dB above the noise floor for an active frame
+        history (float): Seconds of frames kept
+    """
+
+    def __init__(self, rate=RATE, frame=FRAME, threshold=THRESHOLD, history=HISTORY):
+        if not AVAILABLE:
+            raise RuntimeError("NumPy is needed for EnergySquelch")
+
+        self.frame_samples = max(int(rate * frame), 1)
+        self.frame = self.frame_samples / float(rate)
+        self.threshold = threshold
+        self.floor = None       # Noise floor in dB
+        capacity = int(history / self.frame)
+        self.times = np.zeros(capacity)                  # Frame end times
+        self.energy = np.zeros(capacity, dtype=np.float32)
+        self.active = np.zeros(capacity, dtype=bool)
+        self.count = 0          # Frames seen
+        self._partial = b''     # Bytes of an unfinished frame
+
+    def feed(self, pcm, arrival):
+        """Add a block of the stream.
+
+        Args:
+            pcm (bytes-like): 16 bit little endian mono samples, not kept
+            arrival (float): Time the end of the block arrived, seconds since the epoch
+        """
+
+        if self._partial:
+            pcm = self._partial + bytes(pcm)
+        frame_bytes = self.frame_samples * 2
+        frames = len(pcm) // frame_bytes
+        self._partial = bytes(pcm[frames * frame_bytes:])
+        if frames == 0:
+            return
+
+        samples = np.frombuffer(pcm, dtype='<i2', count=frames * self.frame_samples)
+        power = np.square(samples.reshape(frames, self.frame_samples), dtype=np.float32)
+        energy = 10.0 * np.log10(power.mean(axis=1) + 1.0)
+
+        # The floor follows the quiet frames, down quickly and up slowly so a long
+        # transmission does not raise it
+        quiet = float(np.percentile(energy, 10))
+        if self.floor is None:
+            self.floor = quiet
+        else:
+            tau = FLOOR_FALL if quiet < self.floor else FLOOR_RISE
+            self.floor += (quiet - self.floor) * (1.0 - math.exp(-frames * self.frame / tau))
+
+        end = arrival - len(self._partial) / 2 / self.frame_samples * self.frame
+        times = end - self.frame * np.arange(frames - 1, -1, -1)
+        self._store(times, energy, energy > self.floor + self.threshold)
+
+    def _store(self, times, energy, active):
+        """Add frames to the ring
+        """
+
+        capacity = len(self.times)
+        if len(times) > capacity:
+            (times, energy, active) = (times[-capacity:], energy[-capacity:], active[-capacity:])
+        index = (self.count + np.arange(len(times))) % capacity
+        self.times[index] = times
+        self.energy[index] = energy
+        self.active[index] = active
+        self.count += len(times)
+
+    def _window(self, first, last):
+        """Frame end times and activity between two times, in order
+        """
+
+        capacity = len(self.times)
+        held = min(self.count, capacity)
+        order = (self.count - held + np.arange(held)) % capacity
+        times = self.times[order]
+        low = np.searchsorted(times, first)
+        high = np.searchsorted(times, last, side='right')
+        return (times[low:high], self.active[order][low:high])
+
+    def edges(self, start, end, poll=0.5, slack=0.2):
+        """Refine the start and end of a reception.
+
+        The transmission began in the poll before *start* and ended in the poll
+        after *end*; the audio edges found there are returned.
+
+        Args:
+            start (float): First active GLG time
+            end (float): Last active GLG time
+            poll (float): Seconds between GLG polls
+            slack (float): Seconds of timing uncertainty added to each side
+
+        Returns:
+            (start, end) with either left as given when no edge is found
+        """
+
+        (times, active) = self._window(start - poll - slack, start + slack)
+        rises = np.flatnonzero(active[1:] & ~active[:-1]) + 1
+        if len(rises):
+            start = float(times[rises[0]] - self.frame)    # Beginning of the first active frame
+
+        (times, active) = self._window(end - slack, end + poll + slack)
+        falls = np.flatnonzero(active[:-1] & ~active[1:])
+        if len(falls):
+            end = float(times[falls[-1]])
+
+        return (start, end)
@@ -0,0 +1,419 @@
+# -*- coding: utf-8 -*-
+"""
+Synthetic scanner traffic for soak and scale testing.
+
+A statistical model of what the scanner hears, turned into the GLG (and STS and
+PWR) responses it would give to a steady poll:
+
+* Every channel has its own Poisson talk burst rate, a few busy channels and
+  many quiet ones. Burst lengths are log-normal.
+* The scanner stops on one transmission at a time, bursts that start and end
+  while it is busy are missed. After a burst the channel is held with the squelch
+  closed for the hang time.
+* Trunked systems retire talkgroups and bring new TGIDs on line (churn) so the
+  set of channels keeps growing, like a real system over weeks.
+* Errors are injected: garbled lines, NG answers, truncated lines and dropped polls.
+* Every channel is heard at its own signal strength, PWR and STS report it with
+  some noise while the squelch is open.
+
+The stream can be run straight through the replay engine, days of traffic in
+minutes, or answer the GLG, STS and PWR commands of the pty scanner emulator.
+
+Usage:
+    python3 trafficgen.py replay [--days N] ... Replay simulated traffic, report each hour
+    python3 trafficgen.py emulate [...]         Scanner emulator answering from the model
+"""
+
+import argparse
+import configparser
+import heapq
+import itertools
+import logging
+import os
+import random
+import resource
+import string
+import sys
+import time
+import zlib
+
+IDLE = 'GLG,,,,,,,,,,,,'
+GLG = 'GLG,{frq},{mod},0,{ctcss},{sys},{grp},{chan},{sql},0,{systag},{chantag},{nac}'
+STS = ('STS,011000,{sys:16.16s},,{grp:16.16s},,{chan:16.16s},,{frq:>16.16s},,'
+       'S0:12-*5*7*9-   ,,GRP----5-----   ,,{sql},0,0,0,0,0,{lvl},GREEN,1')
+PWR = 'PWR,{rssi},{frq:08d}'
+ERRORS = ('garbled', 'ng', 'truncated', 'drop')
+
+class ChannelModel(object):
+    """One channel or talkgroup.
+
+    Attributes:
+        system, group, channel (str): Names
+        frequency_tgid (str): Frequency or TGID
+        rate (float): Talk bursts per second
+        trunked (bool): A talkgroup of a trunked system
+        retired (bool): Dropped from its system by churn
+        level (int): Mean RSSI while receiving, 0 to 1023
+    """
+
+    __slots__ = ('system', 'group', 'channel', 'frequency_tgid', 'rate', 'trunked',
+                 'retired', 'level', '_lines')
+
+    def __init__(self, system, group, channel, frequency_tgid, rate, trunked=False):
+        self.system = system
+        self.group = group
+        self.channel = channel
+        self.frequency_tgid = frequency_tgid
+        self.rate = rate
+        self.trunked = trunked
+        self.retired = False
+        # From the name so the traffic of a seed does not change with it
+        self.level = 150 + zlib.crc32(channel.encode()) % 800
+        self._lines = {}
+
+    def line(self, squelch):
+        """The GLG response while on this channel
+        """
+
+        line = self._lines.get(squelch)
+        if line is None:
+            line = GLG.format(frq=self.frequency_tgid,
+                              mod='FM' if self.trunked else 'NFM',
+                              ctcss='0' if self.trunked else '12',
+                              sys=self.system, grp=self.group, chan=self.channel,
+                              sql='1' if squelch else '0',
+                              systag='NONE', chantag='NONE',
+                              nac='293' if self.trunked else 'NONE')
+            self._lines[squelch] = line
+        return line
+
+    def sts(self, squelch):
+        """The STS response while on this channel
+        """
+
+        return STS.format(sys=self.system, grp=self.group, chan=self.channel,
+                          frq=self.frequency_tgid, sql='1' if squelch else '0',
+                          lvl=self.level * 6 // 1024 if squelch else 0)
+
+class TrafficModel(object):
+    """Generate the responses to a steady GLG poll.
+
+    Args:
+        seed (int): Random seed, the same seed gives the same traffic
+        conventional (int): Conventional channels
+        systems (int): Trunked systems
+        talkgroups (int): Talkgroups in each trunked system
+        rate (float): Mean talk bursts per channel per hour
+        duration (float): Median talk burst length in seconds
+        churn (float): Talkgroups replaced per trunked system per hour
+        errors (float): Chance of an error in each response
+        hang (float): Seconds a channel is held after its burst
+        poll (float): Seconds between polls
+        start (float): Simulated start time, seconds since the epoch, default now
+    """
+
+    def __init__(self, seed=None, conventional=40, systems=2, talkgroups=60, rate=2.0,
+                 duration=4.0, churn=2.0, errors=0.001, hang=2.0, poll=0.5, start=None):
+        self.rand = random.Random(seed)
+        self.rate = rate
+        self.duration = duration
+        self.churn = churn / 3600.0
+        self.errors = errors
+        self.hang = hang
+        self.poll = poll
+        self.now = time.time() if start is None else start
+        self._noise = random.Random(seed)     # Signal noise, apart from the traffic
+        self._events = []       # (time, order, channel or system index)
+        self._order = itertools.count()
+        self._tgids = itertools.count(1001)
+        self._systems = []
+        self.channels = []
+
+        self._current = None    # (channel, end of burst)
+        self.bursts = 0
+        self.missed = 0
+        self.injected = dict.fromkeys(ERRORS, 0)
+
+        for i in range(conventional):
+            self._add(ChannelModel('County {}'.format(i % 3),
+                                   'Group {}'.format(i % 8),
+                                   'Channel {}'.format(i),
+                                   '{:09.4f}'.format(150.0 + i * 0.0125 + 300.0 * (i % 2)),
+                                   self._rate()))
+
+        for sysno in range(systems):
+            name = 'Trunk {}'.format(sysno)
+            self._systems.append([])
+            for _ in range(talkgroups):
+                self._add_talkgroup(sysno, name)
+            if self.churn > 0:
+                self._schedule(self.now + self.rand.expovariate(self.churn), sysno)
+
+    def _rate(self):
+        """A channel's burst rate per second, skewed so a few channels are busy
+        """
+
+        return self.rand.lognormvariate(0, 1.2) * self.rate / 3600.0 / 2.05    # 2.05 is the mean of the lognormal
+
+    def _schedule(self, when, what):
+        heapq.heappush(self._events, (when, next(self._order), what))
+
+    def _add(self, chan):
+        """Add a channel and schedule its first burst
+        """
+
+        self.channels.append(chan)
+        self._schedule(self.now + self.rand.expovariate(chan.rate), chan)
+
+    def _add_talkgroup(self, sysno, name):
+        """Bring a new TGID on line in a trunked system
+        """
+
+        tgid = next(self._tgids)
+        chan = ChannelModel(name, 'Group {}'.format(tgid % 10), 'TG {}'.format(tgid),
+                            str(tgid), self._rate(), trunked=True)
+        self._systems[sysno].append(chan)
+        self._add(chan)
+
+    def _churn(self, sysno):
+        """Retire a random talkgroup and add a new one
+        """
+
+        talkgroups = self._systems[sysno]
+        if talkgroups:
+            old = talkgroups.pop(self.rand.randrange(len(talkgroups)))
+            old.retired = True
+            self.channels.remove(old)
+            self._add_talkgroup(sysno, old.system)
+        self._schedule(self.now + self.rand.expovariate(self.churn), sysno)
+
+    def _advance(self):
+        """Run the events up to now, pick up a burst if the scanner is free
+        """
+
+        while self._events and self._events[0][0] <= self.now:
+            (when, _, what) = heapq.heappop(self._events)
+            if isinstance(what, int):
+                self._churn(what)
+                continue
+
+            if what.retired:
+                continue
+
+            self._schedule(when + self.rand.expovariate(what.rate), what)
+            end = when + self.rand.lognormvariate(0, 0.8) * self.duration
+            if end <= self.now or (self._current and self.now < self._current[1] + self.hang):
+                self.missed += 1        # Over before the poll, or the scanner was busy
+            else:
+                self._current = (what, end)
+                self.bursts += 1
+
+    def _error(self, line):
+        """Maybe replace a response with an error. None is a dropped response.
+        """
+
+        if self.errors <= 0 or self.rand.random() >= self.errors:
+            return line
+
+        kind = self.rand.choice(ERRORS)
+        self.injected[kind] += 1
+        if kind == 'garbled':
+            return ''.join(self.rand.choice(string.ascii_letters + string.digits + ' ')
+                           for _ in range(self.rand.randint(1, 40)))
+        if kind == 'ng':
+            return line.partition(',')[0] + ',NG'
+        if kind == 'truncated':
+            return line[:self.rand.randint(4, max(len(line) - 1, 4))]
+        return None
+
+    def state(self):
+        """The channel the scanner is on and the squelch, (None, False) when idle
+        """
+
+        if self._current:
+            (chan, end) = self._current
+            if self.now < end:
+                return (chan, True)
+            if self.now < end + self.hang:
+                return (chan, False)
+            self._current = None
+
+        return (None, False)
+
+    def glg(self):
+        """Advance one poll and answer a GLG, None for a dropped response
+        """
+
+        self.now += self.poll
+        self._advance()
+        (chan, squelch) = self.state()
+        return self._error(chan.line(squelch) if chan else IDLE)
+
+    def sts(self):
+        """Answer an STS at the current time
+        """
+
+        (chan, squelch) = self.state()
+        if chan is None:
+            return STS.format(sys='', grp='', chan='', frq='', sql='0', lvl=0)
+        return chan.sts(squelch)
+
+    def pwr(self):
+        """Answer a PWR at the current time
+        """
+
+        (chan, squelch) = self.state()
+        try:
+            frq = int(float(chan.frequency_tgid) * 10000) if chan and not chan.trunked else 0
+        except ValueError:
+            frq = 0
+        rssi = chan.level + self._noise.gauss(0, 25) if squelch else self._noise.uniform(0, 40)
+        return PWR.format(rssi=min(max(int(rssi), 0), 1023), frq=frq)
+
+    def lines(self, seconds, sts_every=0, pwr=False):
+        """The responses to *seconds* of polling as (timestamp, line) pairs.
+
+        Args:
+            seconds (float): Simulated time to run
+            sts_every (int): Add an STS response every N polls, 0 for none
+            pwr (bool): Follow each GLG with the squelch open by a PWR response,
+                as the monitor polls with signalpoll=pwr
+        """
+
+        end = self.now + seconds
+        polls = 0
+        while self.now < end:
+            line = self.glg()
+            if line is not None:
+                yield (self.now, line)
+                if pwr and self.state()[1]:
+                    yield (self.now, self.pwr())
+            polls += 1
+            if sts_every and polls % sts_every == 0:
+                yield (self.now, self.sts())
+
+    def responses(self):
+        """Responses for ScannerEmulator, GLG, STS and PWR are answered from the model
+        """
+
+        from scanemu import RESPONSES
+        responses = dict(RESPONSES)
+        responses['GLG'] = lambda _: self.glg() or ''
+        responses['STS'] = lambda _: self.sts()
+        responses['PWR'] = lambda _: self.pwr()
+        return responses
+
+def _model(args):
+    """Build the TrafficModel from the arguments
+    """
+
+    return TrafficModel(seed=args.seed,
+                        conventional=args.conventional,
+                        systems=args.systems,
+                        talkgroups=args.talkgroups,
+                        rate=args.rate,
+                        duration=args.duration,
+                        churn=args.churn,
+                        errors=args.errors,
+                        poll=args.poll)
+
+def _rss_mb():
+    """Peak resident set size in MB
+    """
+
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+def run_replay(args):
+    """Replay simulated traffic hour by hour, reporting throughput, memory and database size.
+    """
+
+    from scanmon.replay import Replay
+
+    config = configparser.ConfigParser()
+    config['monitor'] = {'database': args.database,
+                         'dblevel': args.dblevel,
+                         'signalpoll': 'pwr' if args.pwr else 'off',
+                         'titleupdate': 'false'}
+    model = _model(args)
+    replay = Replay(config['monitor'])
+
+    print("{:>5s} {:>9s} {:>10s} {:>9s} {:>8s} {:>8s} {:>8s}".format(
+        'hour', 'lines', 'lines/s', 'recept', 'chans', 'rss MB', 'db MB'))
+    started = False
+    for hour in range(int(args.days * 24)):
+        start = time.perf_counter()
+        lines = 0
+        for (timestamp, line) in model.lines(3600, sts_every=args.sts_every, pwr=args.pwr):
+            if not started:
+                replay.monwin.now = timestamp
+                replay.monitor.start()
+                started = True
+            replay.feed(line, timestamp)
+            lines += 1
+        elapsed = time.perf_counter() - start
+
+        if (hour + 1) % args.every == 0:
+            print("{:5d} {:9d} {:10.0f} {:9d} {:8d} {:8.1f} {:8.1f}".format(
+                hour + 1, lines, lines / elapsed, replay.monitor.reception_count,
+                len(replay.monitor.history.channels), _rss_mb(),
+                os.path.getsize(args.database) / 1e6 if os.path.exists(args.database) else 0))
+
+    replay.monitor.stop()
+    replay.monitor.close()
+    print("Bursts {} (missed {}), errors injected {}, undecodable {}".format(
+        model.bursts, model.missed, model.injected, replay.errors))
+
+def run_emulate(args):
+    """Run the scanner emulator answering GLG, STS and PWR from the model.
+    """
+
+    from scanemu import ScannerEmulator
+
+    model = _model(args)
+    emulator = ScannerEmulator(responses=model.responses())
+    emulator.start()
+    print("Scanner emulator on:", emulator.device)
+    try:
+        emulator.join()
+    except KeyboardInterrupt:
+        print("\nCommands answered: {}, bursts {} (missed {}), errors injected {}".format(
+            emulator.command_count, model.bursts, model.missed, model.injected))
+
+def main():
+    """Parse the arguments and run.
+    """
+
+    parser = argparse.ArgumentParser(description="Synthetic scanner traffic")
+    parser.add_argument("mode", choices=('replay', 'emulate'))
+    parser.add_argument("--seed", type=int, default=None, help="Random seed")
+    parser.add_argument("--conventional", type=int, default=40, help="Conventional channels")
+    parser.add_argument("--systems", type=int, default=2, help="Trunked systems")
+    parser.add_argument("--talkgroups", type=int, default=60, help="Talkgroups per system")
+    parser.add_argument("--rate", type=float, default=2.0,
+                        help="Mean talk bursts per channel per hour")
+    parser.add_argument("--duration", type=float, default=4.0,
+                        help="Median talk burst seconds")
+    parser.add_argument("--churn", type=float, default=2.0,
+                        help="Talkgroups replaced per system per hour")
+    parser.add_argument("--errors", type=float, default=0.001,
+                        help="Chance of an error in each response")
+    parser.add_argument("--poll", type=float, default=0.5, help="Seconds between polls")
+    parser.add_argument("--days", type=float, default=1.0, help="Simulated days for replay")
+    parser.add_argument("--every", type=int, default=1, help="Report every N hours")
+    parser.add_argument("--sts-every", dest='sts_every', type=int, default=0,
+                        help="Add an STS response every N polls for replay")
+    parser.add_argument("--pwr", action='store_true',
+                        help="Add a PWR response to each active poll for replay, signalpoll=pwr")
+    parser.add_argument("--database", "--db", default="trafficgen.db",
+                        help="Replay database, default trafficgen.db")
+    parser.add_argument("--dblevel", default="detail", help="Replay dblevel, default detail")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+    if args.mode == 'replay':
+        run_replay(args)
+    else:
+        run_emulate(args)
+
+if __name__ == '__main__':
+    sys.exit(main())